@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BibliothecaireConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bibliothecaire'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,74 @@
+"""
+Archiving of the loan and reservation history.
+
+Returned loans and ended reservations are moved from the live tables, which
+circulation reads and writes, to EmpruntArchive and ReservationArchive once
+they were returned or ended more than HISTORY_ARCHIVE_AFTER_DAYS ago. The
+live tables then only hold active and recent rows. The members' history pages
+show the archived rows on demand, with `?history=all`.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+from bibliothecaire.models import Emprunt, EmpruntArchive, Reservation, ReservationArchive
+
+# Live model, archive model, the condition of the rows that are finished and
+# the field holding the time they were finished
+ARCHIVES = [
+    (Emprunt, EmpruntArchive, Q(returned=True), 'returned_at'),
+    (Reservation, ReservationArchive, Q(reserved=False), 'ended_at'),
+]
+
+
+def move_rows(model, archive, pks, now):
+    """
+    Copy the rows of `model` with the given primary keys to `archive`, then
+    delete them, each with a single statement. The DELETE bypasses the
+    signals, which only matter to the catalogue.
+    """
+    using = router.db_for_write(model)
+    db = connections[using]
+    columns = ', '.join(db.ops.quote_name(field.column) for field in archive._meta.concrete_fields
+                        if field.name != 'archived_at')
+    placeholders = ', '.join(['%s'] * len(pks))
+    archived_at = archive._meta.get_field('archived_at').get_db_prep_save(now, db)
+    with transaction.atomic(using=using, savepoint=False), db.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {db.ops.quote_name(archive._meta.db_table)} ({columns}, archived_at) "
+            f"SELECT {columns}, %s FROM {db.ops.quote_name(model._meta.db_table)} WHERE id IN ({placeholders})",
+            [archived_at, *pks]
+        )
+        cursor.execute(f"DELETE FROM {db.ops.quote_name(model._meta.db_table)} WHERE id IN ({placeholders})", pks)
+
+
+def archive_rows(model, archive, finished, finished_at, cutoff, batch_size):
+    """
+    Move the rows of `model` finished before `cutoff`, one
+    transaction of at most `batch_size` rows at a time, so circulation never
+    waits long for the tables. Returns the number of moved rows.
+    """
+    moved = 0
+    while True:
+        with transaction.atomic():
+            pks = list(model.objects.filter(finished, **{f'{finished_at}__lt': cutoff})
+                       .values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return moved
+            move_rows(model, archive, pks, timezone.now())
+        moved += len(pks)
+
+
+def archive_history(days=None, batch_size=None):
+    """
+    Archive the loans returned and the reservations ended more than `days`
+    ago (HISTORY_ARCHIVE_AFTER_DAYS by default). Returns the number of moved
+    rows per model.
+    """
+    days = settings.HISTORY_ARCHIVE_AFTER_DAYS if days is None else days
+    batch_size = batch_size or settings.HISTORY_ARCHIVE_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(days=days)
+    return {model._meta.model_name: archive_rows(model, archive, finished, finished_at, cutoff, batch_size)
+            for model, archive, finished, finished_at in ARCHIVES}
@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import Exists, OuterRef
+
+BIBLIOTHECAIRES_GROUP = 'bibliothecaires'
+
+
+def is_bibliothecaire(user):
+    """
+    Whether the user belongs to the librarians group. The answer is loaded
+    with the user by LibrarianModelBackend, or queried once and memoized on
+    the user for the rest of the request.
+    """
+    if not user.is_authenticated:
+        return False
+    cached = getattr(user, '_is_bibliothecaire', None)
+    if cached is not None:
+        return cached
+
+    user._is_bibliothecaire = user.groups.filter(name=BIBLIOTHECAIRES_GROUP).exists()
+    return user._is_bibliothecaire
+
+
+class LibrarianModelBackend(ModelBackend):
+    """
+    ModelBackend whose get_user() loads the librarian-group membership in
+    the same query as the user. Nothing is cached between requests, so a
+    deactivated user, a new password or a membership change made by any
+    worker applies to the next request of every worker.
+    """
+
+    def get_user(self, user_id):
+        UserModel = get_user_model()
+        groups = UserModel.groups.through.objects.filter(user=OuterRef('pk'), group__name=BIBLIOTHECAIRES_GROUP)
+        user = (UserModel._default_manager.annotate(_is_bibliothecaire=Exists(groups))
+                .filter(pk=user_id).first())
+        return user if user is not None and self.user_can_authenticate(user) else None
@@ -0,0 +1,400 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import timedelta
+from typing import Callable, NamedTuple, Optional
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User, Group
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from bibliothecaire.auth import BIBLIOTHECAIRES_GROUP
+from bibliothecaire.models import Membre, Media, JeuDePlateau, Emprunt, Reservation
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+
+ROLES = {
+    'bibliothecaire': 'benchmark_bibliothecaire',
+    'membre': 'benchmark_membre',
+}
+
+# Results are reported as regressions when they exceed the baseline by more
+# than this ratio
+DEFAULT_THRESHOLD = 0.2
+
+# Latency a catalogue search must stay under, at the 95th percentile, with a
+# catalogue of a million items
+SEARCH_TARGET_MS = 50
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class Scenario(NamedTuple):
+    name: str
+    url: str
+    # Role of the logged-in user, or None for an anonymous client
+    role: Optional[str] = None
+    method: str = 'GET'
+    # Each callable receives the fixtures returned by benchmark_fixtures()
+    args: Callable = lambda fixtures: []
+    data: Callable = lambda fixtures: {}
+    status: int = 200
+    # Whether the request changes data and must be rolled back, which POST
+    # requests always are
+    writes: bool = False
+
+
+def loan_form(fixtures):
+    now = timezone.now()
+    return {
+        'member': fixtures['free_member_id'],
+        'media': fixtures['available_media_ids'][0],
+        'loan_date': now.strftime('%Y-%m-%d %H:%M'),
+        'return_date': (now + timedelta(days=14)).strftime('%Y-%m-%d %H:%M'),
+    }
+
+
+def batch_loan_form(fixtures):
+    data = loan_form(fixtures)
+    del data['media']
+    data['medias'] = fixtures['available_media_ids']
+    return data
+
+
+def reservation_form(fixtures):
+    now = timezone.now()
+    return {
+        'member': fixtures['free_member_id'],
+        'jeuDePlateau': fixtures['available_jeu_id'],
+        'reservation_time': now.strftime('%Y-%m-%d %H:%M'),
+        'reservation_end': (now + timedelta(hours=2)).strftime('%Y-%m-%d %H:%M'),
+    }
+
+
+def member_args(fixtures):
+    return [fixtures['member_id']]
+
+
+SCENARIOS = [
+    # Login flow
+    Scenario('main_home', 'main_home'),
+    Scenario('login_page', 'login'),
+    Scenario('login', 'login', method='POST', status=302,
+             data=lambda fixtures: {'username': ROLES['bibliothecaire'], 'password': BENCHMARK_PASSWORD}),
+    Scenario('logout', 'logout', role='bibliothecaire', method='POST', status=302),
+
+    # Librarian pages
+    Scenario('home', 'home', role='bibliothecaire'),
+    Scenario('list_members', 'list_members', role='bibliothecaire'),
+    Scenario('create_member_page', 'create_member', role='bibliothecaire'),
+    Scenario('create_member', 'create_member', role='bibliothecaire', method='POST', status=302,
+             data=lambda fixtures: {'name': 'Benchmark', 'email': 'benchmark.new@example.com'}),
+    Scenario('update_member_page', 'update_member', role='bibliothecaire', args=member_args),
+    Scenario('update_member', 'update_member', role='bibliothecaire', method='POST', status=302, args=member_args,
+             data=lambda fixtures: {'name': 'Benchmark', 'email': 'benchmark.updated@example.com'}),
+    Scenario('delete_member_page', 'delete_member', role='bibliothecaire', args=member_args),
+    Scenario('delete_member', 'delete_member', role='bibliothecaire', method='POST', status=302, args=member_args),
+    Scenario('list_media', 'list_media', role='bibliothecaire'),
+    Scenario('list_media_available_livre', 'list_media', role='bibliothecaire',
+             data=lambda fixtures: {'type': 'livre', 'available': '1'}),
+    Scenario('search_media', 'search_media', role='bibliothecaire',
+             data=lambda fixtures: {'q': fixtures['search_term']}),
+    Scenario('create_media_page', 'create_media', role='bibliothecaire'),
+    Scenario('create_media', 'create_media', role='bibliothecaire', method='POST', status=302,
+             data=lambda fixtures: {'media_type': 'livre', 'title': 'Benchmark', 'author': 'Benchmark',
+                                    'publication_date': '2024-01-01'}),
+    Scenario('create_loan_page', 'create_loan', role='bibliothecaire'),
+    Scenario('create_loan', 'create_loan', role='bibliothecaire', method='POST', status=302, data=loan_form),
+    Scenario('batch_checkout_page', 'batch_checkout', role='bibliothecaire'),
+    Scenario('batch_checkout', 'batch_checkout', role='bibliothecaire', method='POST', status=302,
+             data=batch_loan_form),
+    Scenario('batch_return', 'batch_return', role='bibliothecaire', method='POST', status=302,
+             args=lambda fixtures: [fixtures['loan_member_id']],
+             data=lambda fixtures: {'loan_ids': fixtures['active_loan_ids']}),
+    Scenario('manage_loans', 'manage_loans', role='bibliothecaire', args=member_args),
+    Scenario('manage_loans_by_returned', 'manage_loans', role='bibliothecaire', args=member_args,
+             data=lambda fixtures: {'sort_by': 'returned'}),
+    Scenario('overdue_loans', 'overdue_loans', role='bibliothecaire'),
+    Scenario('circulation_stats', 'circulation_stats', role='bibliothecaire'),
+    Scenario('return_loan', 'return_loan', role='bibliothecaire', status=302, writes=True,
+             args=lambda fixtures: [fixtures['active_loan_ids'][0]]),
+    Scenario('create_reservation_page', 'create_reservation', role='bibliothecaire'),
+    Scenario('create_reservation', 'create_reservation', role='bibliothecaire', method='POST', status=302,
+             data=reservation_form),
+    Scenario('manage_reservation', 'manage_reservation', role='bibliothecaire', args=member_args),
+    Scenario('end_reservation', 'end_reservation', role='bibliothecaire', status=302, writes=True,
+             args=lambda fixtures: [fixtures['reservation_id']]),
+    Scenario('list_exports', 'list_exports', role='bibliothecaire'),
+    Scenario('export_membre_csv', 'export_data', role='bibliothecaire', args=lambda fixtures: ['membre']),
+
+    # Public pages
+    Scenario('membre_list_media', 'membre_list_media', role='membre'),
+    Scenario('membre_list_media_dvd', 'membre_list_media', role='membre', data=lambda fixtures: {'type': 'dvd'}),
+    Scenario('membre_search', 'membre_search', role='membre', data=lambda fixtures: {'q': fixtures['search_term']}),
+    Scenario('membre_api_catalogue', 'membre_api_catalogue', role='membre'),
+    Scenario('membre_api_catalogue_fields', 'membre_api_catalogue', role='membre',
+             data=lambda fixtures: {'available': '1', 'fields': 'type,id,title'}),
+    Scenario('membre_api_catalogue_item', 'membre_api_catalogue_item', role='membre',
+             args=lambda fixtures: ['jeu', fixtures['available_jeu_id']]),
+]
+
+
+def benchmark_users():
+    """
+    Create (or reset) the accounts the benchmark logs in with.
+    """
+    group, _ = Group.objects.get_or_create(name=BIBLIOTHECAIRES_GROUP)
+    users = {}
+    for role, username in ROLES.items():
+        user, _ = User.objects.get_or_create(username=username)
+        user.set_password(BENCHMARK_PASSWORD)
+        user.save()
+        if role == 'bibliothecaire':
+            user.groups.add(group)
+        users[role] = user
+    return users
+
+
+def benchmark_fixtures():
+    """
+    Pick the rows the scenarios act on. The member is the one with the
+    longest loan history, so the member pages show their worst case.
+    """
+    busiest = (Emprunt.objects.values('member').annotate(loans=Count('id')).order_by('-loans').first())
+    free_member = Membre.objects.filter(active_loans=0, active_reservation=0, overdue_loans=0).order_by('pk').first()
+    member_with_loans = Membre.objects.filter(active_loans__gt=0).order_by('pk').first()
+    reservation = Reservation.objects.filter(reserved=True).order_by('reservation_end').first()
+    available_media_ids = list(Media.objects.filter(available=True).order_by('pk').values_list('pk', flat=True)[:3])
+    available_jeu = JeuDePlateau.objects.filter(available=True).order_by('pk').first()
+    title = Media.objects.order_by('pk').values_list('title', flat=True).first()
+
+    if not all([busiest, free_member, member_with_loans, reservation, available_media_ids, available_jeu, title]):
+        raise BenchmarkError("The database does not hold enough data to run the benchmarks, "
+                             "run the generate_dataset command first.")
+
+    return {
+        'member_id': busiest['member'],
+        'free_member_id': free_member.pk,
+        'loan_member_id': member_with_loans.pk,
+        'active_loan_ids': list(Emprunt.objects.filter(member=member_with_loans, returned=False)
+                                .values_list('pk', flat=True)),
+        'reservation_id': reservation.pk,
+        'available_media_ids': available_media_ids,
+        'available_jeu_id': available_jeu.pk,
+        'search_term': title.split()[0],
+    }
+
+
+def percentile(samples, ratio):
+    """
+    Nearest-rank percentile of a sorted list of samples.
+    """
+    index = max(int(round(ratio * len(samples) + 0.5)) - 1, 0)
+    return samples[min(index, len(samples) - 1)]
+
+
+def perform(client, scenario, fixtures):
+    url = reverse(scenario.url, args=scenario.args(fixtures))
+    data = scenario.data(fixtures)
+    send = client.get if scenario.method == 'GET' else client.post
+    if scenario.method == 'GET' and not scenario.writes:
+        response = send(url, data)
+    else:
+        # Writes are rolled back so every iteration sees the same data
+        with transaction.atomic():
+            response = send(url, data)
+            transaction.set_rollback(True)
+    if response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    return response, size
+
+
+def run_scenario(scenario, clients, users, fixtures, iterations, warmup=1):
+    """
+    Request one scenario `iterations` times and return its measurements.
+
+    Latencies come from plain requests. The query count and the peak memory
+    are measured on one more request, traced separately so the overhead of
+    tracemalloc and query capture does not skew the timings.
+    """
+    client = clients[scenario.role] if scenario.role else Client()
+
+    def request():
+        response, size = perform(client, scenario, fixtures)
+        if response.status_code != scenario.status:
+            raise BenchmarkError(f"{scenario.name}: expected status {scenario.status}, "
+                                 f"got {response.status_code}.")
+        return size
+
+    def reset():
+        # Logging out ends the session, log back in for the next request
+        if scenario.role and '_auth_user_id' not in client.session:
+            client.force_login(users[scenario.role])
+
+    for _ in range(warmup):
+        request()
+        reset()
+
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        request()
+        timings.append((time.perf_counter() - start) * 1000)
+        reset()
+
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            size = request()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    reset()
+
+    timings.sort()
+    return {
+        'iterations': iterations,
+        'p50_ms': round(percentile(timings, 0.5), 3),
+        'p90_ms': round(percentile(timings, 0.9), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'max_ms': round(timings[-1], 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'queries': len(queries),
+        'peak_memory_kb': round(peak / 1024, 1),
+        'response_bytes': size,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def dataset_sizes():
+    return {
+        'membre': Membre.objects.count(),
+        'media': Media.objects.count(),
+        'jeu': JeuDePlateau.objects.count(),
+        'emprunt': Emprunt.objects.count(),
+        'reservation': Reservation.objects.count(),
+    }
+
+
+def run_benchmarks(iterations=20, only=None, progress=None):
+    """
+    Run the scenarios (all of them, or those named in `only`) and return the
+    results as a JSON-serialisable dict.
+    """
+    scenarios = [scenario for scenario in SCENARIOS if not only or scenario.name in only]
+    unknown = set(only or []) - {scenario.name for scenario in SCENARIOS}
+    if unknown:
+        raise BenchmarkError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    users = benchmark_users()
+    fixtures = benchmark_fixtures()
+    results = {}
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        clients = {}
+        for role, user in users.items():
+            clients[role] = Client()
+            clients[role].force_login(user)
+
+        for scenario in scenarios:
+            results[scenario.name] = run_scenario(scenario, clients, users, fixtures, iterations)
+            if progress:
+                progress(scenario.name, results[scenario.name])
+
+    return {
+        'commit': git_commit(),
+        'date': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'dataset': dataset_sizes(),
+        'results': results,
+    }
+
+
+def search_terms():
+    """
+    Search terms covering a title word, an author name, both together, and a
+    short word common to many titles.
+    """
+    media = Media.objects.order_by('pk').values('title', 'author').first()
+    if media is None:
+        raise BenchmarkError("The catalogue is empty, run the generate_dataset command first.")
+    word, name = media['title'].split()[0], media['author'].split()[-1]
+    return [word, name, f'{word} {name}', 'le']
+
+
+def run_search_benchmark(terms=None, iterations=20, available=None):
+    """
+    Time the catalogue search for each term, at the first and a later page,
+    and return the latency percentiles against SEARCH_TARGET_MS.
+    """
+    from bibliothecaire.search import search_catalogue
+
+    results = {}
+    for term in terms or search_terms():
+        for page in (1, 5):
+            search_catalogue(term, page, available)
+            timings = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                items, _ = search_catalogue(term, page, available)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            results[f'{term} (page {page})'] = {
+                'p50_ms': round(percentile(timings, 0.5), 3),
+                'p95_ms': round(percentile(timings, 0.95), 3),
+                'results': len(items),
+                'within_target': percentile(timings, 0.95) < SEARCH_TARGET_MS,
+            }
+    return {
+        'commit': git_commit(),
+        'date': timezone.now().isoformat(),
+        'dataset': dataset_sizes(),
+        'target_ms': SEARCH_TARGET_MS,
+        'results': results,
+    }
+
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare two benchmark runs scenario by scenario. Returns a list of
+    (scenario, metric, baseline value, current value, is_regression).
+    """
+    rows = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'queries', 'peak_memory_kb'):
+            old, new = before[metric], result[metric]
+            if metric == 'queries':
+                regression = new > old
+            else:
+                regression = new > old * (1 + threshold)
+            rows.append((name, metric, old, new, regression))
+    return rows
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as results_file:
+        return json.load(results_file)
@@ -0,0 +1,70 @@
+from operator import attrgetter
+
+from django.db import connections, router, transaction
+from bibliothecaire.models import Media
+
+
+def bulk_create_media(model, objs):
+    """
+    Insert Livre, Dvd or Cd instances in bulk.
+
+    Django's bulk_create refuses multi-table inherited models, so the Media
+    parent rows are inserted with bulk_create first, which hands back their
+    primary keys, and the child rows are then inserted with a single
+    executemany(). Returns the saved instances.
+    """
+    if not objs:
+        return objs
+
+    parent_fields = [field for field in Media._meta.concrete_fields if not field.primary_key]
+    parents = Media.objects.bulk_create([
+        Media(**{field.attname: getattr(obj, field.attname) for field in parent_fields}) for obj in objs
+    ])
+
+    for obj, parent in zip(objs, parents):
+        if parent.pk is None:
+            raise RuntimeError("The database backend did not return the primary keys of the inserted rows.")
+        obj.pk = parent.pk
+        obj.id = parent.pk
+        obj._state.adding = False
+        obj._state.db = parent._state.db
+
+    insert_rows(model, objs, model._meta.local_concrete_fields)
+    return objs
+
+
+def insert_rows(model, objs, fields=None):
+    """
+    Insert unsaved instances with a single executemany(), without reading
+    back their primary keys. This skips the SQL compilation that
+    bulk_create() repeats for every few hundred rows, which dominates the
+    cost of large inserts on SQLite. Only the local columns of the model
+    (all its non-primary-key columns by default) are written.
+    """
+    if not objs:
+        return
+    if fields is None:
+        fields = [field for field in model._meta.local_concrete_fields if not field.primary_key]
+
+    using = router.db_for_write(model)
+    db = connections[using]
+    columns = ', '.join(db.ops.quote_name(field.column) for field in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    # pre_save() is only needed to fill auto_now fields, and is comparatively
+    # slow, so plain values are read straight from the instance
+    getters = [
+        (lambda obj, field=field: field.pre_save(obj, True))
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+        else attrgetter(field.attname)
+        for field in fields
+    ]
+    rows = [
+        [field.get_db_prep_save(get(obj), db) for field, get in zip(fields, getters)]
+        for obj in objs
+    ]
+    # Outside a transaction, SQLite would commit every row on its own
+    with transaction.atomic(using=using, savepoint=False), db.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {db.ops.quote_name(model._meta.db_table)} ({columns}) VALUES ({placeholders})",
+            rows
+        )
@@ -0,0 +1,204 @@
+import base64
+import binascii
+import json
+
+from django.db.models import Q
+from django.utils.functional import SimpleLazyObject
+from bibliothecaire.models import CatalogueItem, Livre, Dvd, Cd, JeuDePlateau
+
+# Number of items shown on one page of the catalogue
+PAGE_SIZE = 50
+
+# Media types of the catalogue, in the order used to break ties between
+# items sharing the same title. The keys match MediaForm.MEDIA_TYPE_CHOICES.
+MEDIA_TYPES = {
+    'cd': (Cd, ['id', 'title', 'author', 'available', 'artiste']),
+    'dvd': (Dvd, ['id', 'title', 'author', 'available', 'duration']),
+    'jeu': (JeuDePlateau, ['id', 'title', 'createur', 'available']),
+    'livre': (Livre, ['id', 'title', 'author', 'available']),
+}
+
+# Column of CatalogueItem holding each field of the media types. Authors and
+# the creators of games share the `creator` column, which the `author`
+# filter reads.
+ITEM_COLUMNS = {
+    'id': 'object_id',
+    'title': 'title',
+    'author': 'creator',
+    'createur': 'creator',
+    'available': 'available',
+    'artiste': 'artiste',
+    'duration': 'duration',
+}
+
+MEDIA_TYPE_LABELS = [
+    ('livre', 'Livre'),
+    ('dvd', 'DVD'),
+    ('cd', 'CD'),
+    ('jeu', 'Jeu'),
+]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(item):
+    raw = json.dumps([item['title'], item['kind'], item['id']]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        title, kind, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError, TypeError, UnicodeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(title, str) or kind not in MEDIA_TYPES or not isinstance(pk, int):
+        raise InvalidCursor(cursor)
+    return title, kind, pk
+
+
+def _columns(fields):
+    columns = ['kind', 'object_id', 'title']
+    return columns + sorted({ITEM_COLUMNS[field] for field in ITEM_COLUMNS
+                             if fields is None or field in fields} - set(columns))
+
+
+def _items_query(media_type, available, after, limit, author=None, fields=None):
+    """
+    Return the query of at most `limit` catalogue items, of every type or of
+    `media_type` only, ordered by (title, type, id) and starting strictly
+    after the `after` cursor position. With `fields`, only the columns of
+    those fields are read, besides the title, type and id the cursor needs.
+    """
+    queryset = CatalogueItem.objects.all()
+    if media_type is not None:
+        queryset = queryset.filter(kind=media_type)
+    if available is not None:
+        queryset = queryset.filter(available=available)
+    if author is not None:
+        queryset = queryset.filter(creator=author)
+
+    if after is not None:
+        title, kind, pk = after
+        # The first condition lets the database seek into the title index
+        queryset = queryset.filter(title__gte=title).filter(
+            Q(title__gt=title) | Q(title=title, kind__gt=kind) | Q(title=title, kind=kind, object_id__gt=pk))
+
+    return queryset.order_by('title', 'kind', 'object_id').values(*_columns(fields))[:limit]
+
+
+def _item(row, fields):
+    # Items only carry the fields of their type, under the type's own names
+    kind = row['kind']
+    item = {'kind': kind}
+    for field in MEDIA_TYPES[kind][1]:
+        if fields is None or field in fields or field in ('id', 'title'):
+            item[field] = row[ITEM_COLUMNS[field]]
+    return item
+
+
+def _page_bounds(media_type, cursor, page_size):
+    if media_type is not None and media_type not in MEDIA_TYPES:
+        raise ValueError(f"Unknown media type: {media_type}")
+    after = decode_cursor(cursor) if cursor else None
+    return after, page_size or PAGE_SIZE
+
+
+def _page(rows, page_size, fields):
+    items = [_item(row, fields) for row in rows[:page_size]]
+    next_cursor = encode_cursor(items[-1]) if len(rows) > page_size else None
+    return items, next_cursor
+
+
+def catalogue_page(media_type=None, available=None, cursor=None, page_size=None, author=None, fields=None):
+    """
+    Return one page of the catalogue across every media type.
+
+    Items are read from the flattened CatalogueItem table, ordered by (title,
+    type, id) and paginated with a keyset cursor, so each page costs one
+    bounded query whatever the size of the collection. `author` restricts
+    the page to the items of one author (or creator, for games), and
+    `fields` to the columns read. Returns the list of items (as dicts) and
+    the cursor of the next page, or None on the last page.
+    """
+    after, page_size = _page_bounds(media_type, cursor, page_size)
+    rows = list(_items_query(media_type, available, after, page_size + 1, author, fields))
+    return _page(rows, page_size, fields)
+
+
+async def acatalogue_page(media_type=None, available=None, cursor=None, page_size=None, author=None, fields=None):
+    """
+    Async version of catalogue_page(), reading with the async ORM.
+    """
+    after, page_size = _page_bounds(media_type, cursor, page_size)
+    rows = [row async for row in _items_query(media_type, available, after, page_size + 1, author, fields)]
+    return _page(rows, page_size, fields)
+
+
+async def acatalogue_item(media_type, pk, fields=None):
+    """
+    Return one catalogue item, in the same form as the items of a page, or
+    None if there is no such item.
+    """
+    row = await CatalogueItem.objects.filter(kind=media_type, object_id=pk).values(*_columns(fields)).afirst()
+    return _item(row, fields) if row is not None else None
+
+
+def _catalogue_params(request, available):
+    media_type = request.GET.get('type') or None
+    if media_type not in MEDIA_TYPES:
+        media_type = None
+
+    available_param = request.GET.get('available', '')
+    if available is None and available_param in ('0', '1'):
+        available = available_param == '1'
+
+    cursor = request.GET.get('cursor') or None
+    if cursor is not None:
+        try:
+            decode_cursor(cursor)
+        except InvalidCursor:
+            cursor = None
+    return media_type, available, cursor, available_param
+
+
+def _catalogue_context(media_type, cursor, available_param, items, next_cursor):
+    return {
+        'items': items,
+        'next_cursor': next_cursor,
+        'cursor': cursor or '',
+        'is_first_page': cursor is None,
+        'media_type': media_type or '',
+        'available': available_param,
+        'media_types': MEDIA_TYPE_LABELS,
+    }
+
+
+def catalogue_page_from_request(request, available=None, lazy=False):
+    """
+    Read the `type`, `available` and `cursor` query parameters of a catalogue
+    listing. An explicit `available` argument takes precedence over the query
+    string. Returns the template context of the requested page.
+
+    With `lazy`, the page is only fetched when the template first uses
+    `items` or `next_cursor`, so a template fragment served from the cache
+    costs no query.
+    """
+    media_type, available, cursor, available_param = _catalogue_params(request, available)
+    if lazy:
+        page = SimpleLazyObject(lambda: catalogue_page(media_type, available, cursor))
+        items, next_cursor = SimpleLazyObject(lambda: page[0]), SimpleLazyObject(lambda: page[1])
+    else:
+        items, next_cursor = catalogue_page(media_type, available, cursor)
+    return _catalogue_context(media_type, cursor, available_param, items, next_cursor)
+
+
+async def acatalogue_page_from_request(request, available=None):
+    """
+    Async version of catalogue_page_from_request(). The page is always
+    fetched, as templates cannot run async queries.
+    """
+    media_type, available, cursor, available_param = _catalogue_params(request, available)
+    items, next_cursor = await acatalogue_page(media_type, available, cursor)
+    return _catalogue_context(media_type, cursor, available_param, items, next_cursor)
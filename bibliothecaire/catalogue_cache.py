@@ -0,0 +1,107 @@
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from bibliothecaire.models import CatalogueVersion
+
+CATALOGUE_CACHE = 'catalogue'
+
+# Primary key of the single CatalogueVersion row
+CATALOGUE_VERSION_ROW = 1
+
+
+def catalogue_cache():
+    return caches[CATALOGUE_CACHE]
+
+
+def catalogue_state():
+    """
+    Version of the catalogue and time of its last change, which unlike the
+    updated_at columns also moves when a row is deleted. Cached pages and
+    fragments include the version in their keys, so bumping it makes every
+    one of them stale at once, in every worker process. Without the row, the
+    time is now, so no date older than a deletion is ever returned.
+    """
+    state = (CatalogueVersion.objects.filter(pk=CATALOGUE_VERSION_ROW)
+             .values_list('version', 'changed_at').first())
+    return state or (0, timezone.now())
+
+
+def request_catalogue_state(request):
+    # Read once per request, by the validators, the page cache and the fragments
+    if not hasattr(request, '_catalogue_state'):
+        request._catalogue_state = catalogue_state()
+    return request._catalogue_state
+
+
+def catalogue_changed():
+    """
+    Bump the catalogue version within the current transaction, so that other
+    requests see the new version together with the change, and never cache
+    the old data under it.
+    """
+    now = timezone.now()
+    if not CatalogueVersion.objects.filter(pk=CATALOGUE_VERSION_ROW).update(version=F('version') + 1,
+                                                                              changed_at=now):
+        CatalogueVersion.objects.get_or_create(pk=CATALOGUE_VERSION_ROW, defaults={'version': 1, 'changed_at': now})
+
+
+def catalogue_cache_context(request):
+    # Template variables used by the {% cache %} fragments of catalogue pages.
+    # The version is only read when a fragment is rendered.
+    return {
+        'catalogue_version': SimpleLazyObject(lambda: request_catalogue_state(request)[0]),
+        'catalogue_cache_timeout': settings.CATALOGUE_CACHE_TIMEOUT,
+    }
+
+
+def _page_key(request):
+    query = hashlib.md5(request.GET.urlencode().encode()).hexdigest()
+    return f"catalogue:page:{request_catalogue_state(request)[0]}:{request.path}:{query}"
+
+
+def _store_page(key, response):
+    if response.status_code == 200 and not response.streaming:
+        catalogue_cache().set(key, response.content, settings.CATALOGUE_CACHE_TIMEOUT)
+
+
+def cache_catalogue_page(view):
+    """
+    Cache the HTML of a catalogue page by catalogue version and query string.
+    Works with sync and async views.
+    """
+    if iscoroutinefunction(view):
+        # The local-memory and file caches do not block for long, so they
+        # are used directly rather than through a thread. The key may need
+        # the catalogue version from the database, so it is built in one.
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await view(request, *args, **kwargs)
+            key = await sync_to_async(_page_key)(request)
+            content = catalogue_cache().get(key)
+            if content is not None:
+                return HttpResponse(content)
+            response = await view(request, *args, **kwargs)
+            _store_page(key, response)
+            return response
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        key = _page_key(request)
+        content = catalogue_cache().get(key)
+        if content is not None:
+            return HttpResponse(content)
+        response = view(request, *args, **kwargs)
+        _store_page(key, response)
+        return response
+    return wrapper
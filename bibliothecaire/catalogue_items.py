@@ -0,0 +1,101 @@
+from django.db import connection
+from bibliothecaire.models import CatalogueItem, Media, Livre, Dvd, Cd, JeuDePlateau
+
+ITEM_KINDS = {Livre: 'livre', Dvd: 'dvd', Cd: 'cd', JeuDePlateau: 'jeu'}
+
+# Columns copied from the catalogue, rewritten when an item is saved again
+COPIED_FIELDS = ['title', 'creator', 'available', 'artiste', 'duration', 'updated_at']
+
+# Saves and deletions of single items are copied by the signals in
+# signals.py. Every UPDATE or bulk insert of the catalogue tables updates
+# CatalogueItem as well, within the same transaction.
+
+
+def item_for(instance):
+    kind = ITEM_KINDS[type(instance)]
+    return CatalogueItem(
+        kind=kind,
+        object_id=instance.pk,
+        title=instance.title,
+        creator=instance.createur if kind == 'jeu' else instance.author,
+        available=instance.available,
+        artiste=getattr(instance, 'artiste', ''),
+        duration=getattr(instance, 'duration', None),
+    )
+
+
+def save_item(instance):
+    # Insert or update in one statement
+    CatalogueItem.objects.bulk_create([item_for(instance)], update_conflicts=True,
+                                      unique_fields=['kind', 'object_id'], update_fields=COPIED_FIELDS)
+
+
+def update_media_item(media):
+    """
+    Copy the columns owned by the Media parent table, for saves made through
+    a bare Media instance whose concrete type is not known.
+    """
+    CatalogueItem.objects.of_media([media.pk]).update(title=media.title, creator=media.author,
+                                                      available=media.available)
+
+
+def delete_items(sender, pk):
+    if sender is JeuDePlateau:
+        CatalogueItem.objects.of_games([pk]).delete()
+    else:
+        CatalogueItem.objects.of_media([pk]).delete()
+
+
+def _insert_select(select, where, params):
+    # Items saved meanwhile through the signals are left as they are. SQLite
+    # needs the WHERE clause to parse ON CONFLICT after a SELECT.
+    columns = 'kind, object_id, title, creator, available, artiste, duration, updated_at'
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {CatalogueItem._meta.db_table} ({columns}) {select} {where} "
+                       f"ON CONFLICT DO NOTHING", params)
+
+
+def index_media_range(first_id=None, last_id=None):
+    """
+    Copy every book, DVD and CD, or only those whose id is within the given
+    bounds, with a single INSERT ... SELECT.
+    """
+    where, params = 'WHERE COALESCE(l.media_ptr_id, d.media_ptr_id, c.media_ptr_id) IS NOT NULL', []
+    if first_id is not None and last_id is not None:
+        where, params = f'{where} AND m.id BETWEEN %s AND %s', [first_id, last_id]
+    _insert_select(
+        f"SELECT CASE WHEN l.media_ptr_id IS NOT NULL THEN 'livre' "
+        f"WHEN d.media_ptr_id IS NOT NULL THEN 'dvd' ELSE 'cd' END, "
+        f"m.id, m.title, m.author, m.available, COALESCE(c.artiste, ''), d.duration, m.updated_at "
+        f"FROM {Media._meta.db_table} m "
+        f"LEFT JOIN {Livre._meta.db_table} l ON l.media_ptr_id = m.id "
+        f"LEFT JOIN {Dvd._meta.db_table} d ON d.media_ptr_id = m.id "
+        f"LEFT JOIN {Cd._meta.db_table} c ON c.media_ptr_id = m.id",
+        where, params
+    )
+
+
+def index_jeu_range(first_id=None, last_id=None):
+    """
+    Copy every game, or only those whose id is within the given bounds, with
+    a single INSERT ... SELECT.
+    """
+    where, params = 'WHERE TRUE', []
+    if first_id is not None and last_id is not None:
+        where, params = 'WHERE j.id BETWEEN %s AND %s', [first_id, last_id]
+    _insert_select(
+        f"SELECT 'jeu', j.id, j.title, j.createur, j.available, '', NULL, j.updated_at "
+        f"FROM {JeuDePlateau._meta.db_table} j",
+        where, params
+    )
+
+
+def rebuild_catalogue_items():
+    """
+    Recreate every catalogue item from the catalogue tables. Returns the
+    number of items. Run it in a transaction.
+    """
+    CatalogueItem.objects.all().delete()
+    index_media_range()
+    index_jeu_range()
+    return CatalogueItem.objects.count()
@@ -0,0 +1,292 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F, Q, Case, When, Value, Count, Exists, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from bibliothecaire import stats
+from bibliothecaire.catalogue_cache import catalogue_changed
+from bibliothecaire.models import CatalogueItem, Media, JeuDePlateau, Membre, Emprunt, Reservation
+
+# Maximum number of active loans and reservations per member
+LOAN_LIMIT = 3
+RESERVATION_LIMIT = 1
+
+
+class CirculationError(Exception):
+    """
+    Raised when a checkout, return or reservation cannot be applied. `reason`
+    is a short machine-readable code and `message` is shown to the librarian.
+    """
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+        self.message = message
+
+
+# Each operation below claims the rows it changes with a conditional UPDATE
+# inside one transaction, so the limits hold even when several workers handle
+# requests for the same media or member at the same time. UPDATEs send no
+# signal, so the operations that change availability that way copy it to the
+# catalogue items and invalidate the cached catalogue themselves. They also
+# add to the daily circulation statistics, see stats.py.
+
+def check_out(loan):
+    """
+    Save a new loan, marking its media as borrowed and counting it against
+    the member's loan limit.
+    """
+    with transaction.atomic():
+        if not Media.objects.filter(pk=loan.media_id, available=True).update(available=False):
+            raise CirculationError('media_unavailable', "Ce média n'est pas disponible.")
+        CatalogueItem.objects.of_media([loan.media_id]).update(available=False)
+
+        if not Membre.objects.filter(pk=loan.member_id, active_loans__lt=LOAN_LIMIT).update(
+                active_loans=F('active_loans') + 1):
+            raise CirculationError('loan_limit',
+                                   f"{loan.member.name}, ne peut pas avoir plus de {LOAN_LIMIT} emprunts actifs.")
+
+        loan.returned = False
+        loan.save()
+        stats.add_media_to_day('checkouts', [loan.media_id], timezone.localdate(loan.loan_date))
+    loan.media.available = False
+
+
+def check_in(loan):
+    """
+    Mark a loan as returned and release its media.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # Late returns the sweeper has not flagged yet fall overdue now
+        stats.count_fallen_overdue(Emprunt.objects.overdue(now).filter(pk=loan.pk, overdue=False))
+        was_overdue = Emprunt.objects.filter(pk=loan.pk, returned=False, overdue=True).update(
+            returned=True, returned_at=now, overdue=False)
+        if not was_overdue and not Emprunt.objects.filter(pk=loan.pk, returned=False).update(
+                returned=True, returned_at=now):
+            raise CirculationError('already_returned', "Cet emprunt a déjà été retourné.")
+
+        Media.objects.filter(pk=loan.media_id).update(available=True)
+        CatalogueItem.objects.of_media([loan.media_id]).update(available=True)
+        catalogue_changed()
+        Membre.objects.filter(pk=loan.member_id).update(
+            active_loans=Greatest(F('active_loans') - 1, Value(0)),
+            overdue_loans=Greatest(F('overdue_loans') - was_overdue, Value(0)),
+        )
+        stats.add_media_to_day('returns', [loan.media_id])
+    loan.returned = True
+    loan.returned_at = now
+    loan.overdue = False
+
+
+def check_out_many(member, media_ids, loan_date, return_date):
+    """
+    Save one loan per media for the same member, as a single checkout: either
+    every media is borrowed or none is. Returns the new loans.
+    """
+    media_ids = list(dict.fromkeys(media_ids))
+    if not media_ids:
+        raise CirculationError('empty', "Aucun média sélectionné.")
+
+    with transaction.atomic():
+        if Media.objects.filter(pk__in=media_ids, available=True).update(available=False) != len(media_ids):
+            raise CirculationError('media_unavailable', "Un des médias sélectionnés n'est plus disponible.")
+        CatalogueItem.objects.of_media(media_ids).update(available=False)
+
+        if not Membre.objects.filter(pk=member.pk, active_loans__lte=LOAN_LIMIT - len(media_ids)).update(
+                active_loans=F('active_loans') + len(media_ids)):
+            raise CirculationError('loan_limit',
+                                   f"{member.name}, ne peut pas avoir plus de {LOAN_LIMIT} emprunts actifs.")
+
+        catalogue_changed()
+        stats.add_media_to_day('checkouts', media_ids, timezone.localdate(loan_date))
+        return Emprunt.objects.bulk_create([
+            Emprunt(media_id=media_id, member=member, loan_date=loan_date, return_date=return_date)
+            for media_id in media_ids
+        ])
+
+
+def per_member(counts):
+    # An expression evaluating to counts[member id] for each updated member
+    return Case(*[When(pk=member_id, then=Value(count)) for member_id, count in counts.items()],
+                default=Value(0))
+
+
+def check_in_many(loan_ids, member=None):
+    """
+    Mark several loans as returned at once, optionally restricted to the
+    loans of one member. Either every loan is returned or none is. Returns
+    the number of returned loans.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        loans = Emprunt.objects.filter(pk__in=loan_ids, returned=False)
+        if member is not None:
+            loans = loans.filter(member=member)
+        rows = list(loans.values_list('pk', 'media_id', 'member_id', 'overdue'))
+        if not rows or len(rows) != len(set(loan_ids)):
+            raise CirculationError('already_returned', "Un des emprunts sélectionnés a déjà été retourné.")
+
+        stats.count_fallen_overdue(loans.overdue(now).filter(overdue=False))
+        if Emprunt.objects.filter(pk__in=[pk for pk, _, _, _ in rows], returned=False).update(
+                returned=True, returned_at=now, overdue=False) != len(rows):
+            raise CirculationError('already_returned', "Un des emprunts sélectionnés a déjà été retourné.")
+
+        media_ids = [media_id for _, media_id, _, _ in rows]
+        Media.objects.filter(pk__in=media_ids).update(available=True)
+        CatalogueItem.objects.of_media(media_ids).update(available=True)
+        catalogue_changed()
+        stats.add_media_to_day('returns', media_ids)
+
+        returned_per_member = Counter(member_id for _, _, member_id, _ in rows)
+        overdue_per_member = Counter(member_id for _, _, member_id, overdue in rows if overdue)
+        Membre.objects.filter(pk__in=returned_per_member).update(
+            active_loans=Greatest(F('active_loans') - per_member(returned_per_member), Value(0)),
+            overdue_loans=Greatest(F('overdue_loans') - per_member(overdue_per_member), Value(0)),
+        )
+    return len(rows)
+
+
+def reserve(reservation):
+    """
+    Save a new reservation, marking its game as reserved and counting it
+    against the member's reservation limit.
+    """
+    with transaction.atomic():
+        if not JeuDePlateau.objects.filter(pk=reservation.jeuDePlateau_id, available=True).update(available=False):
+            raise CirculationError('game_unavailable', "Ce jeu est déjà réservé. ")
+        CatalogueItem.objects.of_games([reservation.jeuDePlateau_id]).update(available=False)
+
+        if not Membre.objects.filter(pk=reservation.member_id, active_reservation__lt=RESERVATION_LIMIT).update(
+                active_reservation=F('active_reservation') + 1):
+            raise CirculationError('reservation_limit',
+                                   f"{reservation.member.name}, ne peut pas réserver plus d'un jeu en même temps. ")
+
+        reservation.reserved = True
+        reservation.save()
+        stats.add_to_day('reservations', {'jeu': 1}, timezone.localdate(reservation.reservation_time))
+    reservation.jeuDePlateau.available = False
+
+
+def end_reservation(reservation):
+    """
+    Mark a reservation as ended and release its game.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        if not Reservation.objects.filter(pk=reservation.pk, reserved=True).update(reserved=False, ended_at=now):
+            raise CirculationError('already_ended', "Cette réservation est déjà terminée.")
+
+        JeuDePlateau.objects.filter(pk=reservation.jeuDePlateau_id).update(available=True)
+        CatalogueItem.objects.of_games([reservation.jeuDePlateau_id]).update(available=True)
+        catalogue_changed()
+        Membre.objects.filter(pk=reservation.member_id, active_reservation__gt=0).update(
+            active_reservation=F('active_reservation') - 1)
+        stats.add_to_day('reservations_ended', {'jeu': 1})
+    reservation.reserved = False
+    reservation.ended_at = now
+
+
+def sweep_overdue_loans(now=None):
+    """
+    Flag every unreturned loan past its return date as overdue, unflag loans
+    whose return date was moved back into the future, and refresh the
+    overdue count of the members concerned. Every step is a set-based
+    UPDATE. Returns the number of newly flagged and unflagged loans.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        stats.count_fallen_overdue(Emprunt.objects.overdue(now).filter(overdue=False))
+        flagged = Emprunt.objects.overdue(now).filter(overdue=False).update(overdue=True)
+        cleared = Emprunt.objects.filter(overdue=True, return_date__gte=now).update(overdue=False)
+
+        overdue_count = (Emprunt.objects.filter(member=OuterRef('pk'), overdue=True)
+                         .order_by().values('member').annotate(count=Count('pk')).values('count'))
+        Membre.objects.filter(
+            Q(overdue_loans__gt=0) | Q(pk__in=Emprunt.objects.filter(overdue=True).values('member'))
+        ).update(overdue_loans=Coalesce(Subquery(overdue_count), Value(0)))
+    return flagged, cleared
+
+
+def expire_reservations(now=None):
+    """
+    End every reservation whose reservation_end has passed, releasing the
+    games and the members' reservation counts. Runs as three set-based
+    UPDATEs in one transaction, whatever the number of lapsed reservations.
+    Returns the number of ended reservations.
+    """
+    now = now or timezone.now()
+    lapsed = Reservation.objects.filter(reserved=True, reservation_end__lt=now)
+    with transaction.atomic():
+        if JeuDePlateau.objects.filter(pk__in=lapsed.values('jeuDePlateau')).update(available=True):
+            CatalogueItem.objects.of_games(lapsed.values('jeuDePlateau')).update(available=True)
+            catalogue_changed()
+
+        lapsed_count = (lapsed.filter(member=OuterRef('pk'))
+                        .order_by().values('member').annotate(count=Count('pk')).values('count'))
+        Membre.objects.filter(pk__in=lapsed.values('member')).update(
+            active_reservation=Greatest(F('active_reservation') - Subquery(lapsed_count), Value(0)))
+
+        ended = lapsed.update(reserved=False, ended_at=now)
+        stats.add_to_day('reservations_ended', {'jeu': ended}, timezone.localdate(now))
+        return ended
+
+
+def count_per_member(queryset):
+    # Grouped count of `queryset` rows for the member of the outer query
+    return Coalesce(Subquery(queryset.filter(member=OuterRef('pk'))
+                             .order_by().values('member').annotate(count=Count('pk')).values('count')),
+                    Value(0))
+
+
+def reconcile_counters(dry_run=False):
+    """
+    Recompute the denormalized circulation state from the loans and
+    reservations themselves: the members' active_loans, active_reservation
+    and overdue_loans counters, and the availability of media and games and
+    of their catalogue items. The loans and reservations are authoritative:
+    a media or game is available exactly when nothing holds it.
+    Only rows that drifted are updated, each kind with a single set-based
+    UPDATE. Returns the number of rows fixed (or to fix, with dry_run) per
+    kind of counter.
+    """
+    counters = {
+        'active_loans': Emprunt.objects.filter(returned=False),
+        'active_reservation': Reservation.objects.filter(reserved=True),
+        'overdue_loans': Emprunt.objects.filter(returned=False, overdue=True),
+    }
+    media_borrowed = Exists(Emprunt.objects.filter(media=OuterRef('pk'), returned=False))
+    game_reserved = Exists(Reservation.objects.filter(jeuDePlateau=OuterRef('pk'), reserved=True))
+
+    stale = {
+        f'membre.{field}': (Membre.objects.alias(actual=count_per_member(queryset)).exclude(**{field: F('actual')}),
+                            {field: count_per_member(queryset)})
+        for field, queryset in counters.items()
+    }
+    stale['media.available'] = (Media.objects.alias(borrowed=media_borrowed).filter(available=False, borrowed=False),
+                                {'available': True})
+    stale['media.unavailable'] = (Media.objects.alias(borrowed=media_borrowed).filter(available=True, borrowed=True),
+                                  {'available': False})
+    stale['jeu.available'] = (JeuDePlateau.objects.alias(reserved=game_reserved).filter(available=False,
+                                                                                         reserved=False),
+                              {'available': True})
+    stale['jeu.unavailable'] = (JeuDePlateau.objects.alias(reserved=game_reserved).filter(available=True,
+                                                                                           reserved=True),
+                                {'available': False})
+    # Run last, once the availability of media and games is fixed
+    item_available = Case(
+        When(kind='jeu', then=Subquery(JeuDePlateau.objects.filter(pk=OuterRef('object_id')).values('available'))),
+        default=Subquery(Media.objects.filter(pk=OuterRef('object_id')).values('available')),
+    )
+    stale['catalogue.available'] = (CatalogueItem.objects.alias(actual=item_available)
+                                    .filter(actual__isnull=False).exclude(available=F('actual')),
+                                    {'available': item_available})
+
+    changes = {}
+    with transaction.atomic():
+        for name, (queryset, values) in stale.items():
+            changes[name] = queryset.count() if dry_run else queryset.update(**values)
+        if not dry_run and any(changes[name] for name in changes if not name.startswith('membre.')):
+            catalogue_changed()
+    return changes
@@ -0,0 +1,99 @@
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.db.models import Count, Max
+from django.middleware.csrf import get_token
+from django.views.decorators.http import condition
+from bibliothecaire.catalogue_cache import request_catalogue_state
+from bibliothecaire.models import Media, JeuDePlateau, Membre, EmpruntArchive, ReservationArchive
+
+
+def make_etag(*parts):
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def conditional_page(validators):
+    """
+    Answer conditional GET and HEAD requests with 304 Not Modified when the
+    page has not changed, without calling the view.
+
+    `validators(request, *args, **kwargs)` returns the ETag and Last-Modified
+    date of the page. It is computed once per request, and must be much
+    cheaper than rendering the page: a query or two on indexed columns.
+    """
+    def cached_validators(request, *args, **kwargs):
+        if not hasattr(request, '_page_validators'):
+            request._page_validators = validators(request, *args, **kwargs)
+        return request._page_validators
+
+    conditional = condition(
+        etag_func=lambda request, *args, **kwargs: cached_validators(request, *args, **kwargs)[0],
+        last_modified_func=lambda request, *args, **kwargs: cached_validators(request, *args, **kwargs)[1],
+    )
+
+    def decorator(view):
+        conditional_view = conditional(view)
+        if not iscoroutinefunction(view):
+            return conditional_view
+
+        # condition() calls the validators synchronously, so async views
+        # compute them in a thread beforehand
+        @wraps(view)
+        async def async_view(request, *args, **kwargs):
+            await sync_to_async(cached_validators)(request, *args, **kwargs)
+            return await conditional_view(request, *args, **kwargs)
+        return async_view
+    return decorator
+
+
+def csrf_secret(request):
+    # Forms embed a token derived from the CSRF secret, which get_token()
+    # creates on the first visit so that the page it validates carries it
+    get_token(request)
+    return request.META['CSRF_COOKIE']
+
+
+def catalogue_validators(request, *args, **kwargs):
+    """
+    Validators of a catalogue page, whatever its filters: the latest change
+    to a media or game, each read from the updated_at index, and the
+    catalogue version. Deletions do not move updated_at, so Last-Modified
+    also takes the time the version was last bumped.
+    """
+    media = Media.objects.aggregate(latest=Max('updated_at'))['latest']
+    jeu = JeuDePlateau.objects.aggregate(latest=Max('updated_at'))['latest']
+    version, changed_at = request_catalogue_state(request)
+    latest = max(filter(None, (media, jeu, changed_at)))
+    return make_etag('catalogue', version, media, jeu, getattr(request.user, 'pk', None)), latest
+
+
+def member_history_validators(relation, item, archive):
+    """
+    Build the validators of a member's loan or reservation history, computed
+    in one query over the member's rows of `relation` and the `item` they
+    point to, plus one over the `archive` rows when they are shown. Unknown
+    members get no validator, so that the view answers 404.
+    """
+    def validators(request, member_id, *args, **kwargs):
+        state = Membre.objects.filter(pk=member_id).aggregate(
+            name=Max('name'),
+            count=Count(relation),
+            latest=Max(f'{relation}__updated_at'),
+            item_latest=Max(f'{relation}__{item}__updated_at'),
+        )
+        if state['name'] is None:
+            return None, None
+        if request.GET.get('history') == 'all':
+            state.update(archive.objects.filter(member_id=member_id).aggregate(
+                archived=Count('pk'),
+                archived_item_latest=Max(f'{item}__updated_at'),
+            ))
+        latest = max(filter(None, (state['latest'], state['item_latest'], state.get('archived_item_latest'))),
+                     default=None)
+        return make_etag(relation, member_id, *state.values(), request.user.pk, csrf_secret(request)), latest
+    return validators
+
+
+member_loans_validators = member_history_validators('emprunt', 'media', EmpruntArchive)
+member_reservations_validators = member_history_validators('reservation', 'jeuDePlateau', ReservationArchive)
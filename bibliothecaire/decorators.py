@@ -1,10 +1,7 @@
 # bibliothecaire/decorators.py
 from django.shortcuts import redirect, render
 from django.urls import reverse
-
-
-def is_bibliothecaire(user):
-    return user.groups.filter(name='bibliothecaires').exists()
+from .auth import is_bibliothecaire
 
 
 def bibliothecaire_required(view_func):
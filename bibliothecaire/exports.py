@@ -0,0 +1,119 @@
+import csv
+import datetime
+import io
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.duration import duration_string
+from bibliothecaire.models import (Livre, Dvd, Cd, JeuDePlateau, Membre, Emprunt, Reservation, EmpruntArchive,
+                                   ReservationArchive)
+
+# Number of rows fetched from the database at a time
+EXPORT_CHUNK_SIZE = 2000
+
+# Size of the chunks of output handed to the client
+OUTPUT_BUFFER_SIZE = 64 * 1024
+
+DATASETS = {
+    'livre': (Livre, ['id', 'title', 'author', 'publication_date', 'available']),
+    'dvd': (Dvd, ['id', 'title', 'author', 'publication_date', 'available', 'duration']),
+    'cd': (Cd, ['id', 'title', 'author', 'publication_date', 'available', 'artiste']),
+    'jeu': (JeuDePlateau, ['id', 'title', 'createur', 'available']),
+    'membre': (Membre, ['id', 'name', 'email', 'active_loans', 'active_reservation']),
+    'emprunt': (Emprunt, ['id', 'media_id', 'member_id', 'loan_date', 'return_date', 'returned', 'returned_at']),
+    'reservation': (Reservation, ['id', 'jeuDePlateau_id', 'member_id', 'reservation_time', 'reservation_end',
+                                  'reserved', 'ended_at']),
+    # History moved out of the live tables, see archive.py
+    'emprunt_archive': (EmpruntArchive, ['id', 'media_id', 'member_id', 'loan_date', 'return_date', 'returned_at',
+                                         'archived_at']),
+    'reservation_archive': (ReservationArchive, ['id', 'jeuDePlateau_id', 'member_id', 'reservation_time',
+                                                 'reservation_end', 'ended_at', 'archived_at']),
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def export_rows(dataset):
+    """
+    Iterate over the rows of a dataset as tuples, fetching them from the
+    database in chunks so the queryset is never held in memory.
+    """
+    model, fields = DATASETS[dataset]
+    return model.objects.order_by('pk').values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def csv_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return duration_string(value)
+    return value
+
+
+def csv_chunks(dataset):
+    fields = DATASETS[dataset][1]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for row in export_rows(dataset):
+        writer.writerow([csv_value(value) for value in row])
+        if buffer.tell() >= OUTPUT_BUFFER_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def jsonl_chunks(dataset):
+    fields = DATASETS[dataset][1]
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    lines, size = [], 0
+    for row in export_rows(dataset):
+        line = encoder.encode(dict(zip(fields, row))) + '\n'
+        lines.append(line)
+        size += len(line)
+        if size >= OUTPUT_BUFFER_SIZE:
+            yield ''.join(lines).encode()
+            lines, size = [], 0
+    yield ''.join(lines).encode()
+
+
+def gzip_chunks(chunks):
+    """
+    Compress a stream of bytes on the fly. The first chunk is flushed right
+    away so the client receives data immediately.
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    first = True
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if first:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            first = False
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(dataset, export_format='csv', compress=False):
+    """
+    Return an iterator over the bytes of a dataset exported as CSV or JSONL,
+    optionally gzip-compressed.
+    """
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown dataset: {dataset}")
+    if export_format not in FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}")
+
+    chunks = csv_chunks(dataset) if export_format == 'csv' else jsonl_chunks(dataset)
+    if compress:
+        chunks = gzip_chunks(chunks)
+    return chunks
+
+
+def export_filename(dataset, export_format='csv', compress=False):
+    return f"{dataset}.{export_format}{'.gz' if compress else ''}"
+
@@ -130,3 +130,20 @@ class ReservationForm(forms.ModelForm):
 
         self.fields['reservation_time'].label = 'Date et heure de réservation'
         self.fields['reservation_end'].label = 'Fin de réservation'
+
+
+class BatchEmpruntForm(forms.Form):
+    member = forms.ModelChoiceField(queryset=Membre.objects.all(), label='Membre')
+    medias = forms.ModelMultipleChoiceField(queryset=Media.objects.filter(available=True), label='Médias')
+
+    loan_date = forms.DateTimeField(
+        initial=timezone.now,
+        widget=forms.DateTimeInput(attrs={'type': 'datetime-local'}),
+        label='Date de l\'emprunt'
+    )
+
+    return_date = forms.DateTimeField(
+        initial=lambda: timezone.now() + timedelta(days=7),
+        widget=forms.DateTimeInput(attrs={'type': 'datetime-local'}),
+        label='Date de retour'
+    )
@@ -0,0 +1,191 @@
+"""
+Concurrent read/write load test of the database: reader threads page through
+the catalogue and the loans of members while writer threads check media out
+and back in, as librarians at the desk do.
+
+Each phase runs with one database profile:
+
+- 'baseline': SQLite's defaults (rollback journal, no PRAGMA) and a new
+  connection for every operation.
+- 'configured': the SQLITE_PRAGMAS and CONN_MAX_AGE of the current settings,
+  connections being recycled as at the end of a request.
+- 'replica': as 'configured', the readers reading from the replica database
+  (see replica.py), synced from the primary before the phase. Only run when a
+  replica is configured.
+
+Run it with the production settings to compare them with the baseline. It
+writes to the database, so run it against a copy; the loans it creates are
+deleted at the end.
+"""
+import random
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.db import OperationalError, close_old_connections, connection, connections
+from django.test.utils import override_settings
+from bibliothecaire import circulation
+from bibliothecaire.benchmark import BenchmarkError, percentile
+from bibliothecaire.catalogue import MEDIA_TYPES, catalogue_page
+from bibliothecaire.models import Media, Membre, Emprunt
+from bibliothecaire.replica import reading_from_replica, replica_configured, sync_replica
+
+PROFILES = ('baseline', 'configured', 'replica')
+
+# Number of media and members the workers pick from
+SAMPLE_SIZE = 2000
+
+
+class WorkerStats:
+    def __init__(self):
+        self.latencies = []
+        self.conflicts = 0
+        self.errors = 0
+
+
+class LoadTest:
+    def __init__(self, duration, readers, writers):
+        self.duration = duration
+        self.readers = readers
+        self.writers = writers
+        self.media_ids = list(Media.objects.filter(available=True).order_by('?')
+                              .values_list('pk', flat=True)[:SAMPLE_SIZE])
+        self.member_ids = list(Membre.objects.filter(active_loans=0).order_by('?')
+                               .values_list('pk', flat=True)[:SAMPLE_SIZE])
+        if not self.media_ids or not self.member_ids:
+            raise BenchmarkError("The database needs available media and members without loans.")
+        self.created = []
+        self.unreturned = []
+        self._lock = threading.Lock()
+
+    def read(self, rng):
+        catalogue_page(rng.choice([None, *MEDIA_TYPES]), available=True)
+        list(Emprunt.objects.filter(member_id=rng.choice(self.member_ids))
+             .order_by('-loan_date', 'pk').values('pk', 'media__title', 'loan_date', 'returned')[:25])
+
+    def write(self, rng):
+        loan = Emprunt(media_id=rng.choice(self.media_ids), member_id=rng.choice(self.member_ids))
+        circulation.check_out(loan)
+        with self._lock:
+            self.created.append(loan.pk)
+        try:
+            circulation.check_in(loan)
+        except OperationalError:
+            with self._lock:
+                self.unreturned.append(loan)
+            raise
+
+    def read_from_replica(self, rng):
+        with reading_from_replica():
+            self.read(rng)
+
+    def worker(self, operation, stats, stop, release):
+        rng = random.Random()
+        try:
+            while time.perf_counter() < stop:
+                start = time.perf_counter()
+                try:
+                    operation(rng)
+                except circulation.CirculationError:
+                    # Another writer took the media or the member's last loan
+                    stats.conflicts += 1
+                except OperationalError:
+                    # "database is locked"
+                    stats.errors += 1
+                else:
+                    stats.latencies.append(time.perf_counter() - start)
+                finally:
+                    release()
+        finally:
+            connections.close_all()
+
+    def run_phase(self, profile):
+        if profile == 'baseline':
+            # Not connection.close, which would be bound to this thread's connection
+            pragmas, release = {'journal_mode': 'delete'}, lambda: connection.close()
+        else:
+            pragmas, release = settings.SQLITE_PRAGMAS, close_old_connections
+        read = self.read
+        if profile == 'replica':
+            sync_replica()
+            read = self.read_from_replica
+
+        connections.close_all()
+        with override_settings(SQLITE_PRAGMAS=pragmas):
+            # The journal mode of the file is switched before the workers open it
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA journal_mode")
+                journal_mode = cursor.fetchone()[0]
+            connection.close()
+
+            stop = time.perf_counter() + self.duration
+            reads = [WorkerStats() for _ in range(self.readers)]
+            writes = [WorkerStats() for _ in range(self.writers)]
+            threads = [threading.Thread(target=self.worker, args=(read, stats, stop, release))
+                       for stats in reads]
+            threads += [threading.Thread(target=self.worker, args=(self.write, stats, stop, release))
+                        for stats in writes]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+        return {
+            'profile': profile,
+            'journal_mode': journal_mode,
+            'conn_max_age': 0 if profile == 'baseline' else connection.settings_dict['CONN_MAX_AGE'],
+            'readers': self.readers,
+            'writers': self.writers,
+            'duration_s': round(elapsed, 2),
+            **summarize('read', reads, elapsed),
+            **summarize('write', writes, elapsed),
+        }
+
+    def clean_up(self):
+        for loan in self.unreturned:
+            try:
+                circulation.check_in(loan)
+            except circulation.CirculationError:
+                pass
+        for start in range(0, len(self.created), 500):
+            Emprunt.objects.filter(pk__in=self.created[start:start + 500]).delete()
+
+
+def summarize(kind, stats, elapsed):
+    latencies = sorted(latency for worker in stats for latency in worker.latencies)
+    result = {
+        f'{kind}s': len(latencies),
+        f'{kind}s_per_s': round(len(latencies) / elapsed, 1),
+        f'{kind}_conflicts': sum(worker.conflicts for worker in stats),
+        f'{kind}_errors': sum(worker.errors for worker in stats),
+    }
+    if latencies:
+        result.update({
+            f'{kind}_p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+            f'{kind}_p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            f'{kind}_mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+        })
+    return result
+
+
+def available_profiles():
+    return [profile for profile in PROFILES if profile != 'replica' or replica_configured()]
+
+
+def run_load_test(duration=10.0, readers=8, writers=2, profiles=None):
+    """
+    Run one phase per profile, by default every available one, and return
+    their measurements. A write is a checkout followed by the return of the
+    same media.
+    """
+    profiles = profiles or available_profiles()
+    if 'replica' in profiles and not replica_configured():
+        raise BenchmarkError("The 'replica' profile needs a replica database, set DJANGO_REPLICA_DB_PATH.")
+    load_test = LoadTest(duration, readers, writers)
+    try:
+        return [load_test.run_phase(profile) for profile in profiles]
+    finally:
+        load_test.clean_up()
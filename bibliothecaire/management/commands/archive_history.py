@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from bibliothecaire.archive import archive_history
+
+
+class Command(BaseCommand):
+    help = ("Move loans returned and reservations ended long ago from the live tables to the archive tables, "
+            "in batched transactions.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help="Archive rows finished more than this many days ago. "
+                                 "Defaults to HISTORY_ARCHIVE_AFTER_DAYS.")
+        parser.add_argument('--batch-size', type=int,
+                            help="Rows moved per transaction. Defaults to HISTORY_ARCHIVE_BATCH_SIZE.")
+
+    def handle(self, *args, **options):
+        if (options['days'] is not None and options['days'] < 0) or (
+                options['batch_size'] is not None and options['batch_size'] < 1):
+            raise CommandError("--days must not be negative and --batch-size must be positive.")
+
+        moved = archive_history(options['days'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{moved['emprunt']} loans and {moved['reservation']} reservations archived."
+        ))
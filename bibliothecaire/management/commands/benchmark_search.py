@@ -0,0 +1,48 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from bibliothecaire import benchmark, search
+
+
+class Command(BaseCommand):
+    help = ("Time the catalogue search against the current database, for a few typical terms, and compare the "
+            f"95th percentile with the target of {benchmark.SEARCH_TARGET_MS} ms.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--term', action='append', dest='terms', metavar='TEXT',
+                            help="Search this text. Can be repeated. Defaults to terms taken from the catalogue.")
+        parser.add_argument('--iterations', type=int, default=20, help="Number of timed searches per term.")
+        parser.add_argument('--available', action='store_true', help="Only search the available items.")
+        parser.add_argument('--output', '-o', help="Write the results to this JSON file.")
+        parser.add_argument('--fail-over-target', action='store_true',
+                            help="Exit with an error when a search misses the target.")
+
+    def handle(self, *args, **options):
+        if not search.search_available():
+            raise CommandError("The catalogue search requires the SQLite backend.")
+        if options['iterations'] < 1:
+            raise CommandError("--iterations must be positive.")
+
+        try:
+            results = benchmark.run_search_benchmark(options['terms'], options['iterations'],
+                                                     True if options['available'] else None)
+        except benchmark.BenchmarkError as error:
+            raise CommandError(error)
+
+        self.stdout.write(f"{results['dataset']['media']} media, {results['dataset']['jeu']} games")
+        missed = 0
+        for name, result in results['results'].items():
+            line = (f"{name:<32} p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+                    f"{result['results']:>3} results")
+            if not result['within_target']:
+                missed += 1
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if missed and options['fail_over_target']:
+            raise CommandError(f"{missed} searches missed the {results['target_ms']} ms target.")
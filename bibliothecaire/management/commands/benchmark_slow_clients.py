@@ -0,0 +1,45 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import NoReverseMatch, reverse
+from bibliothecaire.benchmark import BenchmarkError
+from bibliothecaire.slow_clients import run_slow_clients
+
+
+class Command(BaseCommand):
+    help = ("Compare how many concurrent slow clients one process holds when a public page is served "
+            "through WSGI with a pool of worker threads, and through ASGI.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='membre_list_media',
+                            help="Name of the URL to request. It must not take arguments.")
+        parser.add_argument('--query', default='', help="Query string of the requests.")
+        parser.add_argument('--clients', type=int, default=100, help="Number of clients arriving together.")
+        parser.add_argument('--delay', type=float, default=0.5,
+                            help="Seconds each client takes to send its request, and again to read the response.")
+        parser.add_argument('--threads', type=int, default=8, help="Worker threads of the WSGI process.")
+        parser.add_argument('--output', '-o', help="Write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        if options['clients'] < 1 or options['threads'] < 1 or options['delay'] < 0:
+            raise CommandError("--clients and --threads must be positive, and --delay not negative.")
+        try:
+            path = reverse(options['url'])
+        except NoReverseMatch:
+            raise CommandError(f"Unknown URL name: {options['url']}")
+
+        try:
+            results = run_slow_clients(path, options['query'], options['clients'], options['delay'],
+                                       options['threads'])
+        except BenchmarkError as error:
+            raise CommandError(error)
+
+        for result in results:
+            self.stdout.write(f"{result['mode']}: {result['max_in_flight']:>5} clients held at once  "
+                              f"wall {result['wall_s']:>7.2f} s  {result['requests_per_s']:>7.1f} req/s  "
+                              f"p50 {result['p50_ms']:>9.1f} ms  p95 {result['p95_ms']:>9.1f} ms")
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
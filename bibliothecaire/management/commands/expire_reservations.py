@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from bibliothecaire.circulation import expire_reservations
+
+
+class Command(BaseCommand):
+    help = "End every board-game reservation whose reservation_end has passed."
+
+    def handle(self, *args, **options):
+        expired = expire_reservations()
+        self.stdout.write(self.style.SUCCESS(f"{expired} reservations expired."))
@@ -0,0 +1,28 @@
+import sys
+
+from django.core.management.base import BaseCommand
+from bibliothecaire import exports
+from bibliothecaire.replica import reading_from_replica
+
+
+class Command(BaseCommand):
+    help = ("Stream a dataset (catalogue, members or loan history) as CSV or JSONL. Read from the replica "
+            "database when there is one.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(exports.DATASETS))
+        parser.add_argument('--format', choices=list(exports.FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help="Compress the output with gzip.")
+        parser.add_argument('--output', '-o', help="Output file. Defaults to standard output.")
+
+    def handle(self, *args, **options):
+        chunks = exports.export_chunks(options['dataset'], options['format'], options['gzip'])
+        with reading_from_replica():
+            if options['output']:
+                with open(options['output'], 'wb') as output:
+                    for chunk in chunks:
+                        output.write(chunk)
+            else:
+                for chunk in chunks:
+                    sys.stdout.buffer.write(chunk)
+                sys.stdout.buffer.flush()
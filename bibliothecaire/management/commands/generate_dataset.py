@@ -0,0 +1,222 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from bibliothecaire import catalogue_items, search, stats
+from bibliothecaire.bulk import bulk_create_media, insert_rows
+from bibliothecaire.catalogue_cache import catalogue_changed
+from bibliothecaire.circulation import LOAN_LIMIT, RESERVATION_LIMIT, reconcile_counters, sweep_overdue_loans
+from bibliothecaire.models import Membre, Media, Livre, Dvd, Cd, JeuDePlateau, Emprunt, Reservation
+
+FIRST_NAMES = ['Alice', 'Bruno', 'Camille', 'David', 'Emma', 'François', 'Gabrielle', 'Hugo', 'Inès', 'Jules',
+               'Léa', 'Louis', 'Manon', 'Nathan', 'Océane', 'Paul', 'Quentin', 'Rose', 'Sarah', 'Théo']
+LAST_NAMES = ['Martin', 'Bernard', 'Dubois', 'Thomas', 'Robert', 'Richard', 'Petit', 'Durand', 'Leroy', 'Moreau',
+              'Simon', 'Laurent', 'Lefebvre', 'Michel', 'Garcia', 'David', 'Bertrand', 'Roux', 'Vincent', 'Fournier']
+TITLE_WORDS = ['le', 'la', 'les', 'nuit', 'jour', 'mer', 'ville', 'secret', 'voyage', 'jardin', 'étoile', 'ombre',
+               'maison', 'forêt', 'rivière', 'montagne', 'histoire', 'silence', 'hiver', 'été', 'chemin', 'lumière',
+               'roi', 'reine', 'enfant', 'dernier', 'premier', 'petit', 'grand', 'rouge', 'bleu', 'noir', 'vent',
+               'feu', 'temps', 'mémoire', 'île', 'port', 'château', 'lettre', 'pierre', 'chanson', 'danse', 'rêve']
+
+# Share of each media type in the generated catalogue
+MEDIA_MIX = [(Livre, 0.6), (Dvd, 0.15), (Cd, 0.15), (JeuDePlateau, 0.1)]
+
+
+def skewed_choice(rng, population, skew):
+    """
+    Pick an element of `population`, favouring the first ones. With skew=1
+    every element is equally likely; higher values concentrate the picks on
+    the head of the list (skew=3 sends about half of the picks to the first
+    12% of the population), like the popularity of a catalogue.
+    """
+    return population[int(len(population) * rng.random() ** skew)]
+
+
+class Command(BaseCommand):
+    help = ("Fill the database with a large synthetic dataset (members, media of the four types, loans and "
+            "reservations) for benchmarks. Loans follow a skewed popularity distribution.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=200000)
+        parser.add_argument('--media', type=int, default=1000000,
+                            help="Number of catalogue items, split between books, DVDs, CDs and board games.")
+        parser.add_argument('--loans', type=int, default=5000000,
+                            help="Number of loans, most of them returned.")
+        parser.add_argument('--reservations', type=int, default=200000)
+        parser.add_argument('--active-loans', type=float, default=0.02,
+                            help="Share of the loans still out, some of them overdue.")
+        parser.add_argument('--skew', type=float, default=3.0,
+                            help="Skew of the popularity of media (1 = uniform).")
+        parser.add_argument('--member-skew', type=float, default=1.5,
+                            help="Skew of the activity of members (1 = uniform).")
+        parser.add_argument('--days', type=int, default=3 * 365, help="Length of the loan history in days.")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Number of rows inserted per transaction.")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the random generator.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive.")
+        if not 0 <= options['active_loans'] <= 1:
+            raise CommandError("--active-loans must be between 0 and 1.")
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.start = time.monotonic()
+
+        member_ids = self.create_members(options['members'])
+        media_ids, jeu_ids = self.create_catalogue(options['media'])
+
+        # Popularity must not follow insertion order
+        self.rng.shuffle(member_ids)
+        self.rng.shuffle(media_ids)
+        self.rng.shuffle(jeu_ids)
+
+        active = round(options['loans'] * options['active_loans'])
+        self.create_loans(member_ids, media_ids, options['loans'] - active, active, options)
+        active = round(options['reservations'] * options['active_loans'])
+        self.create_reservations(member_ids, jeu_ids, options['reservations'] - active, active, options)
+
+        self.report("Reconciling counters")
+        reconcile_counters()
+        catalogue_changed()
+        flagged, _ = sweep_overdue_loans(self.now)
+        # The generated history was inserted in bulk, past the daily statistics
+        stats.rebuild_stats()
+        self.report(f"Done, {flagged} overdue loans", style=self.style.SUCCESS)
+
+    def batches(self, total):
+        for first in range(0, total, self.batch_size):
+            yield first, min(self.batch_size, total - first)
+
+    def create_members(self, count):
+        offset = Membre.objects.aggregate(last=Max('pk'))['last'] or 0
+        for first, size in self.batches(count):
+            insert_rows(Membre, [
+                Membre(name=f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}",
+                       email=f"membre{offset + first + i}@example.com")
+                for i in range(size)
+            ])
+        self.report(f"{count} members")
+        return list(Membre.objects.values_list('pk', flat=True))
+
+    def title(self):
+        return ' '.join(self.rng.choices(TITLE_WORDS, k=self.rng.randint(1, 4))).capitalize()
+
+    def person(self):
+        return f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}"
+
+    def build_item(self, model):
+        if model is JeuDePlateau:
+            return JeuDePlateau(title=self.title(), createur=self.person())
+        fields = {
+            'title': self.title(),
+            'author': self.person(),
+            'publication_date': (self.now - timedelta(days=self.rng.randint(0, 60 * 365))).date(),
+        }
+        if model is Dvd:
+            fields['duration'] = timedelta(minutes=self.rng.randint(70, 180))
+        elif model is Cd:
+            fields['artiste'] = self.person()
+        return model(**fields)
+
+    def create_catalogue(self, count):
+        for model, share in MEDIA_MIX:
+            total = round(count * share)
+            for first, size in self.batches(total):
+                objs = [self.build_item(model) for _ in range(size)]
+                with transaction.atomic():
+                    if model is JeuDePlateau:
+                        JeuDePlateau.objects.bulk_create(objs)
+                        search.index_jeu_range(objs[0].pk, objs[-1].pk)
+                        catalogue_items.index_jeu_range(objs[0].pk, objs[-1].pk)
+                    else:
+                        bulk_create_media(model, objs)
+                        search.index_media_range(objs[0].pk, objs[-1].pk)
+                        catalogue_items.index_media_range(objs[0].pk, objs[-1].pk)
+            self.report(f"{total} {model._meta.model_name}")
+        return (list(Media.objects.values_list('pk', flat=True)),
+                list(JeuDePlateau.objects.values_list('pk', flat=True)))
+
+    def random_past(self, days):
+        return self.now - timedelta(seconds=self.rng.randint(0, days * 86400))
+
+    def pick_member(self, member_ids, per_member, limit, skew):
+        # Give up after a few draws rather than scanning for a member below the limit
+        for _ in range(10):
+            member_id = skewed_choice(self.rng, member_ids, skew)
+            if per_member.get(member_id, 0) < limit:
+                per_member[member_id] = per_member.get(member_id, 0) + 1
+                return member_id
+        return None
+
+    def create_loans(self, member_ids, media_ids, returned, active, options):
+        if not media_ids or not member_ids:
+            return
+        for first, size in self.batches(returned):
+            loans = []
+            for _ in range(size):
+                loan_date = self.random_past(options['days'])
+                loans.append(Emprunt(
+                    media_id=skewed_choice(self.rng, media_ids, options['skew']),
+                    member_id=skewed_choice(self.rng, member_ids, options['member_skew']),
+                    loan_date=loan_date,
+                    return_date=loan_date + timedelta(days=14),
+                    returned=True,
+                    # Most loans come back within the two weeks, some late
+                    returned_at=min(loan_date + timedelta(seconds=self.rng.randint(3600, 18 * 86400)), self.now),
+                ))
+            insert_rows(Emprunt, loans)
+        self.report(f"{returned} returned loans")
+
+        # Loans still out: at most one per media and LOAN_LIMIT per member,
+        # so the counters rebuilt afterwards respect the circulation rules.
+        # Those older than two weeks are overdue.
+        loans = []
+        per_member = {}
+        for media_id in media_ids[:active]:
+            member_id = self.pick_member(member_ids, per_member, LOAN_LIMIT, options['member_skew'])
+            if member_id is None:
+                continue
+            loan_date = self.random_past(30)
+            loans.append(Emprunt(media_id=media_id, member_id=member_id, loan_date=loan_date,
+                                 return_date=loan_date + timedelta(days=14)))
+        insert_rows(Emprunt, loans)
+        self.report(f"{len(loans)} active loans")
+
+    def create_reservations(self, member_ids, jeu_ids, ended, active, options):
+        if not jeu_ids or not member_ids:
+            return
+        for first, size in self.batches(ended):
+            reservations = []
+            for _ in range(size):
+                start = self.random_past(options['days'])
+                reservations.append(Reservation(
+                    jeuDePlateau_id=skewed_choice(self.rng, jeu_ids, options['skew']),
+                    member_id=skewed_choice(self.rng, member_ids, options['member_skew']),
+                    reservation_time=start,
+                    reservation_end=start + timedelta(hours=2),
+                    reserved=False,
+                    ended_at=min(start + timedelta(hours=2), self.now),
+                ))
+            insert_rows(Reservation, reservations)
+        self.report(f"{ended} ended reservations")
+
+        reservations = []
+        per_member = {}
+        for jeu_id in jeu_ids[:active]:
+            member_id = self.pick_member(member_ids, per_member, RESERVATION_LIMIT, options['member_skew'])
+            if member_id is None:
+                continue
+            start = self.now - timedelta(minutes=self.rng.randint(0, 60))
+            reservations.append(Reservation(jeuDePlateau_id=jeu_id, member_id=member_id, reservation_time=start,
+                                            reservation_end=start + timedelta(hours=2)))
+        insert_rows(Reservation, reservations)
+        self.report(f"{len(reservations)} active reservations")
+
+    def report(self, label, style=None):
+        message = f"{label} ({time.monotonic() - self.start:.1f}s)"
+        self.stdout.write(style(message) if style else message)
@@ -0,0 +1,180 @@
+import csv
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_date, parse_duration
+from bibliothecaire import catalogue_items, search
+from bibliothecaire.bulk import bulk_create_media
+from bibliothecaire.catalogue_cache import catalogue_changed
+from bibliothecaire.models import Livre, Dvd, Cd, JeuDePlateau
+
+MEDIA_MODELS = {'livre': Livre, 'dvd': Dvd, 'cd': Cd}
+
+# Availability follows the loans and reservations, which reconcile_counters()
+# recomputes it from: imported items have none, so they are all available
+IGNORED_COLUMNS = ['available']
+
+
+class BadRow(ValueError):
+    pass
+
+
+def required(row, key):
+    value = (row.get(key) or '').strip()
+    if not value:
+        raise BadRow(f"missing '{key}'")
+    if len(value) > 255:
+        raise BadRow(f"'{key}' is longer than 255 characters")
+    return value
+
+
+def build_item(row):
+    """
+    Turn one input row into an unsaved model instance, or raise BadRow.
+    """
+    if not isinstance(row, dict):
+        raise BadRow("not an object")
+    media_type = (row.get('type') or '').strip().lower()
+
+    if media_type == 'jeu':
+        return JeuDePlateau(title=required(row, 'title'), createur=required(row, 'createur'))
+
+    if media_type not in MEDIA_MODELS:
+        raise BadRow(f"unknown type {media_type!r}")
+
+    publication_date = parse_date(required(row, 'publication_date'))
+    if publication_date is None:
+        raise BadRow("invalid 'publication_date'")
+    fields = {
+        'title': required(row, 'title'),
+        'author': required(row, 'author'),
+        'publication_date': publication_date,
+    }
+    if media_type == 'dvd':
+        fields['duration'] = parse_duration(required(row, 'duration'))
+        if fields['duration'] is None:
+            raise BadRow("invalid 'duration'")
+    elif media_type == 'cd':
+        fields['artiste'] = required(row, 'artiste')
+    return MEDIA_MODELS[media_type](**fields)
+
+
+def read_rows(stream, input_format):
+    """
+    Yield (line number, row) pairs from a CSV or JSONL stream, one at a time.
+    Rows that cannot be decoded are yielded as BadRow instances.
+    """
+    if input_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as error:
+                yield line_number, BadRow(f"invalid JSON: {error}")
+
+
+class Command(BaseCommand):
+    help = ("Import catalogue items (livre, dvd, cd, jeu) from a CSV or JSONL file, "
+            "streaming it in chunks of bulk inserts.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' to read standard input.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help="Input format. Guessed from the file extension by default.")
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help="Number of rows inserted per transaction.")
+        parser.add_argument('--progress-every', type=int, default=50000,
+                            help="Report progress every N rows.")
+        parser.add_argument('--max-errors', type=int, default=20,
+                            help="Number of bad rows reported in detail.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        input_format = options['format']
+        if input_format is None:
+            if path.endswith('.csv'):
+                input_format = 'csv'
+            elif path.endswith(('.jsonl', '.ndjson')):
+                input_format = 'jsonl'
+            else:
+                raise CommandError("Cannot guess the input format, use --format.")
+        if path != '-' and not os.path.exists(path):
+            raise CommandError(f"No such file: {path}")
+
+        self.batch_size = options['batch_size']
+        self.max_errors = options['max_errors']
+        self.imported = 0
+        self.bad_rows = 0
+        self.ignored = set()
+        self.start = time.monotonic()
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            rows = read_rows(stream, input_format)
+            next_report = options['progress_every']
+            while True:
+                chunk = list(islice(rows, self.batch_size))
+                if not chunk:
+                    break
+                self.import_chunk(chunk)
+                if self.imported + self.bad_rows >= next_report:
+                    self.report("Progress")
+                    next_report += options['progress_every']
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        self.report("Done", style=self.style.SUCCESS)
+
+    def import_chunk(self, chunk):
+        items = {model: [] for model in (Livre, Dvd, Cd, JeuDePlateau)}
+        for line_number, row in chunk:
+            try:
+                if isinstance(row, BadRow):
+                    raise row
+                item = build_item(row)
+                self.warn_ignored(row)
+            except BadRow as error:
+                self.bad_rows += 1
+                if self.bad_rows <= self.max_errors:
+                    self.stderr.write(f"Line {line_number}: {error}")
+                continue
+            items[type(item)].append(item)
+
+        with transaction.atomic():
+            for model, objs in items.items():
+                if not objs:
+                    continue
+                if model is JeuDePlateau:
+                    JeuDePlateau.objects.bulk_create(objs)
+                    search.index_jeu_range(min(obj.pk for obj in objs), max(obj.pk for obj in objs))
+                    catalogue_items.index_jeu_range(min(obj.pk for obj in objs), max(obj.pk for obj in objs))
+                else:
+                    bulk_create_media(model, objs)
+                    search.index_media_range(min(obj.pk for obj in objs), max(obj.pk for obj in objs))
+                    catalogue_items.index_media_range(min(obj.pk for obj in objs), max(obj.pk for obj in objs))
+                self.imported += len(objs)
+            catalogue_changed()
+
+    def warn_ignored(self, row):
+        for column in IGNORED_COLUMNS:
+            if column in row and column not in self.ignored:
+                self.ignored.add(column)
+                self.stderr.write(f"Column '{column}' ignored: availability follows the loans and reservations.")
+
+    def report(self, label, style=None):
+        elapsed = time.monotonic() - self.start
+        rate = self.imported / elapsed if elapsed else 0
+        message = (f"{label}: {self.imported} rows imported, {self.bad_rows} bad rows, "
+                   f"{elapsed:.1f}s, {rate:.0f} rows/s")
+        self.stdout.write(style(message) if style else message)
@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from bibliothecaire.benchmark import BenchmarkError
+from bibliothecaire.load_test import PROFILES, run_load_test
+
+
+class Command(BaseCommand):
+    help = ("Measure read and write throughput with concurrent catalogue reads and checkouts, with SQLite's "
+            "default profile and with the profile of the current settings. Writes to the database: run it "
+            "against a copy.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds each profile runs for.")
+        parser.add_argument('--readers', type=int, default=8, help="Number of reader threads.")
+        parser.add_argument('--writers', type=int, default=2, help="Number of writer threads.")
+        parser.add_argument('--profile', action='append', dest='profiles', choices=PROFILES,
+                            help="Only run this profile. Can be repeated.")
+        parser.add_argument('--output', '-o', help="Write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        if options['duration'] <= 0 or options['readers'] < 0 or options['writers'] < 0:
+            raise CommandError("--duration must be positive, and --readers and --writers not negative.")
+
+        try:
+            results = run_load_test(options['duration'], options['readers'], options['writers'],
+                                    options['profiles'])
+        except BenchmarkError as error:
+            raise CommandError(error)
+
+        for result in results:
+            self.stdout.write(
+                f"{result['profile']:<10} journal={result['journal_mode']:<6} conn_max_age={result['conn_max_age']:<4} "
+                f"reads {result['reads_per_s']:>8.1f}/s (p95 {result.get('read_p95_ms', 0):>8.2f} ms, "
+                f"{result['read_errors']} errors)  "
+                f"writes {result['writes_per_s']:>7.1f}/s (p95 {result.get('write_p95_ms', 0):>8.2f} ms, "
+                f"{result['write_errors']} errors, {result['write_conflicts']} conflicts)"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
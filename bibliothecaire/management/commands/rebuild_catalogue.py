@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from bibliothecaire.catalogue_cache import catalogue_changed
+from bibliothecaire.catalogue_items import rebuild_catalogue_items
+
+
+class Command(BaseCommand):
+    help = "Rebuild the flattened catalogue items from the media and board game tables in bulk."
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        with transaction.atomic():
+            count = rebuild_catalogue_items()
+            catalogue_changed()
+        self.stdout.write(self.style.SUCCESS(
+            f"Copied {count} catalogue items in {time.monotonic() - start:.2f}s."
+        ))
@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+from bibliothecaire.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = ("Recompute the daily circulation statistics from the live and archived loans and reservations, "
+            "for instance after a bulk import.")
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        count = rebuild_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Computed {count} daily statistics in {time.monotonic() - start:.2f}s."
+        ))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from bibliothecaire import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of the catalogue in bulk."
+
+    def handle(self, *args, **options):
+        if not search.search_available():
+            raise CommandError("The catalogue search requires the SQLite backend.")
+
+        start = time.monotonic()
+        with transaction.atomic():
+            count = search.rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {count} catalogue items in {time.monotonic() - start:.2f}s."
+        ))
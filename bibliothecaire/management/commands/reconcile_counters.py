@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from bibliothecaire.circulation import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = ("Recompute members' loan, reservation and overdue counters and the availability of media and games "
+            "from the loans and reservations.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report the drift without fixing it.")
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        changes = reconcile_counters(dry_run=options['dry_run'])
+        verb = "would be fixed" if options['dry_run'] else "fixed"
+        for name, count in changes.items():
+            self.stdout.write(f"{name}: {count} rows {verb}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{sum(changes.values())} rows {verb} in {time.monotonic() - start:.2f}s."
+        ))
@@ -0,0 +1,67 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from bibliothecaire import benchmark
+
+
+class Command(BaseCommand):
+    help = ("Request every page of the application against the current database and record latency percentiles, "
+            "SQL query counts and peak memory as JSON, optionally compared with a previous run.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help="Number of timed requests per scenario.")
+        parser.add_argument('--scenario', action='append', dest='scenarios', metavar='NAME',
+                            help="Only run this scenario. Can be repeated.")
+        parser.add_argument('--list', action='store_true', help="List the scenarios and exit.")
+        parser.add_argument('--output', '-o', help="Write the results to this JSON file.")
+        parser.add_argument('--compare', metavar='BASELINE',
+                            help="JSON results of a previous run to compare with.")
+        parser.add_argument('--threshold', type=float, default=benchmark.DEFAULT_THRESHOLD,
+                            help="Slowdown ratio reported as a regression (0.2 = 20%%).")
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help="Exit with an error when a regression is found.")
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for scenario in benchmark.SCENARIOS:
+                self.stdout.write(f"{scenario.name}: {scenario.method} {scenario.url}")
+            return
+        if options['iterations'] < 1:
+            raise CommandError("--iterations must be positive.")
+
+        baseline = None
+        if options['compare']:
+            try:
+                baseline = benchmark.load_results(options['compare'])
+            except (OSError, ValueError) as error:
+                raise CommandError(f"Cannot read {options['compare']}: {error}")
+
+        try:
+            results = benchmark.run_benchmarks(options['iterations'], options['scenarios'], progress=self.progress)
+        except benchmark.BenchmarkError as error:
+            raise CommandError(error)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            regressions = self.compare(baseline, results, options['threshold'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"{regressions} regressions found.")
+
+    def progress(self, name, result):
+        self.stdout.write(f"{name:<32} p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+                          f"{result['queries']:>4} queries  {result['peak_memory_kb']:>9.1f} KiB")
+
+    def compare(self, baseline, results, threshold):
+        self.stdout.write(f"Compared with {baseline.get('commit') or 'baseline'}:")
+        regressions = 0
+        for name, metric, old, new, regression in benchmark.compare_results(baseline, results, threshold):
+            if regression:
+                regressions += 1
+                self.stdout.write(self.style.ERROR(f"  {name} {metric}: {old} -> {new}"))
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS("  No regression."))
+        return regressions
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from bibliothecaire.circulation import sweep_overdue_loans
+
+
+class Command(BaseCommand):
+    help = "Flag unreturned loans past their return date as overdue and refresh members' overdue counts."
+
+    def handle(self, *args, **options):
+        flagged, cleared = sweep_overdue_loans()
+        self.stdout.write(self.style.SUCCESS(f"{flagged} loans flagged as overdue, {cleared} unflagged."))
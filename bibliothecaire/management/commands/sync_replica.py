@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from bibliothecaire.replica import ReplicaError, sync_replica
+
+
+class Command(BaseCommand):
+    help = "Copy the primary database into the read replica with SQLite's online backup API."
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        try:
+            pages = sync_replica()
+        except ReplicaError as error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(
+            f"Copied {pages} pages to the replica in {time.monotonic() - start:.2f}s."
+        ))
@@ -0,0 +1,93 @@
+# Generated by Django 5.0.7 on 2026-10-18 20:22
+
+import bibliothecaire.models
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Media',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('author', models.CharField(max_length=255)),
+                ('publication_date', models.DateField()),
+                ('available', models.BooleanField(default=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='JeuDePlateau',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('createur', models.CharField(max_length=255)),
+                ('available', models.BooleanField(default=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Cd',
+            fields=[
+                ('media_ptr', models.OneToOneField(auto_created=True, on_delete=django.db.models.deletion.CASCADE, parent_link=True, primary_key=True, serialize=False, to='bibliothecaire.media')),
+                ('artiste', models.CharField(max_length=255)),
+            ],
+            bases=('bibliothecaire.media',),
+        ),
+        migrations.CreateModel(
+            name='Dvd',
+            fields=[
+                ('media_ptr', models.OneToOneField(auto_created=True, on_delete=django.db.models.deletion.CASCADE, parent_link=True, primary_key=True, serialize=False, to='bibliothecaire.media')),
+                ('duration', models.DurationField()),
+            ],
+            bases=('bibliothecaire.media',),
+        ),
+        migrations.CreateModel(
+            name='Livre',
+            fields=[
+                ('media_ptr', models.OneToOneField(auto_created=True, on_delete=django.db.models.deletion.CASCADE, parent_link=True, primary_key=True, serialize=False, to='bibliothecaire.media')),
+            ],
+            bases=('bibliothecaire.media',),
+        ),
+        migrations.CreateModel(
+            name='Membre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('active_loans', models.IntegerField(default=0)),
+                ('active_reservation', models.IntegerField(default=0)),
+                ('overdue_loans', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Emprunt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('loan_date', models.DateTimeField(default=django.utils.timezone.now)),
+                ('return_date', models.DateTimeField(default=bibliothecaire.models.default_return_date)),
+                ('returned', models.BooleanField(default=False)),
+                ('overdue', models.BooleanField(default=False)),
+                ('media', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bibliothecaire.media')),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bibliothecaire.membre')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reservation_time', models.DateTimeField(default=django.utils.timezone.now)),
+                ('reservation_end', models.DateTimeField(default=bibliothecaire.models.default_reservation_end)),
+                ('reserved', models.BooleanField(default=True)),
+                ('jeuDePlateau', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bibliothecaire.jeudeplateau')),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bibliothecaire.membre')),
+            ],
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.0.7 on 2026-10-18 20:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliothecaire', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emprunt',
+            index=models.Index(fields=['member', 'returned', 'return_date'], name='emprunt_member_overdue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emprunt',
+            index=models.Index(condition=models.Q(('returned', False)), fields=['return_date'], name='emprunt_sweep_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emprunt',
+            index=models.Index(condition=models.Q(('overdue', True)), fields=['return_date', 'id'], name='emprunt_overdue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='jeudeplateau',
+            index=models.Index(fields=['title', 'id'], name='jeu_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='jeudeplateau',
+            index=models.Index(condition=models.Q(('available', True)), fields=['title', 'id'], name='jeu_available_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='media',
+            index=models.Index(fields=['title', 'id'], name='media_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='media',
+            index=models.Index(condition=models.Q(('available', True)), fields=['title', 'id'], name='media_available_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='membre',
+            index=models.Index(condition=models.Q(('overdue_loans__gt', 0)), fields=['overdue_loans'], name='membre_overdue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['member', 'reserved'], name='reservation_member_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(condition=models.Q(('reserved', True)), fields=['reservation_end'], name='reservation_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.7 on 2026-10-18 21:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliothecaire', '0003_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='jeudeplateau',
+            index=models.Index(fields=['createur', 'title', 'id'], name='jeu_createur_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='media',
+            index=models.Index(fields=['author', 'title', 'id'], name='media_author_title_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.0.7 on 2026-10-18 21:27
+
+from django.db import migrations, models
+
+
+def fill_catalogue_items(apps, schema_editor):
+    # Same copy as bibliothecaire.catalogue_items.rebuild_catalogue_items(),
+    # written out so the migration does not depend on the current code
+    columns = 'kind, object_id, title, creator, available, artiste, duration, updated_at'
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO bibliothecaire_catalogueitem ({columns}) "
+            "SELECT CASE WHEN l.media_ptr_id IS NOT NULL THEN 'livre' "
+            "WHEN d.media_ptr_id IS NOT NULL THEN 'dvd' ELSE 'cd' END, "
+            "m.id, m.title, m.author, m.available, COALESCE(c.artiste, ''), d.duration, m.updated_at "
+            "FROM bibliothecaire_media m "
+            "LEFT JOIN bibliothecaire_livre l ON l.media_ptr_id = m.id "
+            "LEFT JOIN bibliothecaire_dvd d ON d.media_ptr_id = m.id "
+            "LEFT JOIN bibliothecaire_cd c ON c.media_ptr_id = m.id "
+            "WHERE COALESCE(l.media_ptr_id, d.media_ptr_id, c.media_ptr_id) IS NOT NULL"
+        )
+        cursor.execute(
+            f"INSERT INTO bibliothecaire_catalogueitem ({columns}) "
+            "SELECT 'jeu', j.id, j.title, j.createur, j.available, '', NULL, j.updated_at "
+            "FROM bibliothecaire_jeudeplateau j"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliothecaire', '0004_author_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=5)),
+                ('object_id', models.BigIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('creator', models.CharField(max_length=255)),
+                ('available', models.BooleanField(default=True)),
+                ('artiste', models.CharField(blank=True, default='', max_length=255)),
+                ('duration', models.DurationField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['title', 'kind', 'object_id'], name='item_title_idx'), models.Index(condition=models.Q(('available', True)), fields=['title', 'kind', 'object_id'], name='item_available_title_idx'), models.Index(fields=['kind', 'title', 'object_id'], name='item_kind_title_idx'), models.Index(condition=models.Q(('available', True)), fields=['kind', 'title', 'object_id'], name='item_kind_available_title_idx'), models.Index(fields=['creator', 'title', 'kind', 'object_id'], name='item_creator_title_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='catalogueitem',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='catalogue_item_unique'),
+        ),
+        migrations.RunPython(fill_catalogue_items, migrations.RunPython.noop),
+    ]
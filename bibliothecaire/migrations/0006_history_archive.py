@@ -0,0 +1,45 @@
+# Generated by Django 5.0.7 on 2026-10-18 21:32
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliothecaire', '0005_catalogue_item'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmpruntArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('loan_date', models.DateTimeField()),
+                ('return_date', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('media', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bibliothecaire.media')),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bibliothecaire.membre')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['member', 'loan_date', 'id'], name='emprunt_archive_member_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ReservationArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('reservation_time', models.DateTimeField()),
+                ('reservation_end', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('jeuDePlateau', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bibliothecaire.jeudeplateau')),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bibliothecaire.membre')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['member', 'reservation_time', 'id'], name='reservation_archive_member_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.7 on 2026-10-18 21:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliothecaire', '0006_history_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CirculationDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('kind', models.CharField(max_length=5)),
+                ('checkouts', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('overdue', models.PositiveIntegerField(default=0)),
+                ('reservations', models.PositiveIntegerField(default=0)),
+                ('reservations_ended', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='circulationdailystat',
+            constraint=models.UniqueConstraint(fields=('day', 'kind'), name='circulation_stat_unique'),
+        ),
+    ]
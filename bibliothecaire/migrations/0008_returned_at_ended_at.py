@@ -0,0 +1,71 @@
+# Generated by Django 5.0.7 on 2026-10-18 23:12
+
+from django.db import migrations, models
+from django.db.models.functions import Least
+
+
+def fill_finished_at(apps, schema_editor):
+    # The actual time of past returns and ends is unknown: take the return
+    # date or reservation end, or the last change of the row when earlier,
+    # for loans returned and reservations ended early
+    finished = [
+        ('Emprunt', {'returned': True}, 'returned_at', 'return_date'),
+        ('EmpruntArchive', {}, 'returned_at', 'return_date'),
+        ('Reservation', {'reserved': False}, 'ended_at', 'reservation_end'),
+        ('ReservationArchive', {}, 'ended_at', 'reservation_end'),
+    ]
+    for model_name, condition, field, planned in finished:
+        model = apps.get_model('bibliothecaire', model_name)
+        model.objects.filter(**condition, **{f'{field}__isnull': True}).update(
+            **{field: Least(planned, 'updated_at')})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliothecaire', '0007_circulation_daily_stat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emprunt',
+            name='returned_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='ended_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='empruntarchive',
+            name='returned_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='reservationarchive',
+            name='ended_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(fill_finished_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='empruntarchive',
+            name='returned_at',
+            field=models.DateTimeField(),
+        ),
+        migrations.AlterField(
+            model_name='reservationarchive',
+            name='ended_at',
+            field=models.DateTimeField(),
+        ),
+        migrations.AddIndex(
+            model_name='emprunt',
+            index=models.Index(condition=models.Q(('returned', True)), fields=['returned_at'],
+                               name='emprunt_returned_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(condition=models.Q(('reserved', False)), fields=['ended_at'],
+                               name='reservation_ended_idx'),
+        ),
+    ]
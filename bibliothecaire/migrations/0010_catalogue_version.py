@@ -0,0 +1,27 @@
+# Generated by Django 5.0.7 on 2026-10-18 22:25
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def create_catalogue_version(apps, schema_editor):
+    apps.get_model('bibliothecaire', 'CatalogueVersion').objects.create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliothecaire', '0009_scheduled_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(create_catalogue_version, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,48 @@
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models import Q
 from django.utils import timezone
 from datetime import timedelta
 
 
+class TrackedQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # UPDATE statements bypass save() and auto_now, so they stamp the
+        # rows they change themselves
+        kwargs.setdefault('updated_at', timezone.now())
+        return super().update(**kwargs)
+
+
+def atomic_save(instance, save, *args, **kwargs):
+    # The post_save signals copy catalogue rows to CatalogueItem and to the
+    # search index (see signals.py). Django sends them after the transaction
+    # of the save, so the save opens one around both.
+    using = kwargs.get('using') or router.db_for_write(type(instance), instance=instance)
+    with transaction.atomic(using=using):
+        save(*args, **kwargs)
+
+
 # Base class for all media types
 class Media(models.Model):
     title = models.CharField(max_length=255)
     author = models.CharField(max_length=255)
     publication_date = models.DateField()
     available = models.BooleanField(default=True)
+    # Time of the last change, used to answer conditional requests
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = TrackedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Catalogue listing, in (title, id) order
+            models.Index(fields=['title', 'id'], name='media_title_idx'),
+            models.Index(fields=['title', 'id'], condition=Q(available=True), name='media_available_title_idx'),
+            # Catalogue filtered by author
+            models.Index(fields=['author', 'title', 'id'], name='media_author_title_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        atomic_save(self, super().save, *args, **kwargs)
 
     def __str__(self):
         return f"{self.title} by {self.author}"
@@ -32,67 +66,219 @@ class JeuDePlateau(models.Model):
     title = models.CharField(max_length=255)
     createur = models.CharField(max_length=255)
     available = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = TrackedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['title', 'id'], name='jeu_title_idx'),
+            models.Index(fields=['title', 'id'], condition=Q(available=True), name='jeu_available_title_idx'),
+            models.Index(fields=['createur', 'title', 'id'], name='jeu_createur_title_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        atomic_save(self, super().save, *args, **kwargs)
 
     def __str__(self):
         return self.title
 
 
+class CatalogueItemQuerySet(TrackedQuerySet):
+    def of_media(self, ids):
+        return self.filter(kind__in=CatalogueItem.MEDIA_KINDS, object_id__in=ids)
+
+    def of_games(self, ids):
+        return self.filter(kind='jeu', object_id__in=ids)
+
+
+# Flattened copy of the catalogue: one row per book, DVD, CD or game, so that
+# listings, search and availability checks read a single table rather than
+# joining Media to its subtypes and querying JeuDePlateau apart. Kept in sync
+# on every write, see bibliothecaire/catalogue_items.py.
+class CatalogueItem(models.Model):
+    MEDIA_KINDS = ['cd', 'dvd', 'livre']
+
+    kind = models.CharField(max_length=5)
+    # Primary key of the Media or of the JeuDePlateau, whose ids overlap
+    object_id = models.BigIntegerField()
+    title = models.CharField(max_length=255)
+    # Author, or creator of a game
+    creator = models.CharField(max_length=255)
+    available = models.BooleanField(default=True)
+    artiste = models.CharField(max_length=255, blank=True, default='')
+    duration = models.DurationField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = CatalogueItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='catalogue_item_unique'),
+        ]
+        indexes = [
+            # Catalogue listing, in (title, type, id) order
+            models.Index(fields=['title', 'kind', 'object_id'], name='item_title_idx'),
+            models.Index(fields=['title', 'kind', 'object_id'], condition=Q(available=True),
+                         name='item_available_title_idx'),
+            # Listing of one type
+            models.Index(fields=['kind', 'title', 'object_id'], name='item_kind_title_idx'),
+            models.Index(fields=['kind', 'title', 'object_id'], condition=Q(available=True),
+                         name='item_kind_available_title_idx'),
+            # Catalogue filtered by author
+            models.Index(fields=['creator', 'title', 'kind', 'object_id'], name='item_creator_title_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}: {self.title}"
+
+
 # Membre class
 class Membre(models.Model):
     name = models.CharField(max_length=255)
     email = models.EmailField(unique=True)
     active_loans = models.IntegerField(default=0)
     active_reservation = models.IntegerField(default=0)
+    overdue_loans = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['overdue_loans'], condition=Q(overdue_loans__gt=0), name='membre_overdue_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+def default_return_date():
+    return timezone.now() + timedelta(days=7)
+
+
+def default_reservation_end():
+    return timezone.now() + timedelta(hours=2)
+
+
+class EmpruntQuerySet(TrackedQuerySet):
+    def overdue(self, now=None):
+        # Unreturned loans past their return date
+        return self.filter(returned=False, return_date__lt=now or timezone.now())
+
+
 class Emprunt(models.Model):
     media = models.ForeignKey(Media, on_delete=models.CASCADE)
     member = models.ForeignKey(Membre, on_delete=models.CASCADE)
     loan_date = models.DateTimeField(default=timezone.now)
-    return_date = models.DateTimeField(default=timezone.now() + timedelta(days=7))
+    return_date = models.DateTimeField(default=default_return_date)
     returned = models.BooleanField(default=False)
+    # Set when the loan is returned
+    returned_at = models.DateTimeField(null=True, blank=True)
+    # Set by the overdue sweeper, cleared when the loan is returned
+    overdue = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
-    def save_emprunt(self, *args, **kwargs):
-        # Update the availability of the media
-        if not self.returned:
-            self.media.available = False
-        else:
-            self.media.available = True
-        self.media.save()
+    objects = EmpruntQuerySet.as_manager()
 
-        # Update member's active loans count
-        if not self.returned and self.member.active_loans < 3:
-            self.member.active_loans += 1
-        elif self.returned and self.member.active_loans > 0:
-            self.member.active_loans -= 1
-        self.member.save()
-
-        super().save(*args, **kwargs)
+    class Meta:
+        indexes = [
+            models.Index(fields=['member', 'returned', 'return_date'], name='emprunt_member_overdue_idx'),
+            # Overdue sweeper and overdue loans listing
+            models.Index(fields=['return_date'], condition=Q(returned=False), name='emprunt_sweep_idx'),
+            models.Index(fields=['return_date', 'id'], condition=Q(overdue=True), name='emprunt_overdue_idx'),
+            # History archiving
+            models.Index(fields=['returned_at'], condition=Q(returned=True), name='emprunt_returned_idx'),
+        ]
 
 
 class Reservation(models.Model):
     jeuDePlateau = models.ForeignKey(JeuDePlateau, on_delete=models.CASCADE)
     member = models.ForeignKey(Membre, on_delete=models.CASCADE)
     reservation_time = models.DateTimeField(default=timezone.now)
-    reservation_end = models.DateTimeField(default=timezone.now() + timedelta(hours=2))
+    reservation_end = models.DateTimeField(default=default_reservation_end)
     reserved = models.BooleanField(default=True)
+    # Set when the reservation is ended or expires
+    ended_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = TrackedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['member', 'reserved'], name='reservation_member_idx'),
+            models.Index(fields=['reservation_end'], condition=Q(reserved=True), name='reservation_expiry_idx'),
+            # History archiving
+            models.Index(fields=['ended_at'], condition=Q(reserved=False), name='reservation_ended_idx'),
+        ]
+
+
+# Returned loans and ended reservations moved out of the live tables once old
+# enough, see bibliothecaire/archive.py. They keep their id.
+class EmpruntArchive(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    media = models.ForeignKey(Media, on_delete=models.CASCADE)
+    member = models.ForeignKey(Membre, on_delete=models.CASCADE)
+    loan_date = models.DateTimeField()
+    return_date = models.DateTimeField()
+    returned_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['member', 'loan_date', 'id'], name='emprunt_archive_member_idx'),
+        ]
+
+
+class ReservationArchive(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    jeuDePlateau = models.ForeignKey(JeuDePlateau, on_delete=models.CASCADE)
+    member = models.ForeignKey(Membre, on_delete=models.CASCADE)
+    reservation_time = models.DateTimeField()
+    reservation_end = models.DateTimeField()
+    ended_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['member', 'reservation_time', 'id'], name='reservation_archive_member_idx'),
+        ]
+
+
+# Circulation counts per day and catalogue type, added to by the circulation
+# operations as they happen, see bibliothecaire/stats.py
+class CirculationDailyStat(models.Model):
+    day = models.DateField()
+    # Catalogue type: livre, dvd, cd or jeu
+    kind = models.CharField(max_length=5)
+    checkouts = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    # Loans that fell overdue, counted on their return date
+    overdue = models.PositiveIntegerField(default=0)
+    reservations = models.PositiveIntegerField(default=0)
+    reservations_ended = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'kind'], name='circulation_stat_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.kind}"
+
+
+# Last run of each periodic job, claimed by the server process that runs it,
+# see bibliothecaire/scheduler.py
+class ScheduledJob(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    last_run = models.DateTimeField()
+
+    def __str__(self):
+        return self.name
+
 
-    def save_reservation(self, *args, **kwargs):
-        # Update the availability of the game
-        if self.reserved:
-            self.jeuDePlateau.available = False
-        else:
-            self.jeuDePlateau.available = True
-        self.jeuDePlateau.save()
-
-        # Update member's active reservation count
-        if self.reserved and self.member.active_reservation < 1:
-            self.member.active_reservation += 1
-        elif not self.reserved and self.member.active_reservation > 0:
-            self.member.active_reservation -= 1
-        self.member.save()
-
-        super().save(*args, **kwargs)
+# Version and time of the last change of the catalogue, in a single row that
+# every change bumps within its own transaction, see
+# bibliothecaire/catalogue_cache.py
+class CatalogueVersion(models.Model):
+    version = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
@@ -0,0 +1,157 @@
+"""
+Read-only traffic on a copy of the database.
+
+When a `replica` database is configured (see DJANGO_REPLICA_DB_PATH in
+settings.py), the views and commands that only read the catalogue or report
+on it (public catalogue and search, the JSON API, exports, the overdue
+report) send the queries on the models of this app to the replica, and
+leave the primary file to circulation. Every other view reads from the
+primary, so the circulation views see their own writes.
+
+The replica is a second SQLite file refreshed from the primary with SQLite's
+online backup API, by `manage.py sync_replica` or every
+REPLICA_SYNC_INTERVAL seconds. Pages read from it lag behind the primary by
+up to that interval. The catalogue version is copied with the rest, so the
+catalogue pages are cached under the version of the data they show.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = 'replica'
+
+# Only the catalogue and circulation models are read from the replica: users
+# and sessions change on login, and must be read from where they are written.
+REPLICATED_APPS = {'bibliothecaire'}
+
+
+class ReplicaError(Exception):
+    pass
+
+
+class ReplicaScope:
+    def __init__(self):
+        # Set by the first write, after which reads go back to the primary
+        self.pinned = False
+
+
+_scope = ContextVar('replica_scope', default=None)
+
+
+def replica_configured():
+    return REPLICA in connections.settings
+
+
+@contextmanager
+def reading_from_replica():
+    """
+    Send the reads made in this block to the replica, until a write is made.
+    """
+    token = _scope.set(ReplicaScope())
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def _iterate_on_replica(iterator, scope):
+    # The content of a streaming response is read after the view returned,
+    # each chunk is produced within the view's scope
+    iterator = iter(iterator)
+    while True:
+        token = _scope.set(scope)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _scope.reset(token)
+        yield chunk
+
+
+def _on_replica(response, scope):
+    if response.streaming and not response.is_async:
+        response.streaming_content = _iterate_on_replica(response.streaming_content, scope)
+    return response
+
+
+def replica_reads(view):
+    """
+    Run a view, sync or async, with its reads sent to the replica, including
+    those made while its streaming response is sent.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_view(request, *args, **kwargs):
+            with reading_from_replica():
+                scope = _scope.get()
+                response = await view(request, *args, **kwargs)
+            return _on_replica(response, scope)
+        return async_view
+
+    @wraps(view)
+    def sync_view(request, *args, **kwargs):
+        with reading_from_replica():
+            scope = _scope.get()
+            response = view(request, *args, **kwargs)
+        return _on_replica(response, scope)
+    return sync_view
+
+
+class ReplicaRouter:
+    """
+    Send the reads on the models of REPLICATED_APPS made within
+    reading_from_replica() to the replica, and every write to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        scope = _scope.get()
+        if (scope is None or scope.pinned or model._meta.app_label not in REPLICATED_APPS
+                or not replica_configured()):
+            return None
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        scope = _scope.get()
+        if scope is not None and model._meta.app_label in REPLICATED_APPS:
+            scope.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both databases hold the same rows
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPLICA}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # The replica gets its schema with its data, from the primary
+        if db == REPLICA:
+            return False
+        return None
+
+
+def sync_replica():
+    """
+    Copy the primary database into the replica with SQLite's online backup
+    API, in one step so the replica is a consistent snapshot. Readers of the
+    replica wait for the copy to end. Returns the number of pages copied.
+    """
+    if not replica_configured():
+        raise ReplicaError("No replica database is configured, set DJANGO_REPLICA_DB_PATH.")
+    primary, replica = connections[DEFAULT_DB_ALIAS], connections[REPLICA]
+    if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+        raise ReplicaError("The replica can only be synced between SQLite databases.")
+
+    primary.ensure_connection()
+    replica.ensure_connection()
+    pages = 0
+
+    def progress(status, remaining, total):
+        nonlocal pages
+        pages = total
+
+    primary.connection.backup(replica.connection, progress=progress)
+    return pages
@@ -0,0 +1,73 @@
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from bibliothecaire.models import ScheduledJob
+
+logger = logging.getLogger('bibliothecaire')
+
+# Periodic jobs that can run inside the web server process: the setting
+# holding the interval in seconds (None disables the job) and the job itself.
+JOBS = [
+    ('OVERDUE_SWEEP_INTERVAL', 'bibliothecaire.circulation.sweep_overdue_loans'),
+    ('RESERVATION_EXPIRY_INTERVAL', 'bibliothecaire.circulation.expire_reservations'),
+    ('REPLICA_SYNC_INTERVAL', 'bibliothecaire.replica.sync_replica'),
+    ('HISTORY_ARCHIVE_INTERVAL', 'bibliothecaire.archive.archive_history'),
+]
+
+# Each server process checks for due jobs this many times per interval, so a
+# job runs at most a tenth of its interval late
+CHECKS_PER_INTERVAL = 10
+
+_started = set()
+_stop = threading.Event()
+
+
+def claim_run(name, interval, now=None):
+    """
+    Claim the run of job `name` due every `interval` seconds, with a
+    conditional UPDATE: of all the server processes checking at the same
+    time, only one gets True, and none does again before `interval` passed.
+    """
+    now = now or timezone.now()
+    due = now - timedelta(seconds=interval)
+    ScheduledJob.objects.get_or_create(name=name, defaults={'last_run': due})
+    return bool(ScheduledJob.objects.filter(name=name, last_run__lte=due).update(last_run=now))
+
+
+def run_periodically(name, interval, job):
+    while not _stop.wait(interval / CHECKS_PER_INTERVAL):
+        try:
+            if claim_run(name, interval):
+                job()
+        except Exception:
+            logger.exception("Scheduled job %s failed.", name)
+        finally:
+            # Each run gets fresh connections, as request threads do
+            connections.close_all()
+
+
+def start_scheduled_jobs():
+    """
+    Start a daemon thread for every job whose interval is configured. Safe to
+    call several times: a job is only started once per process. Every server
+    process starts them, and claim_run() lets one of them run each job per
+    interval.
+    """
+    for setting, path in JOBS:
+        interval = getattr(settings, setting, None)
+        if not interval or path in _started:
+            continue
+        _started.add(path)
+        thread = threading.Thread(target=run_periodically, args=(path, interval, import_string(path)),
+                                  name=f"scheduler:{path}", daemon=True)
+        thread.start()
+        logger.info("Scheduled %s every %s seconds.", path, interval)
+
+
+def stop_scheduled_jobs():
+    _stop.set()
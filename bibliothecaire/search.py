@@ -0,0 +1,267 @@
+from django.db import connection, connections, router
+from django.utils.functional import SimpleLazyObject
+from bibliothecaire.models import CatalogueItem, Media, Livre, Dvd, Cd, JeuDePlateau
+
+# Number of results shown on one page of search results
+SEARCH_PAGE_SIZE = 20
+
+# Largest number of matches ranked by relevance. bm25 is computed for every
+# match, so broader searches list their matches in catalogue order instead,
+# which only reads the rows up to the requested page.
+RANKED_SEARCH_LIMIT = 2000
+
+# Terms shorter than this match whole words only: as prefixes, they would
+# match a large part of the catalogue
+MIN_PREFIX_LENGTH = 3
+
+SEARCH_TABLE = 'bibliothecaire_search'
+
+# Prefix indexes of 2 and 3 characters answer the short prefix queries
+# without scanning every term they expand to
+SEARCH_TABLE_DEFINITION = (
+    "fts5(kind UNINDEXED, object_id UNINDEXED, title, author, artiste, createur, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+MEDIA_KINDS = {Livre: 'livre', Dvd: 'dvd', Cd: 'cd'}
+
+
+# Media and board games live in two tables whose ids overlap, so each of them
+# gets its own half of the FTS rowid space: even rowids for Media, odd ones
+# for JeuDePlateau. This keeps incremental updates a primary key lookup.
+def media_rowid(pk):
+    return pk * 2
+
+
+def jeu_rowid(pk):
+    return pk * 2 + 1
+
+
+def search_available():
+    return connection.vendor == 'sqlite'
+
+
+def recreate_search_table(cursor):
+    cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+    cursor.execute(f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING {SEARCH_TABLE_DEFINITION}")
+
+
+def create_search_table():
+    """
+    Create the FTS5 table used by the catalogue search if it does not exist.
+    A table created with an older definition is recreated and filled again.
+    """
+    if not search_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sql FROM sqlite_master WHERE name = %s", [SEARCH_TABLE])
+        row = cursor.fetchone()
+        if row and row[0].endswith(SEARCH_TABLE_DEFINITION):
+            return
+        recreate_search_table(cursor)
+    if row:
+        index_media_range()
+        index_jeu_range()
+
+
+def index_media(media, kind):
+    if not search_available():
+        return
+    artiste = getattr(media, 'artiste', '')
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [media_rowid(media.pk)])
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, kind, object_id, title, author, artiste, createur) "
+            "VALUES (%s, %s, %s, %s, %s, %s, '')",
+            [media_rowid(media.pk), kind, media.pk, media.title, media.author, artiste]
+        )
+
+
+def update_media_titles(media):
+    """
+    Refresh the columns owned by the Media parent table, for saves made
+    through a bare Media instance whose concrete type is not known.
+    """
+    if not search_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {SEARCH_TABLE} SET title = %s, author = %s WHERE rowid = %s",
+            [media.title, media.author, media_rowid(media.pk)]
+        )
+
+
+def index_jeu(jeu):
+    if not search_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [jeu_rowid(jeu.pk)])
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, kind, object_id, title, author, artiste, createur) "
+            "VALUES (%s, 'jeu', %s, %s, '', '', %s)",
+            [jeu_rowid(jeu.pk), jeu.pk, jeu.title, jeu.createur]
+        )
+
+
+def unindex(rowid):
+    if not search_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [rowid])
+
+
+def index_media_range(first_id=None, last_id=None):
+    """
+    Index every Media row, or only those whose id is within the given bounds,
+    with a single INSERT ... SELECT.
+    """
+    if not search_available():
+        return
+    where, params = '', []
+    if first_id is not None and last_id is not None:
+        where, params = 'WHERE m.id BETWEEN %s AND %s', [first_id, last_id]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, kind, object_id, title, author, artiste, createur) "
+            f"SELECT m.id * 2, "
+            f"CASE WHEN l.media_ptr_id IS NOT NULL THEN 'livre' "
+            f"WHEN d.media_ptr_id IS NOT NULL THEN 'dvd' "
+            f"WHEN c.media_ptr_id IS NOT NULL THEN 'cd' ELSE 'media' END, "
+            f"m.id, m.title, m.author, COALESCE(c.artiste, ''), '' "
+            f"FROM {Media._meta.db_table} m "
+            f"LEFT JOIN {Livre._meta.db_table} l ON l.media_ptr_id = m.id "
+            f"LEFT JOIN {Dvd._meta.db_table} d ON d.media_ptr_id = m.id "
+            f"LEFT JOIN {Cd._meta.db_table} c ON c.media_ptr_id = m.id "
+            f"{where}",
+            params
+        )
+
+
+def index_jeu_range(first_id=None, last_id=None):
+    """
+    Index every JeuDePlateau row, or only those whose id is within the given
+    bounds, with a single INSERT ... SELECT.
+    """
+    if not search_available():
+        return
+    where, params = '', []
+    if first_id is not None and last_id is not None:
+        where, params = 'WHERE j.id BETWEEN %s AND %s', [first_id, last_id]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, kind, object_id, title, author, artiste, createur) "
+            f"SELECT j.id * 2 + 1, 'jeu', j.id, j.title, '', '', j.createur "
+            f"FROM {JeuDePlateau._meta.db_table} j {where}",
+            params
+        )
+
+
+def rebuild_search_index():
+    """
+    Drop and rebuild the whole search index in bulk. Returns the number of
+    indexed rows.
+    """
+    if not search_available():
+        return 0
+    with connection.cursor() as cursor:
+        recreate_search_table(cursor)
+    index_media_range()
+    index_jeu_range()
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT COUNT(*) FROM {SEARCH_TABLE}")
+        return cursor.fetchone()[0]
+
+
+def build_match_query(text):
+    """
+    Turn free text typed by a user into an FTS5 query: every word must match,
+    as a prefix unless shorter than MIN_PREFIX_LENGTH, and FTS5 operators
+    typed by the user are taken literally.
+    """
+    terms = [term.replace('"', '""') for term in text.split()]
+    return ' '.join(f'"{term}"*' if len(term) >= MIN_PREFIX_LENGTH else f'"{term}"' for term in terms if term)
+
+
+def search_catalogue(text, page=1, available=None, page_size=None):
+    """
+    Return one page of catalogue items matching `text`, best matches first
+    when at most RANKED_SEARCH_LIMIT items match, in catalogue order
+    otherwise. Returns the list of items (as dicts) and whether a next page
+    exists.
+    """
+    page_size = page_size or SEARCH_PAGE_SIZE
+    match = build_match_query(text)
+    if not match or not search_available():
+        return [], False
+
+    where = ''
+    if available is not None:
+        where = 'AND c.available = %s'
+
+    # Reads the catalogue, so it follows the router (see replica.py)
+    with connections[router.db_for_read(CatalogueItem)].cursor() as cursor:
+        # Counting the matches reads the full-text index alone
+        cursor.execute(f"SELECT COUNT(*) FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", [match])
+        order = 's.rank' if cursor.fetchone()[0] <= RANKED_SEARCH_LIMIT else 's.rowid'
+
+        # Availability is read from the flattened catalogue within the same
+        # query, so filtered pages are never cut short
+        sql = (
+            f"SELECT s.kind, s.object_id, s.title, s.author, s.artiste, s.createur, c.available "
+            f"FROM {SEARCH_TABLE} s "
+            f"JOIN {CatalogueItem._meta.db_table} c ON c.kind = s.kind AND c.object_id = s.object_id "
+            f"WHERE {SEARCH_TABLE} MATCH %s {where} "
+            f"ORDER BY {order} LIMIT %s OFFSET %s"
+        )
+        params = [match]
+        if available is not None:
+            params.append(available)
+        params += [page_size + 1, (page - 1) * page_size]
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    items = [
+        {
+            'kind': kind,
+            'id': object_id,
+            'title': title,
+            'author': author,
+            'artiste': artiste,
+            'createur': createur,
+            'available': bool(is_available),
+        }
+        for kind, object_id, title, author, artiste, createur, is_available in rows[:page_size]
+    ]
+    return items, len(rows) > page_size
+
+
+def search_page_from_request(request, available=None, lazy=False):
+    """
+    Read the `q` and `page` query parameters of a search and return the
+    template context of the requested page of results. With `lazy`, the
+    search only runs when the template first uses `items` or `next_page`.
+    """
+    query = request.GET.get('q', '').strip()
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+
+    if lazy:
+        results = SimpleLazyObject(lambda: search_catalogue(query, page, available))
+        items = SimpleLazyObject(lambda: results[0])
+        next_page = SimpleLazyObject(lambda: page + 1 if results[1] else None)
+    else:
+        items, has_next = search_catalogue(query, page, available)
+        next_page = page + 1 if has_next else None
+
+    return {
+        'query': query,
+        'items': items,
+        'page': page,
+        'previous_page': page - 1 if page > 1 else None,
+        'next_page': next_page,
+    }
@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, post_migrate
+from django.dispatch import receiver
+from bibliothecaire import catalogue_items, search
+from bibliothecaire.catalogue_cache import catalogue_changed
+from bibliothecaire.models import Media, JeuDePlateau, Emprunt, Reservation
+
+
+@receiver(post_migrate)
+def create_search_table(sender, **kwargs):
+    if sender.name == 'bibliothecaire':
+        search.create_search_table()
+
+
+# Tune every new SQLite connection with the SQLITE_PRAGMAS setting. They are
+# run on the raw connection, so they are not counted as queries.
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+        connection.connection.execute(f"PRAGMA {name} = {value}")
+
+
+# Keep the search index in sync with the catalogue
+@receiver(post_save)
+def index_catalogue_item(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    if sender in search.MEDIA_KINDS:
+        search.index_media(instance, search.MEDIA_KINDS[sender])
+    elif sender is Media:
+        search.update_media_titles(instance)
+    elif sender is JeuDePlateau:
+        search.index_jeu(instance)
+
+
+@receiver(post_delete)
+def unindex_catalogue_item(sender, instance, **kwargs):
+    if sender is Media:
+        search.unindex(search.media_rowid(instance.pk))
+    elif sender is JeuDePlateau:
+        search.unindex(search.jeu_rowid(instance.pk))
+
+
+# Keep the flattened catalogue in sync with single saves and deletions
+@receiver(post_save)
+def save_catalogue_item(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    if sender in catalogue_items.ITEM_KINDS:
+        catalogue_items.save_item(instance)
+    elif sender is Media:
+        catalogue_items.update_media_item(instance)
+
+
+@receiver(post_delete)
+def delete_catalogue_item(sender, instance, **kwargs):
+    # Deleting a book, DVD or CD deletes its Media parent too
+    if sender in (Media, JeuDePlateau):
+        catalogue_items.delete_items(sender, instance.pk)
+
+
+# Invalidate the cached catalogue pages. Changes made with update() or in
+# bulk call catalogue_changed() themselves.
+@receiver([post_save, post_delete])
+def invalidate_catalogue(sender, **kwargs):
+    if issubclass(sender, (Media, JeuDePlateau, Emprunt, Reservation)):
+        catalogue_changed()
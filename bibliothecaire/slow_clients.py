@@ -0,0 +1,181 @@
+"""
+Measure how many slow clients one process holds at once, under WSGI and
+under ASGI.
+
+Every simulated client takes `delay` seconds to send its request and as long
+to read the response, like a phone on a poor connection. A WSGI server holds
+one of its worker threads for the whole exchange, so a process with N threads
+serves N such clients at a time and queues the others. An ASGI server does
+that I/O on its event loop, and the async views only take a thread for their
+queries, so the process holds every client at once.
+
+Both servers are simulated in process, on top of Django's own WSGI and ASGI
+handlers, so no server needs to be installed to compare them.
+"""
+import asyncio
+import io
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.test.utils import override_settings
+from bibliothecaire.benchmark import BenchmarkError, percentile
+
+HOST = 'testserver'
+
+
+class InFlight:
+    """
+    Count the clients being served, and remember the highest count.
+    """
+
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc_info):
+        with self._lock:
+            self.current -= 1
+
+
+def summary(mode, clients, delay, wall, latencies, in_flight):
+    latencies = sorted(latencies)
+    return {
+        'mode': mode,
+        'clients': clients,
+        'delay_s': delay,
+        'wall_s': round(wall, 3),
+        'requests_per_s': round(clients / wall, 1),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 1),
+        'max_in_flight': in_flight.peak,
+    }
+
+
+def run_wsgi(path, query_string, clients, delay, threads):
+    """
+    Serve `clients` slow clients arriving together with a WSGI handler and a
+    pool of `threads` worker threads.
+    """
+    handler = WSGIHandler()
+    in_flight = InFlight()
+    start = time.perf_counter()
+
+    def client(_):
+        with in_flight:
+            # The worker reads the request as slowly as the client sends it
+            time.sleep(delay)
+            statuses = []
+            environ = {
+                'REQUEST_METHOD': 'GET',
+                'PATH_INFO': path,
+                'QUERY_STRING': query_string,
+                'SERVER_NAME': HOST,
+                'SERVER_PORT': '80',
+                'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': HOST,
+                'wsgi.input': io.BytesIO(),
+                'wsgi.errors': io.StringIO(),
+                'wsgi.url_scheme': 'http',
+            }
+            body = handler(environ, lambda status, headers, exc_info=None: statuses.append(status))
+            try:
+                b''.join(body)
+            finally:
+                body.close()
+            # and writes the response as slowly as the client reads it
+            time.sleep(delay)
+        return statuses[0], time.perf_counter() - start
+
+    with ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(client, range(clients)))
+    check_statuses(int(status.split()[0]) for status, _ in results)
+    return summary('wsgi', clients, delay, time.perf_counter() - start,
+                   [latency for _, latency in results], in_flight)
+
+
+async def run_asgi(path, query_string, clients, delay):
+    """
+    Serve `clients` slow clients arriving together with an ASGI handler, on
+    one event loop.
+    """
+    handler = ASGIHandler()
+    in_flight = InFlight()
+    start = time.perf_counter()
+
+    async def client():
+        done = asyncio.Event()
+        requested = False
+        status = None
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # Django then listens for a disconnect while the view runs
+            await done.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body' and not message.get('more_body'):
+                # The event loop writes the response as slowly as the client reads it
+                await asyncio.sleep(delay)
+                done.set()
+
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query_string.encode(),
+            'root_path': '',
+            'headers': [(b'host', HOST.encode())],
+            'client': ('127.0.0.1', 0),
+            'server': (HOST, 80),
+        }
+        with in_flight:
+            # The event loop reads the request as slowly as the client sends it
+            await asyncio.sleep(delay)
+            await handler(scope, receive, send)
+        return status, time.perf_counter() - start
+
+    results = await asyncio.gather(*(client() for _ in range(clients)))
+    check_statuses(status for status, _ in results)
+    return summary('asgi', clients, delay, time.perf_counter() - start,
+                   [latency for _, latency in results], in_flight)
+
+
+def check_statuses(statuses):
+    statuses = set(statuses)
+    if statuses != {200}:
+        raise BenchmarkError(f"Expected every response to be a 200, got {sorted(statuses)}.")
+
+
+def run_slow_clients(path, query_string='', clients=100, delay=0.5, threads=8):
+    """
+    Run the same slow clients against the WSGI and the ASGI handler, and
+    return both measurements.
+    """
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, HOST]):
+        return [
+            run_wsgi(path, query_string, clients, delay, threads),
+            asyncio.run(run_asgi(path, query_string, clients, delay)),
+        ]
@@ -0,0 +1,168 @@
+"""
+Daily circulation statistics.
+
+CirculationDailyStat holds, per day and catalogue type, the number of
+checkouts, returns, loans that fell overdue, reservations made and
+reservations ended. The circulation operations add to the counts of the day
+within their own transaction, so the dashboard reads a bounded number of
+rollup rows whatever the size of the history. `manage.py
+rebuild_circulation_stats` recomputes every count from the loans and
+reservations, archived ones included, for instance after a bulk import.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import connections, router, transaction
+from django.db.models import F, Q, Sum, Count, Value, OuterRef, Subquery
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+from bibliothecaire.models import (CatalogueItem, CirculationDailyStat, Emprunt, EmpruntArchive, Reservation,
+                                   ReservationArchive)
+
+STAT_FIELDS = ['checkouts', 'returns', 'overdue', 'reservations', 'reservations_ended']
+
+KIND_LABELS = {'livre': 'Livres', 'dvd': 'DVD', 'cd': 'CD', 'jeu': 'Jeux de plateau'}
+
+# Number of days and months shown on the dashboard
+DASHBOARD_DAYS = 30
+DASHBOARD_MONTHS = 12
+
+
+# Catalogue type of the media of a loan
+media_kind = Subquery(CatalogueItem.objects.filter(kind__in=CatalogueItem.MEDIA_KINDS,
+                                                   object_id=OuterRef('media_id')).values('kind')[:1])
+
+
+def _upsert(field, rows, params):
+    """
+    Add the (day, kind, count) `rows`, given as VALUES or as a SELECT, to the
+    `field` count of the rollups, creating the missing ones, with a single
+    statement. Run it in the transaction of the change it counts.
+    """
+    db = _db()
+    table = db.ops.quote_name(CirculationDailyStat._meta.db_table)
+    column = db.ops.quote_name(field)
+    key = ', '.join(db.ops.quote_name(name) for name in ['day', 'kind'])
+    counts = ', '.join(db.ops.quote_name(name) for name in STAT_FIELDS)
+    with db.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {table} ({key}, {counts}) {rows} "
+                       f"ON CONFLICT ({key}) DO UPDATE SET {column} = {table}.{column} + excluded.{column}",
+                       params)
+
+
+def _db():
+    return connections[router.db_for_write(CirculationDailyStat)]
+
+
+def _values(field, day, kind, count):
+    # The parameters of one row, with `count` in the column of `field`
+    return [_db().ops.adapt_datefield_value(day), kind, *(count if name == field else 0 for name in STAT_FIELDS)]
+
+
+def add_to_day(field, counts, day=None):
+    """
+    Add counts[kind] to the `field` count of each catalogue type for `day`,
+    today by default.
+    """
+    day = day or timezone.localdate()
+    rows = [(kind, count) for kind, count in counts.items() if count]
+    if rows:
+        placeholders = ', '.join(['(%s)' % ', '.join(['%s'] * (len(STAT_FIELDS) + 2))] * len(rows))
+        _upsert(field, f"VALUES {placeholders}",
+                [value for kind, count in rows for value in _values(field, day, kind, count)])
+
+
+def add_media_to_day(field, media_ids, day=None):
+    """
+    Count the given media towards `field` for `day`, today by default, per
+    catalogue type, reading their types in the same statement.
+    """
+    if not media_ids:
+        return
+    day = day or timezone.localdate()
+    counts = ', '.join('COUNT(*)' if name == field else '0' for name in STAT_FIELDS)
+    _upsert(field,
+            f"SELECT %s, kind, {counts} FROM {CatalogueItem._meta.db_table} "
+            f"WHERE kind IN ({', '.join(['%s'] * len(CatalogueItem.MEDIA_KINDS))}) "
+            f"AND object_id IN ({', '.join(['%s'] * len(media_ids))}) GROUP BY kind",
+            [_db().ops.adapt_datefield_value(day), *CatalogueItem.MEDIA_KINDS, *media_ids])
+
+
+def count_fallen_overdue(loans):
+    """
+    Count the given loans as fallen overdue, on the day of their return date.
+    Run it before flagging or returning them: a loan counts once, when the
+    sweeper flags it or, if it was never flagged, when it comes back late.
+    """
+    rows = (loans.annotate(stat_day=TruncDate('return_date'), stat_kind=media_kind)
+            .order_by().values('stat_day', 'stat_kind').annotate(count=Count('pk')))
+    for row in rows:
+        if row['stat_kind']:
+            add_to_day('overdue', {row['stat_kind']: row['count']}, row['stat_day'])
+
+
+def rebuild_stats():
+    """
+    Recompute every daily count from the live and archived loans and
+    reservations, with one grouped query per count and table. Returns the
+    number of rollup rows.
+    """
+    game = Value('jeu')
+    sources = [
+        ('checkouts', Emprunt.objects.all(), 'loan_date', media_kind),
+        ('checkouts', EmpruntArchive.objects.all(), 'loan_date', media_kind),
+        ('returns', Emprunt.objects.filter(returned=True), 'returned_at', media_kind),
+        ('returns', EmpruntArchive.objects.all(), 'returned_at', media_kind),
+        # Same rule as count_fallen_overdue(): flagged and still out, or returned late
+        ('overdue', Emprunt.objects.filter(Q(returned=False, overdue=True)
+                                           | Q(returned=True, returned_at__gt=F('return_date'))),
+         'return_date', media_kind),
+        ('overdue', EmpruntArchive.objects.filter(returned_at__gt=F('return_date')), 'return_date', media_kind),
+        ('reservations', Reservation.objects.all(), 'reservation_time', game),
+        ('reservations', ReservationArchive.objects.all(), 'reservation_time', game),
+        ('reservations_ended', Reservation.objects.filter(reserved=False), 'ended_at', game),
+        ('reservations_ended', ReservationArchive.objects.all(), 'ended_at', game),
+    ]
+    totals = defaultdict(Counter)
+    for field, queryset, date_field, kind in sources:
+        rows = (queryset.annotate(stat_day=TruncDate(date_field), stat_kind=kind)
+                .order_by().values('stat_day', 'stat_kind').annotate(count=Count('pk')))
+        for row in rows:
+            if row['stat_kind']:
+                totals[row['stat_day'], row['stat_kind']][field] += row['count']
+
+    with transaction.atomic():
+        CirculationDailyStat.objects.all().delete()
+        CirculationDailyStat.objects.bulk_create([
+            CirculationDailyStat(day=day, kind=kind, **counts) for (day, kind), counts in totals.items()
+        ], batch_size=1000)
+    return len(totals)
+
+
+def _totals(queryset, *group_by):
+    # Sum of each count, as total_<count>, per group
+    return queryset.values(*group_by).annotate(**{f'total_{field}': Sum(field) for field in STAT_FIELDS})
+
+
+def dashboard(today=None):
+    """
+    Totals per day over the last DASHBOARD_DAYS days, per catalogue type over
+    the same days, and per month over the last DASHBOARD_MONTHS months, read
+    from the rollups alone.
+    """
+    today = today or timezone.localdate()
+    first_day = today - timedelta(days=DASHBOARD_DAYS - 1)
+    first_month = today.replace(day=1)
+    for _ in range(DASHBOARD_MONTHS - 1):
+        first_month = (first_month - timedelta(days=1)).replace(day=1)
+
+    recent = CirculationDailyStat.objects.filter(day__gte=first_day, day__lte=today)
+    kinds = list(_totals(recent, 'kind').order_by('kind'))
+    for row in kinds:
+        row['label'] = KIND_LABELS.get(row['kind'], row['kind'])
+    return {
+        'days': list(_totals(recent, 'day').order_by('-day')),
+        'kinds': kinds,
+        'months': list(_totals(CirculationDailyStat.objects.filter(day__gte=first_month, day__lte=today)
+                             .annotate(month=TruncMonth('day')), 'month').order_by('-month')),
+    }
@@ -1,5 +1,7 @@
 import os
 from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
 
 import django
 import pytest
@@ -98,7 +100,8 @@ def create_emprunt(create_member, create_livre):
             member=member,
             loan_date=loan_date,
             return_date=return_date,
-            returned=returned
+            returned=returned,
+            returned_at=timezone.now() if returned else None
         )
 
         return emprunt
@@ -132,7 +135,8 @@ def create_reservation(create_member, create_jeu_de_plateau):
             member=member,
             reservation_time=reservation_time,
             reservation_end=reservation_end,
-            reserved=reserved
+            reserved=reserved,
+            ended_at=None if reserved else timezone.now()
         )
 
         return reservation
@@ -215,10 +219,55 @@ def test_list_media_view(client, bibliothecaire_user):
     response = client.get(reverse('list_media'))
     assert response.status_code == 200
     assert 'media/list_media.html' in [t.name for t in response.templates]
-    assert 'livres' in response.context
-    assert 'dvds' in response.context
-    assert 'cds' in response.context
-    assert 'jeux' in response.context
+    assert 'items' in response.context
+    assert 'next_cursor' in response.context
+
+
+@pytest.mark.django_db
+def test_list_media_view_pages_through_every_type(client, bibliothecaire_user, create_livre, create_cd,
+                                                   create_dvd, create_jeu_de_plateau):
+    client.login(username='bibliothecaire', password='password')
+
+    for i in range(3):
+        create_livre(f'Titre {i}', 'Auteur', '2024-01-01')
+        create_cd(f'Titre {i}', 'Auteur', '2024-01-01', 'Artiste')
+        create_dvd(f'Titre {i}', 'Auteur', '2024-01-01', timedelta(hours=2))
+        create_jeu_de_plateau(f'Titre {i}', 'Createur')
+
+    seen = []
+    cursor = ''
+    with patch('bibliothecaire.catalogue.PAGE_SIZE', 5):
+        while True:
+            response = client.get(reverse('list_media'), {'cursor': cursor})
+            assert len(response.context['items']) <= 5
+            seen += [(item['title'], item['kind'], item['id']) for item in response.context['items']]
+            cursor = response.context['next_cursor']
+            if cursor is None:
+                break
+
+    assert len(seen) == 12
+    assert seen == sorted(seen)
+    assert [kind for title, kind, pk in seen[:4]] == ['cd', 'dvd', 'jeu', 'livre']
+
+
+@pytest.mark.django_db
+def test_list_media_view_filters(client, bibliothecaire_user, create_livre, create_cd):
+    client.login(username='bibliothecaire', password='password')
+
+    create_livre('Livre disponible', 'Auteur', '2024-01-01')
+    emprunte = create_livre('Livre emprunté', 'Auteur', '2024-01-01')
+    emprunte.available = False
+    emprunte.save()
+    create_cd('Un CD', 'Auteur', '2024-01-01', 'Artiste')
+
+    response = client.get(reverse('list_media'), {'type': 'livre', 'available': '1'})
+    assert [item['title'] for item in response.context['items']] == ['Livre disponible']
+
+    response = client.get(reverse('list_media'), {'available': '0'})
+    assert [item['title'] for item in response.context['items']] == ['Livre emprunté']
+
+    response = client.get(reverse('list_media'), {'cursor': 'not-a-cursor'})
+    assert len(response.context['items']) == 3
 
 
 @pytest.mark.django_db
@@ -236,6 +285,19 @@ def test_create_media_view_post(client, bibliothecaire_user):
     assert Livre.objects.filter(title='New Book').exists()
 
 
+@pytest.mark.django_db
+@pytest.mark.parametrize('sync', ['bibliothecaire.catalogue_items.save_item', 'bibliothecaire.search.index_jeu'])
+def test_create_media_rolls_back_when_the_catalogue_sync_fails(client, bibliothecaire_user, sync):
+    from django.db import DatabaseError
+    from bibliothecaire.models import CatalogueItem
+
+    client.login(username='bibliothecaire', password='password')
+    with patch(sync, side_effect=DatabaseError("disk I/O error")), pytest.raises(DatabaseError):
+        client.post(reverse('create_media'), data={'media_type': 'jeu', 'title': 'Carcassonne', 'createur': 'Wrede'})
+    assert not JeuDePlateau.objects.exists()
+    assert not CatalogueItem.objects.exists()
+
+
 @pytest.mark.django_db
 def test_create_loan_view_post(client, create_member, create_livre, bibliothecaire_user):
     client.login(username='bibliothecaire', password='password')
@@ -302,3 +364,1177 @@ def test_end_reservation_view(client, create_reservation, bibliothecaire_user):
     assert response.status_code == 302
     reservation.refresh_from_db()
     assert reservation.reserved is False
+
+
+@pytest.mark.django_db
+def test_search_media_view(client, bibliothecaire_user, create_livre, create_cd, create_jeu_de_plateau):
+    client.login(username='bibliothecaire', password='password')
+
+    livre = create_livre('Le Petit Prince', 'Saint-Exupéry', '1943-04-06')
+    create_cd('Abbey Road', 'Apple', '1969-09-26', 'The Beatles')
+    create_jeu_de_plateau('Catan', 'Klaus Teuber')
+
+    response = client.get(reverse('search_media'), {'q': 'prin'})
+    assert response.status_code == 200
+    assert [(item['kind'], item['id']) for item in response.context['items']] == [('livre', livre.id)]
+
+    response = client.get(reverse('search_media'), {'q': 'beatles'})
+    assert [item['title'] for item in response.context['items']] == ['Abbey Road']
+
+    response = client.get(reverse('search_media'), {'q': 'teuber'})
+    assert [item['title'] for item in response.context['items']] == ['Catan']
+
+    # Updates and deletions are reflected in the index
+    livre.title = 'Vol de nuit'
+    livre.save()
+    response = client.get(reverse('search_media'), {'q': 'prince'})
+    assert response.context['items'] == []
+    livre.delete()
+    response = client.get(reverse('search_media'), {'q': 'nuit'})
+    assert response.context['items'] == []
+
+
+@pytest.mark.django_db
+def test_search_media_view_paginates(client, bibliothecaire_user, create_livre):
+    client.login(username='bibliothecaire', password='password')
+
+    for i in range(25):
+        create_livre(f'Roman {i}', 'Auteur', '2024-01-01')
+
+    response = client.get(reverse('search_media'), {'q': 'roman'})
+    assert len(response.context['items']) == 20
+    assert response.context['next_page'] == 2
+    response = client.get(reverse('search_media'), {'q': 'roman', 'page': 2})
+    assert len(response.context['items']) == 5
+    assert response.context['next_page'] is None
+
+
+@pytest.mark.django_db
+def test_rebuild_search_index_command(create_livre, create_dvd, create_jeu_de_plateau):
+    from django.core.management import call_command
+    from bibliothecaire.search import search_catalogue, SEARCH_TABLE
+    from django.db import connection
+
+    create_livre('Germinal', 'Zola', '1885-01-01')
+    create_dvd('Germinal', 'Berri', '1993-09-29', timedelta(hours=2))
+    create_jeu_de_plateau('Germ', 'Createur')
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+
+    call_command('rebuild_search_index')
+    items, has_next = search_catalogue('germ')
+    assert sorted(item['kind'] for item in items) == ['dvd', 'jeu', 'livre']
+    assert not has_next
+
+
+@pytest.mark.django_db
+def test_search_matches_short_terms_as_whole_words(create_livre):
+    from bibliothecaire.search import build_match_query, search_catalogue
+
+    assert build_match_query('le germ') == '"le" "germ"*'
+    create_livre('Le rouge et le noir', 'Stendhal', '1830-11-13')
+    create_livre('Les misérables', 'Hugo', '1862-01-01')
+    assert [item['title'] for item in search_catalogue('le')[0]] == ['Le rouge et le noir']
+    assert len(search_catalogue('les mis')[0]) == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('limit', [2, 100])
+def test_search_filters_and_pages_every_match(create_livre, limit):
+    from bibliothecaire.models import CatalogueItem
+    from bibliothecaire.search import search_catalogue
+
+    borrowed = [create_livre(f'Roman noir {i}', 'Auteur', '2024-01-01').pk for i in range(5)]
+    Livre.objects.filter(pk__in=borrowed).update(available=False)
+    CatalogueItem.objects.of_media(borrowed).update(available=False)
+    create_livre('Roman', 'Auteur', '2024-01-01')
+
+    with patch('bibliothecaire.search.RANKED_SEARCH_LIMIT', limit):
+        assert [item['title'] for item in search_catalogue('roman', available=True)[0]] == ['Roman']
+        pages = [search_catalogue('roman', page, page_size=2) for page in (1, 2, 3)]
+    assert [has_next for _, has_next in pages] == [True, True, False]
+    assert len({item['id'] for items, _ in pages for item in items}) == 6
+    if limit > 6:
+        # Ranked: the shortest title matches best
+        assert pages[0][0][0]['title'] == 'Roman'
+
+
+@pytest.mark.django_db
+def test_create_search_table_upgrades_an_older_table(create_livre):
+    from django.db import connection
+    from bibliothecaire.search import SEARCH_TABLE, create_search_table, search_catalogue
+
+    create_livre('Germinal', 'Zola', '1885-01-01')
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE {SEARCH_TABLE}")
+        cursor.execute(f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(kind UNINDEXED, object_id UNINDEXED, "
+                       f"title, author, artiste, createur)")
+
+    create_search_table()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sql FROM sqlite_master WHERE name = %s", [SEARCH_TABLE])
+        assert "prefix = '2 3'" in cursor.fetchone()[0]
+    assert [item['title'] for item in search_catalogue('germ')[0]] == ['Germinal']
+
+
+def count_queries(client, url, data=None):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url, data)
+    assert response.status_code == 200
+    return len(queries)
+
+
+@pytest.mark.django_db
+def test_manage_loans_view_sorts_in_database(client, create_member, create_livre, create_emprunt,
+                                             bibliothecaire_user):
+    client.login(username='bibliothecaire', password='password')
+
+    member = create_member()
+    now = timezone.now()
+    oldest = create_emprunt(member=member, media=create_livre('A', 'Auteur', '2024-01-01'),
+                            loan_date=now - timedelta(days=3), returned=True)
+    newest = create_emprunt(member=member, media=create_livre('B', 'Auteur', '2024-01-01'),
+                            loan_date=now - timedelta(days=1), returned=True)
+    ongoing = create_emprunt(member=member, media=create_livre('C', 'Auteur', '2024-01-01'),
+                             loan_date=now - timedelta(days=2))
+
+    response = client.get(reverse('manage_loans', args=[member.id]), {'sort_by': 'date'})
+    assert list(response.context['member_emprunts']) == [oldest, ongoing, newest]
+
+    response = client.get(reverse('manage_loans', args=[member.id]), {'sort_by': 'returned'})
+    assert list(response.context['member_emprunts']) == [ongoing, newest, oldest]
+
+
+@pytest.mark.django_db
+def test_manage_loans_query_count_does_not_grow_with_history(client, create_member, create_livre, create_emprunt,
+                                                              bibliothecaire_user):
+    client.login(username='bibliothecaire', password='password')
+
+    member = create_member()
+    url = reverse('manage_loans', args=[member.id])
+    create_emprunt(member=member, media=create_livre('Livre 0', 'Auteur', '2024-01-01'))
+    baseline = count_queries(client, url, {'sort_by': 'returned'})
+
+    for i in range(1, 40):
+        create_emprunt(member=member, media=create_livre(f'Livre {i}', 'Auteur', '2024-01-01'), returned=True)
+    assert count_queries(client, url, {'sort_by': 'returned'}) == baseline
+    assert count_queries(client, url, {'sort_by': 'date', 'page': 2}) == baseline
+
+
+@pytest.mark.django_db
+def test_manage_reservation_query_count_does_not_grow_with_history(client, create_member, create_reservation,
+                                                                    bibliothecaire_user):
+    client.login(username='bibliothecaire', password='password')
+
+    member = create_member()
+    url = reverse('manage_reservation', args=[member.id])
+    active = create_reservation(member=member)
+    baseline = count_queries(client, url)
+
+    for i in range(1, 40):
+        create_reservation(member=member, reserved=False)
+    assert count_queries(client, url) == baseline
+
+    response = client.get(url)
+    assert response.context['reservations'][0] == active
+
+
+@pytest.mark.django_db
+def test_create_loan_view_rejects_member_with_overdue_loans(client, create_member, create_livre, create_emprunt,
+                                                            bibliothecaire_user):
+    client.login(username='bibliothecaire', password='password')
+
+    member = create_member()
+    now = timezone.now()
+    late = create_emprunt(member=member, media=create_livre('En retard', 'Auteur', '2024-01-01'),
+                          loan_date=now - timedelta(days=10), return_date=now - timedelta(days=3))
+    create_emprunt(member=member, media=create_livre('Rendu', 'Auteur', '2024-01-01'),
+                   loan_date=now - timedelta(days=10), return_date=now - timedelta(days=3), returned=True)
+    create_emprunt(member=member, media=create_livre('En cours', 'Auteur', '2024-01-01'))
+
+    media = create_livre('Nouveau', 'Auteur', '2024-01-01')
+    response = client.post(reverse('create_loan'), data={
+        'member': member.id,
+        'media': media.id,
+        'loan_date': now,
+        'return_date': now + timedelta(days=7),
+    })
+    assert response.status_code == 200
+    due = late.return_date.strftime("%Y-%m-%d %H:%M")
+    assert response.context['message'] == (f"Les emprunts suivants pour {member.name} sont en retard:<br>"
+                                           f"- En retard (Due le {due})<br>")
+    assert not Emprunt.objects.filter(media=media).exists()
+
+
+@pytest.mark.django_db
+def test_check_out_claims_media_and_counts_loan(create_member, create_livre):
+    from bibliothecaire import circulation
+
+    member = create_member()
+    media = create_livre('Livre', 'Auteur', '2024-01-01')
+    loan = Emprunt(media=media, member=member)
+    circulation.check_out(loan)
+
+    media.refresh_from_db()
+    member.refresh_from_db()
+    assert loan.pk is not None
+    assert media.available is False
+    assert member.active_loans == 1
+
+    circulation.check_in(loan)
+    media.refresh_from_db()
+    member.refresh_from_db()
+    assert Emprunt.objects.get(pk=loan.pk).returned is True
+    assert media.available is True
+    assert member.active_loans == 0
+
+    with pytest.raises(circulation.CirculationError) as error:
+        circulation.check_in(loan)
+    assert error.value.reason == 'already_returned'
+
+
+@pytest.mark.django_db
+def test_check_out_loses_against_concurrent_claims(create_member, create_livre):
+    from bibliothecaire import circulation
+
+    member = create_member()
+    media = create_livre('Livre', 'Auteur', '2024-01-01')
+
+    # Another worker borrowed the media after this one read it
+    Livre.objects.filter(pk=media.pk).update(available=False)
+    with pytest.raises(circulation.CirculationError) as error:
+        circulation.check_out(Emprunt(media=media, member=member))
+    assert error.value.reason == 'media_unavailable'
+
+    # Another worker used up the member's last loan after this one read it
+    other = create_livre('Autre livre', 'Auteur', '2024-01-01')
+    Membre.objects.filter(pk=member.pk).update(active_loans=3)
+    with pytest.raises(circulation.CirculationError) as error:
+        circulation.check_out(Emprunt(media=other, member=member))
+    assert error.value.reason == 'loan_limit'
+
+    # The media claim was rolled back with the failed transaction
+    other.refresh_from_db()
+    assert other.available is True
+    assert not Emprunt.objects.filter(media=other).exists()
+
+
+@pytest.mark.django_db
+def test_reserve_enforces_reservation_limit(create_member, create_jeu_de_plateau):
+    from bibliothecaire import circulation
+
+    member = create_member()
+    first = create_jeu_de_plateau('Jeu 1', 'Createur')
+    second = create_jeu_de_plateau('Jeu 2', 'Createur')
+
+    reservation = Reservation(jeuDePlateau=first, member=member)
+    circulation.reserve(reservation)
+    with pytest.raises(circulation.CirculationError) as error:
+        circulation.reserve(Reservation(jeuDePlateau=second, member=member))
+    assert error.value.reason == 'reservation_limit'
+    second.refresh_from_db()
+    assert second.available is True
+
+    circulation.end_reservation(reservation)
+    member.refresh_from_db()
+    first.refresh_from_db()
+    assert member.active_reservation == 0
+    assert first.available is True
+
+
+@pytest.mark.django_db
+def test_batch_checkout_and_return_views(client, create_member, create_livre, bibliothecaire_user):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    client.login(username='bibliothecaire', password='password')
+
+    member = create_member()
+    medias = [create_livre(f'Livre {i}', 'Auteur', '2024-01-01') for i in range(3)]
+    now = timezone.now()
+    with CaptureQueriesContext(connection) as queries:
+        response = client.post(reverse('batch_checkout'), data={
+            'member': member.id,
+            'medias': [media.id for media in medias],
+            'loan_date': now,
+            'return_date': now + timedelta(days=7),
+        })
+    assert response.status_code == 302
+    assert response.url == reverse('manage_loans', args=[member.id])
+    assert len(queries) < 15
+
+    member.refresh_from_db()
+    assert member.active_loans == 3
+    assert not Livre.objects.filter(available=True).exists()
+    loans = list(Emprunt.objects.filter(member=member))
+    assert len(loans) == 3
+
+    response = client.post(reverse('batch_return', args=[member.id]), data={
+        'loan_ids': [loans[0].id, loans[1].id],
+    })
+    assert response.status_code == 302
+    member.refresh_from_db()
+    assert member.active_loans == 1
+    assert Emprunt.objects.filter(member=member, returned=True).count() == 2
+    assert Livre.objects.filter(available=True).count() == 2
+
+
+@pytest.mark.django_db
+def test_batch_checkout_is_all_or_nothing(create_member, create_livre):
+    from bibliothecaire import circulation
+
+    member = create_member()
+    Membre.objects.filter(pk=member.pk).update(active_loans=2)
+    medias = [create_livre(f'Livre {i}', 'Auteur', '2024-01-01') for i in range(2)]
+
+    with pytest.raises(circulation.CirculationError) as error:
+        circulation.check_out_many(member, [media.pk for media in medias], timezone.now(),
+                                   timezone.now() + timedelta(days=7))
+    assert error.value.reason == 'loan_limit'
+    assert Livre.objects.filter(available=True).count() == 2
+    assert not Emprunt.objects.exists()
+
+
+@pytest.mark.django_db
+def test_import_catalogue_command(tmp_path):
+    from io import StringIO
+    from django.core.management import call_command
+    from bibliothecaire.circulation import reconcile_counters
+    from bibliothecaire.catalogue import catalogue_page
+    from bibliothecaire.search import search_catalogue
+
+    path = tmp_path / 'catalogue.csv'
+    path.write_text(
+        "type,title,author,publication_date,duration,artiste,createur,available\n"
+        "livre,Germinal,Zola,1885-03-01,,,,\n"
+        "dvd,Germinal,Berri,1993-09-29,01:50:00,,,0\n"
+        "cd,Kind of Blue,Columbia,1959-08-17,,Miles Davis,,\n"
+        "jeu,Carcassonne,,,,,Klaus-Jürgen Wrede,\n"
+        "livre,Sans date,Auteur,,,,,\n"
+        "vinyle,Inconnu,Auteur,2000-01-01,,,,\n",
+        encoding='utf-8'
+    )
+    out, err = StringIO(), StringIO()
+    call_command('import_catalogue', str(path), '--batch-size', '2', stdout=out, stderr=err)
+
+    assert 'Done: 4 rows imported, 2 bad rows' in out.getvalue()
+    assert "Line 6: missing 'publication_date'" in err.getvalue()
+    assert err.getvalue().count("Column 'available' ignored") == 1
+    assert Livre.objects.get().title == 'Germinal'
+    assert Dvd.objects.get().duration == timedelta(hours=1, minutes=50)
+    # Nothing is on loan, so reconciling leaves the imported items available
+    assert Dvd.objects.get().available is True
+    assert sum(reconcile_counters(dry_run=True).values()) == 0
+    assert Cd.objects.get().artiste == 'Miles Davis'
+    assert JeuDePlateau.objects.get().createur == 'Klaus-Jürgen Wrede'
+
+    items, _ = search_catalogue('germinal')
+    assert sorted(item['kind'] for item in items) == ['dvd', 'livre']
+    items, _ = catalogue_page()
+    assert [(item['kind'], item['title']) for item in items] == [
+        ('jeu', 'Carcassonne'), ('dvd', 'Germinal'), ('livre', 'Germinal'), ('cd', 'Kind of Blue')]
+    assert items[1]['duration'] == timedelta(hours=1, minutes=50)
+
+    path = tmp_path / 'catalogue.jsonl'
+    path.write_text('{"type": "livre", "title": "Nana", "author": "Zola", "publication_date": "1880-01-01"}\n'
+                    'not json\n', encoding='utf-8')
+    out = StringIO()
+    call_command('import_catalogue', str(path), stdout=out, stderr=StringIO())
+    assert 'Done: 1 rows imported, 1 bad rows' in out.getvalue()
+    assert Livre.objects.filter(title='Nana').exists()
+
+
+@pytest.mark.django_db
+def test_export_data_view_streams_csv_and_jsonl(client, create_emprunt, bibliothecaire_user):
+    import gzip
+    import json
+
+    client.login(username='bibliothecaire', password='password')
+
+    emprunt = create_emprunt()
+    response = client.get(reverse('export_data', args=['emprunt']), {'format': 'csv'})
+    assert response.status_code == 200
+    assert response.streaming
+    assert response['Content-Disposition'] == 'attachment; filename="emprunt.csv"'
+    lines = b''.join(response.streaming_content).decode().splitlines()
+    assert lines[0] == 'id,media_id,member_id,loan_date,return_date,returned,returned_at'
+    assert lines[1].startswith(f'{emprunt.id},{emprunt.media_id},{emprunt.member_id},')
+    assert len(lines) == 2
+
+    response = client.get(reverse('export_data', args=['livre']), {'format': 'jsonl', 'gzip': '1'})
+    assert response['Content-Type'] == 'application/gzip'
+    rows = [json.loads(line) for line in gzip.decompress(b''.join(response.streaming_content)).splitlines()]
+    assert rows == [{'id': emprunt.media_id, 'title': 'Sample Book', 'author': 'Book Author',
+                     'publication_date': '2024-01-01', 'available': True}]
+
+    assert client.get(reverse('export_data', args=['unknown'])).status_code == 404
+
+
+@pytest.mark.django_db
+def test_export_data_includes_archived_history(create_member, create_emprunt, create_reservation):
+    from bibliothecaire import exports
+    from bibliothecaire.archive import archive_history
+
+    member = create_member()
+    archived_loan = create_emprunt(member=member, returned=True)
+    archived_reservation = create_reservation(member=member, reserved=False)
+    archive_history(days=0)
+    active_loan = create_emprunt(member=member, media=archived_loan.media)
+
+    def rows(dataset):
+        return b''.join(exports.export_chunks(dataset)).decode().splitlines()
+
+    assert [line.split(',')[0] for line in rows('emprunt')[1:]] == [str(active_loan.pk)]
+    lines = rows('emprunt_archive')
+    assert lines[0] == 'id,media_id,member_id,loan_date,return_date,returned_at,archived_at'
+    assert lines[1].startswith(f'{archived_loan.pk},{archived_loan.media_id},{member.pk},')
+    assert archived_loan.returned_at.isoformat() in lines[1]
+    lines = rows('reservation_archive')
+    assert lines[0] == 'id,jeuDePlateau_id,member_id,reservation_time,reservation_end,ended_at,archived_at'
+    assert lines[1].startswith(f'{archived_reservation.pk},{archived_reservation.jeuDePlateau_id},{member.pk},')
+
+
+@pytest.mark.django_db
+def test_export_data_requires_bibliothecaire(client):
+    response = client.get(reverse('export_data', args=['membre']))
+    assert response.status_code == 302
+
+
+@pytest.mark.django_db
+def test_export_data_command(tmp_path, create_member):
+    from django.core.management import call_command
+
+    create_member(name='Ada', email='ada@example.com')
+    output = tmp_path / 'membres.csv'
+    call_command('export_data', 'membre', '--output', str(output))
+    assert output.read_text().splitlines()[1].endswith(',Ada,ada@example.com,0,0')
+
+
+@pytest.mark.django_db
+def test_sweep_overdue_loans(create_member, create_livre, create_emprunt):
+    from bibliothecaire import circulation
+
+    member = create_member()
+    now = timezone.now()
+    late = create_emprunt(member=member, media=create_livre('En retard', 'Auteur', '2024-01-01'),
+                          loan_date=now - timedelta(days=10), return_date=now - timedelta(days=3))
+    create_emprunt(member=member, media=create_livre('Rendu', 'Auteur', '2024-01-01'),
+                   loan_date=now - timedelta(days=10), return_date=now - timedelta(days=3), returned=True)
+    create_emprunt(member=member, media=create_livre('En cours', 'Auteur', '2024-01-01'))
+
+    assert circulation.sweep_overdue_loans() == (1, 0)
+    assert list(Emprunt.objects.filter(overdue=True)) == [late]
+    member.refresh_from_db()
+    assert member.overdue_loans == 1
+
+    # Sweeping again changes nothing
+    assert circulation.sweep_overdue_loans() == (0, 0)
+
+    # Returning the loan clears the flag and the member's count
+    Membre.objects.filter(pk=member.pk).update(active_loans=2)
+    circulation.check_in(late)
+    late.refresh_from_db()
+    member.refresh_from_db()
+    assert late.overdue is False
+    assert member.overdue_loans == 0
+    assert member.active_loans == 1
+
+
+@pytest.mark.django_db
+def test_overdue_loans_view(client, create_member, create_emprunt, bibliothecaire_user):
+    from django.core.management import call_command
+
+    client.login(username='bibliothecaire', password='password')
+
+    now = timezone.now()
+    late = create_emprunt(member=create_member(), loan_date=now - timedelta(days=10),
+                          return_date=now - timedelta(days=3))
+    response = client.get(reverse('overdue_loans'))
+    assert list(response.context['loans']) == []
+
+    call_command('sweep_overdue_loans', stdout=StringIO())
+    response = client.get(reverse('overdue_loans'))
+    assert response.status_code == 200
+    assert list(response.context['loans']) == [late]
+
+
+@pytest.mark.django_db
+def test_expire_reservations(create_member, create_jeu_de_plateau):
+    from django.core.management import call_command
+    from bibliothecaire import circulation
+
+    now = timezone.now()
+    lapsed_member = create_member(name='Lapsed', email='lapsed@example.com')
+    current_member = create_member(name='Current', email='current@example.com')
+    lapsed_game = create_jeu_de_plateau('Jeu expiré', 'Createur')
+    current_game = create_jeu_de_plateau('Jeu en cours', 'Createur')
+
+    lapsed = Reservation(jeuDePlateau=lapsed_game, member=lapsed_member,
+                         reservation_time=now - timedelta(hours=3), reservation_end=now - timedelta(hours=1))
+    circulation.reserve(lapsed)
+    current = Reservation(jeuDePlateau=current_game, member=current_member,
+                          reservation_time=now, reservation_end=now + timedelta(hours=2))
+    circulation.reserve(current)
+
+    out = StringIO()
+    call_command('expire_reservations', stdout=out)
+    assert '1 reservations expired.' in out.getvalue()
+
+    for instance in (lapsed, current, lapsed_member, current_member, lapsed_game, current_game):
+        instance.refresh_from_db()
+    assert lapsed.reserved is False
+    assert lapsed_game.available is True
+    assert lapsed_member.active_reservation == 0
+    assert current.reserved is True
+    assert current_game.available is False
+    assert current_member.active_reservation == 1
+
+
+@pytest.mark.django_db
+def test_bibliothecaire_page_loads_user_and_group_in_one_query(client, create_member, bibliothecaire_user):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    client.login(username='bibliothecaire', password='password')
+    client.get(reverse('home'))
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(reverse('home'))
+    assert response.status_code == 200
+    auth_queries = [query['sql'] for query in queries if 'auth_' in query['sql']]
+    assert len(auth_queries) == 1
+    assert 'auth_group' in auth_queries[0]
+
+
+@pytest.mark.django_db
+def test_bibliothecaire_changes_made_elsewhere_apply_at_once(client, bibliothecaire_user):
+    # update() sends no signal, as a change made by another worker process
+    client.login(username='bibliothecaire', password='password')
+    assert client.get(reverse('home')).status_code == 200
+
+    User.objects.filter(pk=bibliothecaire_user.pk).update(is_active=False)
+    assert client.get(reverse('home')).status_code == 302
+
+    User.objects.filter(pk=bibliothecaire_user.pk).update(is_active=True)
+    client.login(username='bibliothecaire', password='password')
+    bibliothecaire_user.set_password('nouveau-mot-de-passe')
+    User.objects.filter(pk=bibliothecaire_user.pk).update(password=bibliothecaire_user.password)
+    response = client.get(reverse('home'))
+    assert response.status_code == 302
+    assert '_auth_user_id' not in client.session
+
+
+@pytest.mark.django_db
+def test_bibliothecaire_access_follows_group_changes(client, bibliothecaire_user):
+    client.login(username='bibliothecaire', password='password')
+    assert client.get(reverse('home')).status_code == 200
+
+    group = Group.objects.get(name='bibliothecaires')
+    bibliothecaire_user.groups.remove(group)
+    response = client.get(reverse('home'))
+    assert response.status_code == 302
+    assert response.url == f"{reverse('login')}?error=not_bibliothecaire"
+
+    group.user_set.add(bibliothecaire_user)
+    assert client.get(reverse('home')).status_code == 200
+
+    group.name = 'anciens bibliothecaires'
+    group.save()
+    assert client.get(reverse('home')).status_code == 302
+
+
+@pytest.mark.django_db
+def test_reconcile_counters(create_member, create_livre, create_jeu_de_plateau, create_emprunt, create_reservation):
+    from django.core.management import call_command
+
+    member = create_member()
+    borrowed = create_livre('Emprunté', 'Auteur', '2024-01-01')
+    create_emprunt(member=member, media=borrowed)
+    create_emprunt(member=member, returned=True)
+    create_reservation(member=member, jeu_de_plateau=create_jeu_de_plateau('Réservé', 'Createur'))
+    lost = create_livre('Marqué emprunté', 'Auteur', '2024-01-01')
+    Livre.objects.filter(pk=lost.pk).update(available=False)
+    Membre.objects.filter(pk=member.pk).update(active_loans=3, overdue_loans=2)
+
+    out = StringIO()
+    call_command('reconcile_counters', '--dry-run', stdout=out)
+    assert 'membre.active_loans: 1 rows would be fixed' in out.getvalue()
+    member.refresh_from_db()
+    assert member.active_loans == 3
+
+    out = StringIO()
+    call_command('reconcile_counters', stdout=out)
+    assert 'membre.active_loans: 1 rows fixed' in out.getvalue()
+    assert 'media.available: 1 rows fixed' in out.getvalue()
+    assert 'media.unavailable: 1 rows fixed' in out.getvalue()
+    assert 'jeu.unavailable: 1 rows fixed' in out.getvalue()
+
+    member.refresh_from_db()
+    assert (member.active_loans, member.active_reservation, member.overdue_loans) == (1, 1, 0)
+    assert Livre.objects.get(pk=borrowed.pk).available is False
+    assert Livre.objects.get(pk=lost.pk).available is True
+    assert JeuDePlateau.objects.get(title='Réservé').available is False
+
+    out = StringIO()
+    call_command('reconcile_counters', stdout=out)
+    assert '0 rows fixed' in out.getvalue()
+
+
+def catalogue_items():
+    from bibliothecaire.models import CatalogueItem
+    return {(item.kind, item.title): (item.creator, item.available)
+            for item in CatalogueItem.objects.all()}
+
+
+@pytest.mark.django_db
+def test_catalogue_items_follow_every_write(create_member, create_livre, create_cd, create_jeu_de_plateau):
+    from bibliothecaire import circulation
+    from bibliothecaire.models import CatalogueItem, Media
+
+    livre = create_livre('Germinal', 'Zola', '1885-01-01')
+    cd = create_cd('Boléro', 'Ravel', '1928-01-01', 'Orchestre')
+    jeu = create_jeu_de_plateau('Carcassonne', 'Wrede')
+    assert catalogue_items() == {('livre', 'Germinal'): ('Zola', True), ('cd', 'Boléro'): ('Ravel', True),
+                                 ('jeu', 'Carcassonne'): ('Wrede', True)}
+    assert CatalogueItem.objects.get(kind='cd').artiste == 'Orchestre'
+
+    livre.title = 'Nana'
+    livre.save()
+    media = Media.objects.get(pk=cd.pk)
+    media.author = 'Maurice Ravel'
+    media.save()
+    member = create_member()
+    loan = Emprunt(media=livre, member=member)
+    circulation.check_out(loan)
+    reservation = Reservation(jeuDePlateau=jeu, member=member)
+    circulation.reserve(reservation)
+    assert catalogue_items() == {('livre', 'Nana'): ('Zola', False), ('cd', 'Boléro'): ('Maurice Ravel', True),
+                                 ('jeu', 'Carcassonne'): ('Wrede', False)}
+
+    circulation.check_in(loan)
+    circulation.end_reservation(reservation)
+    cd.delete()
+    assert catalogue_items() == {('livre', 'Nana'): ('Zola', True), ('jeu', 'Carcassonne'): ('Wrede', True)}
+    jeu.delete()
+    assert list(CatalogueItem.objects.values_list('kind', 'object_id')) == [('livre', livre.pk)]
+
+
+@pytest.mark.django_db
+def test_rebuild_catalogue_and_reconcile_fix_drifted_items(create_livre, create_jeu_de_plateau):
+    from django.core.management import call_command
+    from bibliothecaire.models import CatalogueItem
+
+    livre = create_livre('Germinal', 'Zola', '1885-01-01')
+    create_jeu_de_plateau('Carcassonne', 'Wrede')
+    CatalogueItem.objects.of_media([livre.pk]).update(available=False)
+
+    out = StringIO()
+    call_command('reconcile_counters', stdout=out)
+    assert 'catalogue.available: 1 rows fixed' in out.getvalue()
+    assert catalogue_items() == {('livre', 'Germinal'): ('Zola', True), ('jeu', 'Carcassonne'): ('Wrede', True)}
+
+    CatalogueItem.objects.all().delete()
+    out = StringIO()
+    call_command('rebuild_catalogue', stdout=out)
+    assert 'Copied 2 catalogue items' in out.getvalue()
+    assert catalogue_items() == {('livre', 'Germinal'): ('Zola', True), ('jeu', 'Carcassonne'): ('Wrede', True)}
+
+
+def hot_querysets(now):
+    from bibliothecaire.catalogue import _items_query as items_query
+    from bibliothecaire.models import CatalogueItem, CirculationDailyStat, EmpruntArchive, Media, ReservationArchive
+    return {
+        'catalogue livre': Livre.objects.order_by('title', 'id')[:51],
+        'catalogue livre disponible': Livre.objects.filter(available=True).order_by('title', 'id')[:51],
+        'catalogue livre suivant': Livre.objects.filter(title__gt='m').order_by('title', 'id')[:51],
+        'catalogue livre par auteur': Livre.objects.filter(author='Zola').order_by('title', 'id')[:51],
+        'catalogue jeu par createur': JeuDePlateau.objects.filter(createur='Wrede').order_by('title', 'id')[:51],
+        'catalogue jeu': JeuDePlateau.objects.order_by('title', 'id')[:51],
+        'catalogue jeu disponible': JeuDePlateau.objects.filter(available=True).order_by('title', 'id')[:51],
+        'medias disponibles': Media.objects.filter(available=True),
+        'retards du membre': Emprunt.objects.overdue(now).filter(member=1),
+        'emprunts du membre': Emprunt.objects.filter(member=1).order_by('returned', '-loan_date', 'pk')[:25],
+        'balayage des retards': Emprunt.objects.overdue(now).filter(overdue=False),
+        'liste des retards': Emprunt.objects.filter(overdue=True).order_by('return_date', 'pk')[:25],
+        'reservation du membre': Reservation.objects.filter(member=1, reserved=True),
+        'reservations expirees': Reservation.objects.filter(reserved=True, reservation_end__lt=now),
+        'membres en retard': Membre.objects.filter(overdue_loans__gt=0),
+        'derniere modification media': Media.objects.order_by('-updated_at').values('updated_at')[:1],
+        'derniere modification jeu': JeuDePlateau.objects.order_by('-updated_at').values('updated_at')[:1],
+        'catalogue': items_query(None, None, None, 51),
+        'catalogue disponible': items_query(None, True, None, 51),
+        'catalogue suivant': items_query(None, True, ('m', 'livre', 1), 51),
+        'catalogue dvd disponible': items_query('dvd', True, None, 51),
+        'catalogue par auteur': items_query(None, None, None, 51, 'Zola'),
+        'disponibilite des medias': CatalogueItem.objects.of_media([1, 2]).filter(available=True),
+        'emprunts a archiver': Emprunt.objects.filter(returned=True, returned_at__lt=now).values('pk')[:1000],
+        'reservations a archiver': Reservation.objects.filter(reserved=False, ended_at__lt=now).values('pk')[:1000],
+        'emprunts archives du membre': EmpruntArchive.objects.filter(member=1).order_by('-loan_date', '-pk')[:25],
+        'reservations archivees du membre': (ReservationArchive.objects.filter(member=1)
+                                             .order_by('-reservation_time', '-pk')[:25]),
+        'statistiques recentes': CirculationDailyStat.objects.filter(day__gte=now.date()).values('day'),
+    }
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('name', list(hot_querysets(timezone.now())))
+def test_hot_queries_use_an_index(name):
+    # A full table scan shows up in SQLite's plan as "SCAN <table>" with no
+    # "USING ... INDEX" clause.
+    plan = hot_querysets(timezone.now())[name].explain()
+    scans = [line for line in plan.splitlines() if ' SCAN ' in f' {line} ' and 'INDEX' not in line]
+    assert not scans, plan
+
+
+@pytest.mark.django_db
+def test_generate_dataset_respects_circulation_rules():
+    from django.core.management import call_command
+    from django.db.models import Sum
+    from bibliothecaire.models import CirculationDailyStat
+    from bibliothecaire.circulation import reconcile_counters
+    from bibliothecaire.search import search_catalogue
+
+    call_command('generate_dataset', '--members', '30', '--media', '200', '--loans', '500', '--reservations', '40',
+                 '--active-loans', '0.1', '--batch-size', '64', stdout=StringIO())
+
+    assert Membre.objects.count() == 30
+    assert Livre.objects.count() == 120
+    assert JeuDePlateau.objects.count() == 20
+    assert Emprunt.objects.count() <= 500
+    assert Emprunt.objects.filter(returned=False).exists()
+    assert not Membre.objects.filter(active_loans__gt=3).exists()
+    assert not Membre.objects.filter(active_reservation__gt=1).exists()
+    assert sum(reconcile_counters(dry_run=True).values()) == 0
+    items, _ = search_catalogue(Livre.objects.first().title.split()[0])
+    assert items
+
+    # The daily statistics follow the history: returns spread over its days,
+    # and a minority of late loans
+    stats = CirculationDailyStat.objects.aggregate(checkouts=Sum('checkouts'), returns=Sum('returns'),
+                                                   overdue=Sum('overdue'))
+    returned_today = CirculationDailyStat.objects.filter(day=timezone.localdate()).aggregate(
+        returns=Sum('returns'))['returns'] or 0
+    assert returned_today < stats['returns'] / 10
+    assert 0 < stats['overdue'] < stats['checkouts'] / 2
+
+
+@pytest.mark.django_db
+def test_run_benchmarks_writes_and_compares_results(tmp_path):
+    import json
+    from django.core.management import call_command
+
+    call_command('generate_dataset', '--members', '20', '--media', '100', '--loans', '300', '--reservations', '40',
+                 '--active-loans', '0.05', stdout=StringIO())
+    output = tmp_path / 'results.json'
+    call_command('run_benchmarks', '--iterations', '2', '--output', str(output), stdout=StringIO())
+
+    results = json.loads(output.read_text())
+    assert results['dataset']['membre'] == 20
+    assert {'login', 'list_media', 'manage_loans', 'membre_search', 'circulation_stats'} <= set(results['results'])
+    assert results['results']['manage_loans']['queries'] > 0
+    assert results['results']['list_media']['p95_ms'] >= results['results']['list_media']['p50_ms']
+
+    # The writes of the scenarios are rolled back
+    assert not Membre.objects.filter(name='Benchmark').exists()
+
+    out = StringIO()
+    call_command('run_benchmarks', '--iterations', '1', '--scenario', 'home', '--compare', str(output),
+                 '--threshold', '100', stdout=out)
+    assert 'No regression.' in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_benchmark_search_reports_the_target(tmp_path):
+    import json
+    from django.core.management import call_command
+
+    call_command('generate_dataset', '--members', '5', '--media', '100', '--loans', '10', '--reservations', '2',
+                 stdout=StringIO())
+    output = tmp_path / 'search.json'
+    out = StringIO()
+    call_command('benchmark_search', '--iterations', '2', '--term', 'le', '--output', str(output), stdout=out)
+
+    results = json.loads(output.read_text())
+    assert results['target_ms'] == 50
+    assert set(results['results']) == {'le (page 1)', 'le (page 5)'}
+    assert results['results']['le (page 1)']['results'] > 0
+
+
+@pytest.mark.django_db
+def test_updates_stamp_updated_at(create_member, create_livre):
+    from bibliothecaire import circulation
+
+    member = create_member()
+    livre = create_livre('Germinal', 'Zola', '1885-01-01')
+    created_at = Livre.objects.get(pk=livre.pk).updated_at
+
+    loan = Emprunt(member=member, media=livre)
+    circulation.check_out(loan)
+    borrowed_at = Livre.objects.get(pk=livre.pk).updated_at
+    assert borrowed_at > created_at
+
+    circulation.check_in(loan)
+    assert Livre.objects.get(pk=livre.pk).updated_at > borrowed_at
+    assert Emprunt.objects.get(pk=loan.pk).updated_at > loan.updated_at
+
+
+@pytest.mark.django_db
+def test_manage_loans_answers_not_modified(client, create_member, create_emprunt, bibliothecaire_user):
+    client.login(username='bibliothecaire', password='password')
+
+    member = create_member()
+    loan = create_emprunt(member=member)
+    url = reverse('manage_loans', args=[member.id])
+    response = client.get(url)
+    assert response.status_code == 200
+    etag = response['ETag']
+    assert response.has_header('Last-Modified')
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    client.post(reverse('return_loan', args=[loan.id]))
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+    Membre.objects.filter(pk=member.pk).update(name='Nouveau nom')
+    assert client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code == 200
+    assert client.get(reverse('manage_loans', args=[0]), HTTP_IF_NONE_MATCH=etag).status_code == 404
+
+
+@pytest.mark.django_db
+def test_list_media_answers_not_modified(client, create_livre, bibliothecaire_user):
+    client.login(username='bibliothecaire', password='password')
+
+    livre = create_livre('Germinal', 'Zola', '1885-01-01')
+    response = client.get(reverse('list_media'))
+    etag, last_modified = response['ETag'], response['Last-Modified']
+    assert client.get(reverse('list_media'), {'type': 'livre'}, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    assert client.get(reverse('list_media'), HTTP_IF_MODIFIED_SINCE=last_modified).status_code == 304
+
+    Livre.objects.filter(pk=livre.pk).update(available=False)
+    assert client.get(reverse('list_media'), HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+@pytest.mark.django_db(transaction=True)
+def test_slow_clients_hold_threads_under_wsgi_only():
+    from bibliothecaire.slow_clients import run_slow_clients
+
+    Livre.objects.create(title='Germinal', author='Zola', publication_date='1885-01-01')
+    wsgi, asgi = run_slow_clients(reverse('membre_api_catalogue'), clients=6, delay=0.05, threads=2)
+    assert wsgi['max_in_flight'] == 2
+    assert asgi['max_in_flight'] == 6
+    assert asgi['wall_s'] < wsgi['wall_s']
+
+
+@pytest.mark.django_db
+def test_sqlite_pragmas_are_applied_to_new_connections(settings):
+    from django.db import connection
+    from bibliothecaire.signals import apply_sqlite_pragmas
+
+    settings.SQLITE_PRAGMAS = {'cache_size': -1234}
+    apply_sqlite_pragmas(sender=connection.__class__, connection=connection)
+    with connection.cursor() as cursor:
+        assert cursor.execute("PRAGMA cache_size").fetchone() == (-1234,)
+        cursor.execute("PRAGMA cache_size = -2000")
+
+
+@pytest.mark.django_db(transaction=True)
+def test_load_test_returns_its_loans(create_member, create_livre):
+    from bibliothecaire.load_test import run_load_test
+
+    members = [create_member(email=f'membre{i}@example.com') for i in range(3)]
+    for i in range(5):
+        create_livre(f'Livre {i}', 'Auteur', '2024-01-01')
+
+    results = run_load_test(duration=0.3, readers=1, writers=1)
+    assert [result['profile'] for result in results] == ['baseline', 'configured']
+    assert all(result['reads'] > 0 for result in results)
+    assert not Emprunt.objects.exists()
+    assert not Livre.objects.filter(available=False).exists()
+    assert not Membre.objects.filter(pk__in=[member.pk for member in members], active_loans__gt=0).exists()
+
+
+@pytest.fixture
+def replica_database(transactional_db, tmp_path):
+    # A second SQLite file as the replica. It is added once pytest-django has
+    # set up the test databases, which it then leaves alone.
+    from django.db import connections
+
+    connections.settings['replica'] = {**connections.settings['default'], 'NAME': str(tmp_path / 'replica.sqlite3')}
+    yield connections['replica']
+    connections['replica'].close()
+    del connections['replica']
+    del connections.settings['replica']
+
+
+def test_replica_router_only_routes_catalogue_reads_in_scope(replica_database):
+    from django.db import router
+    from bibliothecaire.replica import reading_from_replica
+
+    assert router.db_for_read(Livre) == 'default'
+    with reading_from_replica():
+        assert router.db_for_read(Livre) == 'replica'
+        assert router.db_for_read(User) == 'default'
+        assert router.db_for_write(Livre) == 'default'
+        # Reads after a write see it
+        assert router.db_for_read(Livre) == 'default'
+    assert router.db_for_read(Livre) == 'default'
+
+
+@pytest.mark.django_db(transaction=True)
+def test_catalogue_reads_follow_the_replica_and_circulation_the_primary(replica_database, client, create_member,
+                                                                        create_livre, bibliothecaire_user):
+    from django.core.management import call_command
+
+    create_livre('Les Misérables', 'Hugo', '1862-01-01')
+    call_command('sync_replica', stdout=StringIO())
+    media = create_livre('Notre-Dame de Paris', 'Hugo', '1831-01-01')
+    member = create_member()
+
+    def public_titles():
+        api = client.get(reverse('membre_api_catalogue'), {'fields': 'title'}).json()
+        search = client.get(reverse('membre_search'), {'q': 'hugo'})
+        return ({item['title'] for item in api['items']},
+                {item['title'] for item in search.context['items']})
+
+    assert public_titles() == ({'Les Misérables'}, {'Les Misérables'})
+
+    client.login(username='bibliothecaire', password='password')
+    export = client.get(reverse('export_data', args=['membre']))
+    assert b''.join(export.streaming_content).decode().splitlines() == [
+        'id,name,email,active_loans,active_reservation'
+    ]
+
+    # Circulation reads the member and the media from the primary
+    response = client.post(reverse('create_loan'), data={
+        'member': member.id,
+        'media': media.id,
+        'loan_date': timezone.now(),
+        'return_date': timezone.now() + timedelta(days=7),
+    })
+    assert response.status_code == 302
+    assert Emprunt.objects.filter(member=member, media=media).exists()
+
+    # The public search only lists available media, and the loan is now replicated too
+    call_command('sync_replica', stdout=StringIO())
+    assert public_titles() == ({'Les Misérables', 'Notre-Dame de Paris'}, {'Les Misérables'})
+
+
+@pytest.mark.django_db
+def test_sync_replica_requires_a_replica():
+    from django.core.management import CommandError, call_command
+
+    with pytest.raises(CommandError, match="DJANGO_REPLICA_DB_PATH"):
+        call_command('sync_replica')
+
+
+@pytest.mark.django_db
+def test_archive_history_moves_old_finished_rows(create_member, create_livre, create_emprunt, create_reservation):
+    from bibliothecaire.archive import archive_history
+    from bibliothecaire.models import EmpruntArchive, ReservationArchive
+
+    member = create_member()
+    old = timezone.now() - timedelta(days=400)
+    old_loans = [create_emprunt(member=member, media=create_livre(f'Livre {i}', 'Auteur', '2024-01-01'),
+                                returned=True) for i in range(3)]
+    recent_loan = create_emprunt(member=member, media=create_livre('Récent', 'Auteur', '2024-01-01'), returned=True)
+    active_loan = create_emprunt(member=member, media=create_livre('En cours', 'Auteur', '2024-01-01'))
+    old_reservation = create_reservation(member=member, reserved=False)
+    active_reservation = create_reservation(member=member)
+    Emprunt.objects.filter(pk__in=[loan.pk for loan in old_loans] + [active_loan.pk]).update(returned_at=old)
+    Reservation.objects.filter(pk__in=[old_reservation.pk, active_reservation.pk]).update(ended_at=old)
+
+    assert archive_history(batch_size=2) == {'emprunt': 3, 'reservation': 1}
+
+    assert set(Emprunt.objects.values_list('pk', flat=True)) == {recent_loan.pk, active_loan.pk}
+    assert list(Reservation.objects.values_list('pk', flat=True)) == [active_reservation.pk]
+    archived = EmpruntArchive.objects.get(pk=old_loans[0].pk)
+    assert (archived.media_id, archived.member_id, archived.loan_date) == (
+        old_loans[0].media_id, member.pk, old_loans[0].loan_date)
+    assert ReservationArchive.objects.get(pk=old_reservation.pk).jeuDePlateau_id == old_reservation.jeuDePlateau_id
+    assert archive_history() == {'emprunt': 0, 'reservation': 0}
+
+
+@pytest.mark.django_db
+def test_returns_and_ends_record_their_time(create_member, create_emprunt, create_reservation):
+    from bibliothecaire import circulation
+
+    member = create_member()
+    loans = [create_emprunt(member=member) for _ in range(2)]
+    reservations = [create_reservation(member=member) for _ in range(2)]
+    Reservation.objects.filter(pk=reservations[1].pk).update(reservation_end=timezone.now() - timedelta(minutes=1))
+    before = timezone.now()
+    circulation.check_in(loans[0])
+    circulation.check_in_many([loans[1].pk])
+    circulation.end_reservation(reservations[0])
+    circulation.expire_reservations()
+
+    assert all(before <= loan.returned_at <= timezone.now() for loan in Emprunt.objects.all())
+    assert all(before <= reservation.ended_at <= timezone.now() for reservation in Reservation.objects.all())
+
+
+@pytest.mark.django_db
+def test_archive_history_command(create_member, create_emprunt):
+    from django.core.management import call_command
+
+    loan = create_emprunt(member=create_member(), returned=True)
+    Emprunt.objects.filter(pk=loan.pk).update(returned_at=timezone.now() - timedelta(days=40))
+
+    out = StringIO()
+    call_command('archive_history', '--days', '60', stdout=out)
+    assert "0 loans and 0 reservations archived." in out.getvalue()
+    call_command('archive_history', '--days', '30', '--batch-size', '10', stdout=out)
+    assert "1 loans and 0 reservations archived." in out.getvalue()
+    assert not Emprunt.objects.exists()
+
+
+@pytest.mark.django_db
+def test_member_history_shows_archived_rows_on_demand(client, create_member, create_emprunt, create_reservation,
+                                                       bibliothecaire_user):
+    from bibliothecaire.archive import archive_history
+
+    client.login(username='bibliothecaire', password='password')
+    member = create_member()
+    loan = create_emprunt(member=member, returned=True)
+    reservation = create_reservation(member=member, reserved=False)
+    loans_url = reverse('manage_loans', args=[member.id])
+    etag = client.get(loans_url, {'history': 'all'})['ETag']
+    archive_history(days=0)
+
+    response = client.get(loans_url)
+    assert list(response.context['member_emprunts']) == []
+    assert response.context['archived'] is None
+    response = client.get(loans_url, {'history': 'all'}, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert [archived.pk for archived in response.context['archived']] == [loan.pk]
+    assert "Historique archivé" in response.content.decode()
+
+    reservations_url = reverse('manage_reservation', args=[member.id])
+    assert client.get(reservations_url).context['archived'] is None
+    response = client.get(reservations_url, {'history': 'all'})
+    assert [archived.pk for archived in response.context['archived']] == [reservation.pk]
+
+
+def circulation_stats():
+    from bibliothecaire.models import CirculationDailyStat
+    return {(stat.day, stat.kind): (stat.checkouts, stat.returns, stat.overdue, stat.reservations,
+                                    stat.reservations_ended)
+            for stat in CirculationDailyStat.objects.all()}
+
+
+@pytest.mark.django_db
+def test_circulation_updates_daily_stats(create_member, create_livre, create_cd, create_jeu_de_plateau):
+    from bibliothecaire import circulation
+    from bibliothecaire.stats import rebuild_stats
+
+    member = create_member()
+    now = timezone.now()
+    today, last_week = timezone.localdate(now), timezone.localdate(now - timedelta(days=7))
+    loan = Emprunt(media=create_livre('Livre', 'Auteur', '2024-01-01'), member=member,
+                   loan_date=now - timedelta(days=10), return_date=now - timedelta(days=7))
+    circulation.check_out(loan)
+    circulation.check_out_many(member, [create_livre('Autre', 'Auteur', '2024-01-01').pk,
+                                        create_cd('CD', 'Auteur', '2024-01-01', 'Artiste').pk],
+                                now, now + timedelta(days=7))
+    circulation.sweep_overdue_loans()
+    circulation.check_in(loan)
+    reservation = Reservation(jeuDePlateau=create_jeu_de_plateau('Jeu', 'Créateur'), member=member)
+    circulation.reserve(reservation)
+    circulation.end_reservation(reservation)
+
+    expected = {
+        (timezone.localdate(now - timedelta(days=10)), 'livre'): (1, 0, 0, 0, 0),
+        (last_week, 'livre'): (0, 0, 1, 0, 0),
+        (today, 'livre'): (1, 1, 0, 0, 0),
+        (today, 'cd'): (1, 0, 0, 0, 0),
+        (today, 'jeu'): (0, 0, 0, 1, 1),
+    }
+    assert circulation_stats() == expected
+
+    # The backfill finds the same counts in the loans and reservations
+    assert rebuild_stats() == len(expected)
+    assert circulation_stats() == expected
+
+
+@pytest.mark.django_db
+def test_late_returns_count_as_overdue_without_the_sweeper(create_member, create_livre, create_emprunt):
+    from bibliothecaire import circulation
+    from bibliothecaire.stats import rebuild_stats
+
+    member = create_member()
+    now = timezone.now()
+    late = [create_emprunt(member=member, media=create_livre(f'Livre {i}', 'Auteur', '2024-01-01'),
+                           loan_date=now - timedelta(days=20), return_date=now - timedelta(days=6))
+            for i in range(3)]
+    on_time = create_emprunt(member=member, media=create_livre('A temps', 'Auteur', '2024-01-01'))
+    circulation.check_in(late[0])
+    circulation.check_in_many([late[1].pk, late[2].pk, on_time.pk])
+
+    # The loans were not checked out through circulation, compare the returns
+    # and overdue counts only
+    live = {key: counts[1:3] for key, counts in circulation_stats().items()}
+    assert live == {(timezone.localdate(now - timedelta(days=6)), 'livre'): (0, 3),
+                    (timezone.localdate(now), 'livre'): (4, 0)}
+    rebuild_stats()
+    assert {key: counts[1:3] for key, counts in circulation_stats().items() if any(counts[1:3])} == live
+
+
+@pytest.mark.django_db
+def test_rebuild_circulation_stats_counts_archived_history(create_member, create_emprunt, create_reservation):
+    from django.core.management import call_command
+    from bibliothecaire.archive import archive_history
+
+    member = create_member()
+    create_emprunt(member=member, returned=True)
+    create_reservation(member=member, reserved=False)
+    archive_history(days=0)
+
+    out = StringIO()
+    call_command('rebuild_circulation_stats', stdout=out)
+    assert "Computed 2 daily statistics" in out.getvalue()
+    today = timezone.localdate()
+    assert circulation_stats() == {(today, 'livre'): (1, 1, 0, 0, 0), (today, 'jeu'): (0, 0, 0, 1, 1)}
+
+
+@pytest.mark.django_db
+def test_circulation_stats_view_reads_the_rollups(client, bibliothecaire_user):
+    from bibliothecaire.models import CirculationDailyStat
+
+    client.login(username='bibliothecaire', password='password')
+    today = timezone.localdate()
+    CirculationDailyStat.objects.create(day=today, kind='livre', checkouts=3, returns=1)
+    CirculationDailyStat.objects.create(day=today, kind='jeu', reservations=2)
+    CirculationDailyStat.objects.create(day=today - timedelta(days=400), kind='livre', checkouts=5)
+    url = reverse('circulation_stats')
+    baseline = count_queries(client, url)
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert [(row['day'], row['total_checkouts'], row['total_reservations'])
+            for row in response.context['days']] == [(today, 3, 2)]
+    assert [(row['label'], row['total_checkouts']) for row in response.context['kinds']] == [
+        ('Jeux de plateau', 0), ('Livres', 3)]
+    assert sum(row['total_checkouts'] for row in response.context['months']) == 3
+
+    CirculationDailyStat.objects.bulk_create([
+        CirculationDailyStat(day=today - timedelta(days=i), kind=kind, checkouts=1)
+        for i in range(1, 60) for kind in ('cd', 'dvd')
+    ])
+    assert count_queries(client, url) == baseline
+
+
+@pytest.mark.django_db
+def test_scheduled_jobs_run_once_per_interval_across_processes():
+    from bibliothecaire.scheduler import claim_run
+
+    now = timezone.now()
+    # Two worker processes checking at the same time
+    assert [claim_run('sweep', 60, now), claim_run('sweep', 60, now)] == [True, False]
+    assert not claim_run('sweep', 60, now + timedelta(seconds=59))
+    assert claim_run('expire', 60, now)
+    assert claim_run('sweep', 60, now + timedelta(seconds=60))
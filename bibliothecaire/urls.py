@@ -8,12 +8,19 @@ urlpatterns = [
     path('members/update/<int:member_id>/', views.update_member, name='update_member'),
     path('members/delete/<int:member_id>/', views.delete_member, name='delete_member'),
     path('media/', views.list_media, name='list_media'),
+    path('media/search/', views.search_media, name='search_media'),
     path('media/create/', views.create_media, name='create_media'),
     path('loan/create/', views.create_loan, name='create_loan'),
+    path('loan/batch/create/', views.batch_checkout, name='batch_checkout'),
+    path('loan/batch/return/<int:member_id>/', views.batch_return, name='batch_return'),
     path('loan/manage/<int:member_id>/', views.manage_loans, name='manage_loans'),
+    path('loan/overdue/', views.overdue_loans, name='overdue_loans'),
     path('loan/return/<int:loan_id>/', views.return_loan, name='return_loan'),
     path('reservation/create/', views.create_reservation, name='create_reservation'),
     path('reservation/manage/<int:member_id>/', views.manage_reservation, name='manage_reservation'),
     path('reservation/end/<int:reservation_id>/', views.end_reservation, name='end_reservation'),
+    path('stats/', views.circulation_stats, name='circulation_stats'),
+    path('export/', views.list_exports, name='list_exports'),
+    path('export/<str:dataset>/', views.export_data, name='export_data'),
 
 ]
@@ -1,25 +1,56 @@
+from django.core.paginator import Paginator
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
-from bibliothecaire.models import Membre, Livre, Dvd, Cd, JeuDePlateau, Emprunt, Reservation
+from bibliothecaire.models import Membre, Emprunt, Reservation
 from bibliothecaire.forms import MembreForm, MediaForm, EmpruntForm, LivreForm, DvdForm, CdForm, JeuDePlateauForm, \
-    ReservationForm
+    ReservationForm, BatchEmpruntForm
 import logging
-from django.utils import timezone
 from .decorators import bibliothecaire_required
+from . import circulation, exports, stats
+from .catalogue import catalogue_page_from_request
+from .conditional import conditional_page, catalogue_validators, member_loans_validators, \
+    member_reservations_validators
+from .replica import replica_reads
+from .search import search_page_from_request
 
 # Set up logging
 logger = logging.getLogger('bibliothecaire')
 
+# Number of loans or reservations shown on one page of a member's history
+HISTORY_PAGE_SIZE = 25
+
 
 def get_user(request):
     user = request.user
     return user
 
 
+def log_context(request, action, object_id=None):
+    # Structured fields added to the log records, see mediatheque_project/log_handlers.py
+    return {'extra': {'user': get_user(request).username, 'action': action, 'object_id': object_id}}
+
+
+def get_overdue_message(member):
+    # Fetch the member's overdue loans and their titles in one indexed query
+    overdue_loans = list(Emprunt.objects.overdue()
+                         .filter(member=member)
+                         .order_by('pk')
+                         .values_list('media__title', 'return_date'))
+    if not overdue_loans:
+        return None
+
+    overdue_message = f"Les emprunts suivants pour {member.name} sont en retard:<br>"
+    for title, return_date in overdue_loans:
+        formatted_date = return_date.strftime("%Y-%m-%d %H:%M")
+        overdue_message += f"- {title} (Due le {formatted_date})<br>"
+    return overdue_message
+
+
 @bibliothecaire_required
 # Home view for the librarian app
 def home(request):
 
-    logger.info(f"User {get_user(request).username} accessed the home view.")
+    logger.info("User %s accessed the home view.", get_user(request).username, **log_context(request, 'home'))
     return render(request, 'home.html')
 
 
@@ -27,7 +58,7 @@ def home(request):
 # List of members
 def list_members(request):
     members = Membre.objects.all()
-    logger.info(f"User {get_user(request).username} listed all members.")
+    logger.info("User %s listed all members.", get_user(request).username, **log_context(request, 'list_members'))
     return render(request, 'members/list_members.html', {'members': members})
 
 
@@ -37,11 +68,13 @@ def create_member(request):
     if request.method == 'POST':
         form = MembreForm(request.POST)
         if form.is_valid():
-            form.save()
-            logger.info(f"User {get_user(request).username} created a new member.")
+            member = form.save()
+            logger.info("User %s created a new member.", get_user(request).username,
+                        **log_context(request, 'create_member', member.pk))
             return redirect('list_members')
         else:
-            logger.warning(f"User {get_user(request).username} failed to create a new member. Invalid form data.")
+            logger.warning("User %s failed to create a new member. Invalid form data.", get_user(request).username,
+                           **log_context(request, 'create_member'))
     else:
         form = MembreForm()
     return render(request, 'members/create_member.html', {'form': form})
@@ -55,11 +88,12 @@ def update_member(request, member_id):
         form = MembreForm(request.POST, instance=member)
         if form.is_valid():
             form.save()
-            logger.info(f"User {get_user(request).username} updated member with ID {member_id}.")
+            logger.info("User %s updated member with ID %s.", get_user(request).username, member_id,
+                        **log_context(request, 'update_member', member_id))
             return redirect('list_members')
         else:
-            logger.warning(f"User {get_user(request).username} failed to update member with ID {member_id}. Invalid "
-                           f"form data.")
+            logger.warning("User %s failed to update member with ID %s. Invalid form data.",
+                           get_user(request).username, member_id, **log_context(request, 'update_member', member_id))
     else:
         form = MembreForm(instance=member)
     return render(request, 'members/update_member.html', {'form': form})
@@ -71,25 +105,31 @@ def delete_member(request, member_id):
     member = get_object_or_404(Membre, pk=member_id)
     if request.method == 'POST':
         member.delete()
-        logger.info(f"User {get_user(request).username} deleted member with ID {member_id}.")
+        logger.info("User %s deleted member with ID %s.", get_user(request).username, member_id,
+                    **log_context(request, 'delete_member', member_id))
         return redirect('list_members')
     return render(request, 'members/delete_member.html', {'member': member})
 
 
 @bibliothecaire_required
-# List all media
+@replica_reads
+@conditional_page(catalogue_validators)
+# List all media, one page at a time
 def list_media(request):
-    livres = Livre.objects.all()
-    dvds = Dvd.objects.all()
-    cds = Cd.objects.all()
-    jeux = JeuDePlateau.objects.all()
-    logger.info(f"User {get_user(request).username} listed all media items.")
-    return render(request, 'media/list_media.html', {
-        'livres': livres,
-        'dvds': dvds,
-        'cds': cds,
-        'jeux': jeux
-    })
+    context = catalogue_page_from_request(request)
+    logger.info("User %s listed media items.", get_user(request).username, **log_context(request, 'list_media'))
+    return render(request, 'media/list_media.html', context)
+
+
+@bibliothecaire_required
+@replica_reads
+@conditional_page(catalogue_validators)
+# Search the catalogue
+def search_media(request):
+    context = search_page_from_request(request)
+    logger.info("User %s searched the catalogue for '%s'.", get_user(request).username, context['query'],
+                **log_context(request, 'search_media'))
+    return render(request, 'media/search_media.html', context)
 
 
 @bibliothecaire_required
@@ -114,12 +154,13 @@ def create_media(request):
             form = MediaForm(request.POST)
 
         if form.is_valid():
-            form.save()
-            logger.info(f"User {get_user(request).username} created a new media item of type {media_type}.")
+            media = form.save()
+            logger.info("User %s created a new media item of type %s.", get_user(request).username, media_type,
+                        **log_context(request, 'create_media', media.pk))
             return redirect('home')
         else:
-            logger.warning(f"User {get_user(request).username} failed to create media of type {media_type}. Invalid "
-                           f"form data.")
+            logger.warning("User %s failed to create media of type %s. Invalid form data.",
+                           get_user(request).username, media_type, **log_context(request, 'create_media'))
 
     return render(request, 'media/create_media.html', {
         'dvdForm': dvdForm,
@@ -140,29 +181,19 @@ def create_loan(request):
         if form.is_valid():
             loan = form.save(commit=False)
             if loan.member.active_loans >= 3:
-                logger.warning(f"Member {loan.member.name} has reached the loan "
-                               f"limit.")
+                logger.warning("Member %s has reached the loan limit.", loan.member.name,
+                               **log_context(request, 'create_loan', loan.member_id))
                 return render(request, 'error.html', {
                     'message': f"{loan.member.name}, ne peut pas avoir plus de 3 emprunts actifs.",
                     'url': errorUrl[0],
                     'urlTitle': errorUrl[1],
                 })
-            else:
-                overdue_loans = []
-
-                # Iterate through all emprunt objects related to the member
-                for emprunt in loan.member.emprunt_set.all():
-                    if not emprunt.returned and timezone.now() > emprunt.return_date:
-                        overdue_loans.append(emprunt)
 
             # If there are any overdue loans, generate an error message
-            if overdue_loans:
-                overdue_message = f"Les emprunts suivants pour {loan.member.name} sont en retard:<br>"
-                for emprunt in overdue_loans:
-                    formatted_date = emprunt.return_date.strftime("%Y-%m-%d %H:%M")
-                    overdue_message += f"- {emprunt.media.title} (Due le {formatted_date})<br>"
-
-                logger.warning(f"Member {loan.member.name} has overdue loans.")
+            overdue_message = get_overdue_message(loan.member)
+            if overdue_message:
+                logger.warning("Member %s has overdue loans.", loan.member.name,
+                               **log_context(request, 'create_loan', loan.member_id))
                 return render(request, 'error.html', {
                     'message': overdue_message,
                     'url': errorUrl[0],
@@ -170,15 +201,26 @@ def create_loan(request):
                 })
 
             elif loan.loan_date > loan.return_date:
-                logger.warning("loan date was set incorrectly.")
+                logger.warning("loan date was set incorrectly.", **log_context(request, 'create_loan', loan.member_id))
                 return render(request, 'error.html', {
                     'message': "La date du emprunt a été mal définie, indiquez une date correcte.",
                     'url': errorUrl[0],
                     'urlTilte': errorUrl[1],
                 })
 
-            loan.save_emprunt()
-            logger.info(f"User {get_user(request).username} created a loan for member {loan.member.name}.")
+            try:
+                circulation.check_out(loan)
+            except circulation.CirculationError as error:
+                logger.warning("Loan for member %s was refused: %s.", loan.member.name, error.reason,
+                               **log_context(request, 'create_loan', loan.member_id))
+                return render(request, 'error.html', {
+                    'message': error.message,
+                    'url': errorUrl[0],
+                    'urlTilte': errorUrl[1],
+                })
+
+            logger.info("User %s created a loan for member %s.", get_user(request).username, loan.member.name,
+                        **log_context(request, 'create_loan', loan.pk))
             return redirect('list_members')
     else:
         form = EmpruntForm()
@@ -189,49 +231,167 @@ def create_loan(request):
 # Return a loanbibliothecaire_emprunt
 def return_loan(request, loan_id):
     loan = get_object_or_404(Emprunt, pk=loan_id)
-    loan.returned = True
-    loan.save_emprunt()
-    logger.info(f"Loan with ID {loan_id} has been returned.")
-    return redirect('manage_loans', member_id=loan.member.pk)
+    try:
+        circulation.check_in(loan)
+    except circulation.CirculationError as error:
+        logger.warning("Loan with ID %s could not be returned: %s.", loan_id, error.reason,
+                       **log_context(request, 'return_loan', loan_id))
+        return render(request, 'error.html', {
+            'message': error.message,
+            'url': 'list_members',
+            'urlTilte': 'Retour à la liste des membres',
+        })
+    logger.info("Loan with ID %s has been returned.", loan_id, **log_context(request, 'return_loan', loan_id))
+    return redirect('manage_loans', member_id=loan.member_id)
+
+
+@bibliothecaire_required
+# Lend several media to one member at once
+def batch_checkout(request):
+    errorUrl = ['batch_checkout', 'retourner à la page du création']
+    if request.method == 'POST':
+        form = BatchEmpruntForm(request.POST)
+        if form.is_valid():
+            member = form.cleaned_data['member']
+            media_ids = [media.pk for media in form.cleaned_data['medias']]
+
+            overdue_message = get_overdue_message(member)
+            if overdue_message:
+                logger.warning("Member %s has overdue loans.", member.name,
+                               **log_context(request, 'batch_checkout', member.pk))
+                return render(request, 'error.html', {
+                    'message': overdue_message,
+                    'url': errorUrl[0],
+                    'urlTilte': errorUrl[1],
+                })
+
+            elif form.cleaned_data['loan_date'] > form.cleaned_data['return_date']:
+                logger.warning("loan date was set incorrectly.", **log_context(request, 'batch_checkout', member.pk))
+                return render(request, 'error.html', {
+                    'message': "La date du emprunt a été mal définie, indiquez une date correcte.",
+                    'url': errorUrl[0],
+                    'urlTilte': errorUrl[1],
+                })
+
+            try:
+                circulation.check_out_many(member, media_ids,
+                                           form.cleaned_data['loan_date'], form.cleaned_data['return_date'])
+            except circulation.CirculationError as error:
+                logger.warning("Batch loan for member %s was refused: %s.", member.name, error.reason,
+                               **log_context(request, 'batch_checkout', member.pk))
+                return render(request, 'error.html', {
+                    'message': error.message,
+                    'url': errorUrl[0],
+                    'urlTilte': errorUrl[1],
+                })
+
+            logger.info("User %s created %d loans for member %s.", get_user(request).username, len(media_ids),
+                        member.name, **log_context(request, 'batch_checkout', member.pk))
+            return redirect('manage_loans', member_id=member.pk)
+    else:
+        form = BatchEmpruntForm()
+    return render(request, 'loan/batch_checkout.html', {'form': form})
+
+
+@bibliothecaire_required
+# Return several loans of one member at once
+def batch_return(request, member_id):
+    member = get_object_or_404(Membre, pk=member_id)
+    if request.method == 'POST':
+        try:
+            loan_ids = {int(loan_id) for loan_id in request.POST.getlist('loan_ids')}
+        except ValueError:
+            loan_ids = set()
+
+        if loan_ids:
+            try:
+                returned = circulation.check_in_many(loan_ids, member=member)
+            except circulation.CirculationError as error:
+                logger.warning("Batch return for member with ID %s was refused: %s.", member_id, error.reason,
+                               **log_context(request, 'batch_return', member_id))
+                return render(request, 'error.html', {
+                    'message': error.message,
+                    'url': 'list_members',
+                    'urlTilte': 'Retour à la liste des membres',
+                })
+            logger.info("User %s returned %d loans for member with ID %s.", get_user(request).username, returned,
+                        member_id, **log_context(request, 'batch_return', member_id))
+    return redirect('manage_loans', member_id=member_id)
+
+
+def archived_history(request, queryset):
+    # Archived rows (see archive.py) are only read on demand, with ?history=all
+    if request.GET.get('history') != 'all':
+        return None
+    return Paginator(queryset, HISTORY_PAGE_SIZE).get_page(request.GET.get('archive_page'))
 
 
 @bibliothecaire_required
+@conditional_page(member_loans_validators)
 def manage_loans(request, member_id):
     member = get_object_or_404(Membre, pk=member_id)
 
     # Get the sorting parameter from the query string, default to 'date'
     sort_by = request.GET.get('sort_by', 'date')  # 'date' or 'returned'
 
-    member_emprunts = member.emprunt_set.all()
+    member_emprunts = member.emprunt_set.select_related('media')
 
     # Sorting logic
     if sort_by == 'returned':
-        sorted_emprunts = sorted(member_emprunts, key=lambda e: (e.returned, -e.loan_date.timestamp()))
+        member_emprunts = member_emprunts.order_by('returned', '-loan_date', 'pk')
     elif sort_by == 'date':
-        sorted_emprunts = sorted(member_emprunts, key=lambda e: e.loan_date)
+        member_emprunts = member_emprunts.order_by('loan_date', 'pk')
     else:
-        sorted_emprunts = member_emprunts  # No sorting or default
+        member_emprunts = member_emprunts.order_by('pk')  # No sorting or default
 
-    logger.info(f"User {get_user(request).username} is managing loans for member with ID {member_id}." 
-                f"Sorted by {sort_by}.")
+    page = Paginator(member_emprunts, HISTORY_PAGE_SIZE).get_page(request.GET.get('page'))
+    archived = archived_history(request, member.empruntarchive_set.select_related('media')
+                                .order_by('-loan_date', '-pk'))
+
+    logger.info("User %s is managing loans for member with ID %s. Sorted by %s.", get_user(request).username,
+                member_id, sort_by, **log_context(request, 'manage_loans', member_id))
     return render(request, 'loan/manage_loans.html',
                   {
                       'member': member,
-                      'member_emprunts': sorted_emprunts,
-                      'sort_by': sort_by
+                      'member_emprunts': page,
+                      'page': page,
+                      'sort_by': sort_by,
+                      'archived': archived,
                   })
 
 
+@bibliothecaire_required
+@replica_reads
+# List the loans flagged as overdue by the sweeper
+def overdue_loans(request):
+    loans = Emprunt.objects.filter(overdue=True).select_related('media', 'member').order_by('return_date', 'pk')
+    page = Paginator(loans, HISTORY_PAGE_SIZE).get_page(request.GET.get('page'))
+    logger.info("User %s listed overdue loans.", get_user(request).username,
+                **log_context(request, 'overdue_loans'))
+    return render(request, 'loan/overdue_loans.html', {'loans': page, 'page': page})
+
+
+@bibliothecaire_required
+# Circulation dashboard, read from the daily rollups
+def circulation_stats(request):
+    dashboard = stats.dashboard()
+    logger.info("User %s viewed the circulation statistics.", get_user(request).username,
+                **log_context(request, 'circulation_stats'))
+    return render(request, 'stats/circulation_stats.html', dashboard)
+
+
 @bibliothecaire_required
 def create_reservation(request):
     errorUrl = ['create_reservation', 'Retour à la réservation']
-    logger.info(f'User {get_user(request).username} accessed the reservation page.')
+    logger.info("User %s accessed the reservation page.", get_user(request).username,
+                **log_context(request, 'create_reservation'))
     if request.method == 'POST':
         form = ReservationForm(request.POST)
         if form.is_valid():
             reservation = form.save(commit=False)
             if not reservation.jeuDePlateau.available:
-                logger.warning("Attempted to reserve an already reserved game.")
+                logger.warning("Attempted to reserve an already reserved game.",
+                               **log_context(request, 'create_reservation', reservation.jeuDePlateau_id))
                 return render(request, 'error.html', {
                     'message': "Ce jeu est déjà réservé. ",
                     'url': errorUrl[0],
@@ -240,7 +400,8 @@ def create_reservation(request):
                 })
 
             elif reservation.reservation_time > reservation.reservation_end:
-                logger.warning("Reservation time was set incorrectly.")
+                logger.warning("Reservation time was set incorrectly.",
+                               **log_context(request, 'create_reservation', reservation.member_id))
                 return render(request, 'error.html', {
                     'message': "Mettez une heure de réservation correcte.",
                     'url': errorUrl[0],
@@ -248,38 +409,97 @@ def create_reservation(request):
                 })
 
             if reservation.member.active_reservation >= 1:
-                logger.warning(f"Member {reservation.member.name} has reached the reservation limit.")
+                logger.warning("Member %s has reached the reservation limit.", reservation.member.name,
+                               **log_context(request, 'create_reservation', reservation.member_id))
                 return render(request, 'error.html', {
                     'message': f"{reservation.member.name}, ne peut pas réserver plus d'un jeu en même temps. ",
                     'url': errorUrl[0],
                     'urlTilte': errorUrl[1],
                 })
 
-            reservation.save_reservation()
-            logger.info(f"User {get_user(request).username} created a reservation" 
-                        f"for member {reservation.member.name}.")
+            try:
+                circulation.reserve(reservation)
+            except circulation.CirculationError as error:
+                logger.warning("Reservation for member %s was refused: %s.", reservation.member.name, error.reason,
+                               **log_context(request, 'create_reservation', reservation.member_id))
+                return render(request, 'error.html', {
+                    'message': error.message,
+                    'url': errorUrl[0],
+                    'urlTilte': errorUrl[1],
+                })
+
+            logger.info("User %s created a reservation for member %s.", get_user(request).username,
+                        reservation.member.name, **log_context(request, 'create_reservation', reservation.pk))
             return redirect('home')
         else:
-            logger.warning("Failed to create reservation. Invalid form data.")
+            logger.warning("Failed to create reservation. Invalid form data.",
+                           **log_context(request, 'create_reservation'))
 
     return render(request, 'boardGames/reserve_game.html', {'form': ReservationForm})
 
 
 @bibliothecaire_required
+@conditional_page(member_reservations_validators)
 def manage_reservation(request, member_id):
     member = get_object_or_404(Membre, pk=member_id)
-    member_reservation = sorted(member.reservation_set.all(), key=lambda r: (
-        not r.reserved,
-        -r.reservation_time.timestamp())
-        )
-    logger.info(f"User {get_user(request).username} is managing reservations for member with ID {member_id}.")
-    return render(request, 'boardGames/manage_reservation.html', {'member': member, 'reservations': member_reservation})
+    member_reservation = member.reservation_set.select_related('jeuDePlateau').order_by(
+        '-reserved', '-reservation_time', 'pk'
+    )
+    page = Paginator(member_reservation, HISTORY_PAGE_SIZE).get_page(request.GET.get('page'))
+    archived = archived_history(request, member.reservationarchive_set.select_related('jeuDePlateau')
+                                .order_by('-reservation_time', '-pk'))
+    logger.info("User %s is managing reservations for member with ID %s.", get_user(request).username, member_id,
+                **log_context(request, 'manage_reservation', member_id))
+    return render(request, 'boardGames/manage_reservation.html', {
+        'member': member,
+        'reservations': page,
+        'page': page,
+        'archived': archived,
+    })
 
 
 @bibliothecaire_required
 def end_reservation(request, reservation_id):
     reservation = get_object_or_404(Reservation, pk=reservation_id)
-    reservation.reserved = False
-    reservation.save_reservation()
-    logger.info(f"User {get_user(request).username} ended reservation with ID {reservation_id}.")
-    return redirect('manage_reservation', member_id=reservation.member.pk)
+    try:
+        circulation.end_reservation(reservation)
+    except circulation.CirculationError as error:
+        logger.warning("Reservation with ID %s could not be ended: %s.", reservation_id, error.reason,
+                       **log_context(request, 'end_reservation', reservation_id))
+        return render(request, 'error.html', {
+            'message': error.message,
+            'url': 'list_members',
+            'urlTilte': 'Retour à la liste des membres',
+        })
+    logger.info("User %s ended reservation with ID %s.", get_user(request).username, reservation_id,
+                **log_context(request, 'end_reservation', reservation_id))
+    return redirect('manage_reservation', member_id=reservation.member_id)
+
+
+@bibliothecaire_required
+# List the datasets that can be exported
+def list_exports(request):
+    return render(request, 'exports/list_exports.html', {
+        'datasets': list(exports.DATASETS),
+        'formats': list(exports.FORMATS),
+    })
+
+
+@bibliothecaire_required
+@replica_reads
+# Stream a dataset as CSV or JSONL, optionally gzip-compressed
+def export_data(request, dataset):
+    export_format = request.GET.get('format', 'csv')
+    compress = request.GET.get('gzip') == '1'
+    if dataset not in exports.DATASETS or export_format not in exports.FORMATS:
+        raise Http404("Export inconnu.")
+
+    response = StreamingHttpResponse(
+        exports.export_chunks(dataset, export_format, compress),
+        content_type='application/gzip' if compress else exports.FORMATS[export_format]
+    )
+    response['Content-Disposition'] = (f'attachment; filename="'
+                                       f'{exports.export_filename(dataset, export_format, compress)}"')
+    logger.info("User %s exported %s as %s.", get_user(request).username, dataset, export_format,
+                **log_context(request, 'export_data'))
+    return response
@@ -0,0 +1,11 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # Primary keys are reused between tests, so cached catalogue pages must
+    # not survive a test
+    from bibliothecaire.catalogue_cache import catalogue_cache
+    catalogue_cache().clear()
+    yield
+    catalogue_cache().clear()
@@ -3,6 +3,27 @@ ASGI config for mediatheque_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Deployment profile
+------------------
+
+The public pages of the ``membre`` app (catalogue, search and JSON API) are
+async views, and every middleware in MIDDLEWARE handles both sync and async
+requests, so under ASGI a request to them never holds a thread while the
+client sends its request or reads the response. Their queries run in the
+single thread Django keeps for sync code, one at a time. The librarian pages
+are still sync views and run in that same thread.
+
+Run one process per CPU core behind the reverse proxy, for instance::
+
+    gunicorn mediatheque_project.asgi:application -k uvicorn.workers.UvicornWorker \
+        --workers 4 --timeout 30 --keep-alive 5
+
+or ``uvicorn mediatheque_project.asgi:application --workers 4``. Keep
+CONN_MAX_AGE at 0, Django does not support persistent connections under ASGI.
+
+``manage.py benchmark_slow_clients`` compares how many slow clients one
+process holds at once under WSGI and under ASGI.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -14,3 +35,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mediatheque_project.settings')
 
 application = get_asgi_application()
+
+# Periodic jobs (overdue sweep, ...) only run in server processes
+from bibliothecaire.scheduler import start_scheduled_jobs  # noqa: E402
+
+start_scheduled_jobs()
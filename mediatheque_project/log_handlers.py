@@ -0,0 +1,191 @@
+import atexit
+import copy
+import datetime
+import gzip
+import json
+import logging
+import logging.config
+import os
+import queue
+import shutil
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Attributes of a LogRecord carried over to the JSON output when set with
+# logger.info(..., extra={...})
+CONTEXT_FIELDS = ('user', 'action', 'object_id')
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format records as one JSON object per line.
+    """
+
+    def format(self, record):
+        data = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exception'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class CompressedRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler that can gzip the files it rotates out.
+    """
+
+    def __init__(self, filename, compress=False, **kwargs):
+        super().__init__(filename, **kwargs)
+        if compress:
+            self.namer = self.gzip_name
+            self.rotator = self.gzip_rotate
+
+    @staticmethod
+    def gzip_name(name):
+        return f"{name}.gz"
+
+    @staticmethod
+    def gzip_rotate(source, dest):
+        with open(source, 'rb') as source_file, gzip.open(dest, 'wb') as dest_file:
+            shutil.copyfileobj(source_file, dest_file)
+        os.remove(source)
+
+
+class DrainingQueueListener(QueueListener):
+    """
+    QueueListener which waits for room in a full queue when it is stopped,
+    instead of failing.
+    """
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Hand records over to a background thread which writes them to the
+    handlers named in `handlers`, so that logging never waits on disk or
+    console I/O.
+
+    The queue is bounded: when the writer falls behind, records are dropped
+    rather than blocking the caller, and the number of dropped records is
+    logged once the queue has room again. The thread is only started by the
+    first record, and restarted in forked worker processes.
+
+    `handlers` holds handler objects, or the names of handlers of the same
+    logging configuration, which configure_logging() connects once every
+    handler is set up.
+    """
+
+    def __init__(self, handlers, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.handlers = list(handlers)
+        self.dropped = 0
+        self.listener = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def connect(self, configured):
+        """
+        Replace the handler names by the handlers of that name in
+        `configured`, a mapping of names to configured handlers.
+        """
+        handlers = []
+        for handler in self.handlers:
+            if not isinstance(handler, logging.Handler):
+                if not isinstance(configured.get(handler), logging.Handler):
+                    raise ValueError(f"The queue handler writes to {handler!r}, which is not a configured "
+                                     f"logging handler.")
+                handler = configured[handler]
+            handlers.append(handler)
+        self.handlers = handlers
+
+    def start(self):
+        with self._lock:
+            if self.listener is not None and self._pid == os.getpid():
+                return
+            names = [handler for handler in self.handlers if not isinstance(handler, logging.Handler)]
+            if names:
+                raise RuntimeError(f"The queue handler was not connected to {', '.join(map(repr, names))}, "
+                                   f"configure logging with configure_logging().")
+            self.listener = DrainingQueueListener(self.queue, *self.handlers, respect_handler_level=True)
+            self.listener.start()
+            self._pid = os.getpid()
+            atexit.register(self.stop)
+
+    def stop(self):
+        with self._lock:
+            if self.listener is not None and self._pid == os.getpid():
+                self.listener.stop()
+            self.listener = None
+
+    def emit(self, record):
+        if self.listener is None or self._pid != os.getpid():
+            self.start()
+        super().emit(record)
+
+    def prepare(self, record):
+        # The message is merged with its arguments here, as they may change
+        # before the record is written. Records below the logger's level
+        # never get this far, so they are never formatted at all.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            try:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'name': __name__,
+                    'levelno': logging.WARNING,
+                    'levelname': 'WARNING',
+                    'msg': "%d log records were dropped because the logging queue was full.",
+                    'args': (dropped,),
+                }))
+            except queue.Full:
+                self.dropped += dropped
+
+    def flush(self):
+        """
+        Wait until the records queued so far are written.
+        """
+        with self._lock:
+            if self.listener is not None and self._pid == os.getpid():
+                self.listener.stop()
+                self.listener.start()
+
+
+def configure_logging(config):
+    """
+    dictConfig() the given configuration, then connect the queue handlers to
+    the handlers they name, whatever the order in which they were set up.
+    Used as Django's LOGGING_CONFIG.
+    """
+    configurator = logging.config.dictConfigClass(config)
+    configurator.configure()
+    # dictConfig replaces each handler's configuration by the handler itself
+    configured = dict(configurator.config.get('handlers', {}))
+    for handler in configured.values():
+        if isinstance(handler, NonBlockingQueueHandler):
+            handler.connect(configured)
@@ -0,0 +1,169 @@
+import heapq
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('mediatheque_project.sql')
+
+DEFAULT_SQL_INSTRUMENTATION = {
+    # Share of the requests that are instrumented, between 0 and 1
+    'SAMPLE_RATE': 1.0,
+    # Number of slowest statements reported for each request
+    'SLOWEST': 3,
+    # A query shape run at least this many times in one request is reported
+    # as a probable N+1
+    'N_PLUS_ONE_THRESHOLD': 10,
+    # Whether to add a Server-Timing header to the response
+    'SERVER_TIMING': True,
+}
+
+# Statements are cut to this length in the log
+MAX_SQL_LENGTH = 300
+
+IN_LIST_RE = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+NUMBER_RE = re.compile(r'\b\d+\b')
+
+
+def sql_shape(sql):
+    """
+    Reduce a statement to its shape: the parameters are already placeholders,
+    so only the length of IN lists and the numbers inlined by the ORM (LIMIT,
+    OFFSET) are left to normalise.
+    """
+    return NUMBER_RE.sub('N', IN_LIST_RE.sub('(...)', sql))
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper recording the number, duration and SQL of the
+    queries run while it is installed.
+    """
+
+    def __init__(self, slowest):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.slowest = []
+        self.max_slowest = slowest
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            # Shapes are only computed once per distinct statement, at the end
+            self.statements[sql] += 1
+            if self.max_slowest:
+                entry = (duration, self.count, sql)
+                if len(self.slowest) < self.max_slowest:
+                    heapq.heappush(self.slowest, entry)
+                elif entry > self.slowest[0]:
+                    heapq.heapreplace(self.slowest, entry)
+
+    def repeated_shapes(self, threshold):
+        shapes = Counter()
+        for sql, count in self.statements.items():
+            shapes[sql_shape(sql)] += count
+        return [(shape, count) for shape, count in shapes.most_common() if count >= threshold]
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Record the queries of a sample of the requests: their number, the time
+    spent in the database and the slowest statements. They are sent as a
+    Server-Timing header and a JSON log line on the 'mediatheque_project.sql'
+    logger, at WARNING level when a query shape repeats often enough to be
+    an N+1.
+
+    Only the queries run before the response is returned are seen, so the
+    body of streaming responses is not accounted for. Works in sync and async
+    middleware chains.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        options = {**DEFAULT_SQL_INSTRUMENTATION, **getattr(settings, 'SQL_INSTRUMENTATION', {})}
+        self.sample_rate = options['SAMPLE_RATE']
+        self.slowest = options['SLOWEST']
+        self.threshold = options['N_PLUS_ONE_THRESHOLD']
+        self.server_timing = options['SERVER_TIMING']
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def record(self, stack):
+        recorder = QueryRecorder(self.slowest)
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return recorder
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            recorder = self.record(stack)
+            response = self.get_response(request)
+        return self.report(request, response, recorder, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        # Connections may only be used by the thread that opened them, which
+        # is the thread the async ORM runs its queries in, not this one
+        start = time.perf_counter()
+        stack = ExitStack()
+        recorder = await sync_to_async(self.record)(stack)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.report(request, response, recorder, time.perf_counter() - start)
+
+    def report(self, request, response, recorder, total):
+        repeated = recorder.repeated_shapes(self.threshold)
+        if self.server_timing:
+            timing = (f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries", '
+                      f'app;dur={total * 1000:.1f}')
+            if response.has_header('Server-Timing'):
+                timing = f"{response['Server-Timing']}, {timing}"
+            response['Server-Timing'] = timing
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_ms': round(recorder.duration * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+            'slowest': [
+                {'ms': round(duration * 1000, 2), 'sql': sql[:MAX_SQL_LENGTH]}
+                for duration, _, sql in sorted(recorder.slowest, reverse=True)
+            ],
+        }
+        if repeated:
+            record['n_plus_one'] = [{'count': count, 'sql': shape[:MAX_SQL_LENGTH]} for shape, count in repeated]
+        logger.log(logging.WARNING if repeated else logging.INFO, json.dumps(record))
+        return response
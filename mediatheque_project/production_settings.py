@@ -0,0 +1,70 @@
+"""
+Production profile: run with DJANGO_SETTINGS_MODULE=mediatheque_project.production_settings.
+
+DJANGO_SECRET_KEY and DJANGO_ALLOWED_HOSTS (comma-separated) must be set.
+DJANGO_DB_PATH moves the database away from the source tree, and
+DJANGO_REPLICA_DB_PATH enables the read replica (see settings.py).
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES, SQL_INSTRUMENTATION, TEMPLATES
+
+DEBUG = False
+
+try:
+    SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+except KeyError:
+    raise ImproperlyConfigured("DJANGO_SECRET_KEY must be set in production.")
+
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
+
+# Keep connections open between requests rather than reopening the file and
+# rerunning the PRAGMAs each time. Under ASGI (see asgi.py), set
+# DJANGO_CONN_MAX_AGE=0.
+CONNECTION_REUSE = {
+    'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', '600')),
+    'CONN_HEALTH_CHECKS': True,
+}
+
+DATABASES = {
+    alias: {**database, **CONNECTION_REUSE}
+    for alias, database in DATABASES.items()
+}
+DATABASES['default']['NAME'] = os.environ.get('DJANGO_DB_PATH', BASE_DIR / 'db.sqlite3')
+
+SQLITE_PRAGMAS = {
+    # Readers no longer wait for writers, and writers only append to the log
+    'journal_mode': 'wal',
+    # In WAL mode, only a power loss can lose the last commits, never corrupt
+    # the database
+    'synchronous': 'normal',
+    # Read the database through a 256 MiB memory map and a 64 MiB page cache
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    # Wait up to 5 s for a lock instead of failing with "database is locked"
+    'busy_timeout': 5000,
+    'temp_store': 'memory',
+}
+
+# Templates are compiled once per process
+TEMPLATES = [{
+    **TEMPLATES[0],
+    'APP_DIRS': False,
+    'OPTIONS': {
+        **TEMPLATES[0]['OPTIONS'],
+        'loaders': [
+            ('django.template.loaders.cached.Loader', [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ]),
+        ],
+    },
+}]
+
+SQL_INSTRUMENTATION = {
+    **SQL_INSTRUMENTATION,
+    'SAMPLE_RATE': float(os.environ.get('DJANGO_SQL_SAMPLE_RATE', '0.01')),
+}
@@ -40,6 +40,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mediatheque_project.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,6 +80,23 @@ DATABASES = {
     }
 }
 
+# Catalogue pages, search, exports and reports read from a copy of the
+# database when DJANGO_REPLICA_DB_PATH names a second SQLite file, leaving the
+# primary to circulation. See bibliothecaire/replica.py; the copy is refreshed
+# by `manage.py sync_replica`, or every REPLICA_SYNC_INTERVAL seconds.
+REPLICA_DB_PATH = os.environ.get('DJANGO_REPLICA_DB_PATH')
+if REPLICA_DB_PATH:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': REPLICA_DB_PATH,
+    }
+
+DATABASE_ROUTERS = ['bibliothecaire.replica.ReplicaRouter']
+
+# PRAGMAs run on every new SQLite connection, as {name: value}. SQLite's
+# defaults are kept here, see production_settings.py for the tuned profile.
+SQLITE_PRAGMAS = {}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -98,9 +116,39 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',
+    'bibliothecaire.auth.LibrarianModelBackend',
 ]
 
+# Set DJANGO_SESSION_ENGINE to 'django.contrib.sessions.backends.cached_db' to
+# serve sessions from the cache, falling back to the database on a miss, or to
+# 'django.contrib.sessions.backends.cache' with a cache shared by every worker.
+SESSION_ENGINE = os.environ.get('DJANGO_SESSION_ENGINE', 'django.contrib.sessions.backends.db')
+
+# Rendered pages and fragments of the public catalogue are cached for
+# CATALOGUE_CACHE_TIMEOUT seconds, under the catalogue version kept in the
+# database: a change to the catalogue or to the availability of an item, made
+# by any worker, invalidates them in every worker at once. The local-memory
+# cache is private to each worker process, so each one renders a page once;
+# set DJANGO_CATALOGUE_CACHE_DIR to share a file-based cache between the
+# workers of a machine.
+CATALOGUE_CACHE_DIR = os.environ.get('DJANGO_CATALOGUE_CACHE_DIR')
+CATALOGUE_CACHE_TIMEOUT = 60
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalogue': {
+        'BACKEND': ('django.core.cache.backends.filebased.FileBasedCache' if CATALOGUE_CACHE_DIR
+                    else 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': CATALOGUE_CACHE_DIR or 'catalogue',
+        'TIMEOUT': CATALOGUE_CACHE_TIMEOUT,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+}
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
@@ -122,6 +170,38 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Periodic jobs run by the web server processes, in seconds (None disables
+# them). Every worker process starts them, but each run is first claimed in
+# the ScheduledJob table, so only one process runs a job per interval, see
+# bibliothecaire/scheduler.py. They can also be run from cron with the
+# matching management commands instead.
+OVERDUE_SWEEP_INTERVAL = None
+RESERVATION_EXPIRY_INTERVAL = None
+REPLICA_SYNC_INTERVAL = None
+HISTORY_ARCHIVE_INTERVAL = None
+
+# Loans returned and reservations ended more than HISTORY_ARCHIVE_AFTER_DAYS
+# ago are moved to archive tables by `manage.py archive_history` (or every
+# HISTORY_ARCHIVE_INTERVAL seconds), HISTORY_ARCHIVE_BATCH_SIZE rows per
+# transaction. See bibliothecaire/archive.py.
+HISTORY_ARCHIVE_AFTER_DAYS = 365
+HISTORY_ARCHIVE_BATCH_SIZE = 1000
+
+# Per-request SQL instrumentation, see mediatheque_project/middleware.py. In
+# production, set DJANGO_SQL_SAMPLE_RATE to instrument only a share of the
+# requests (0.01 for 1%), or to 0 to remove the middleware.
+SQL_INSTRUMENTATION = {
+    'SAMPLE_RATE': float(os.environ.get('DJANGO_SQL_SAMPLE_RATE', '1')),
+    'SLOWEST': 3,
+    'N_PLUS_ONE_THRESHOLD': 10,
+    'SERVER_TIMING': True,
+}
+
+# Log records are queued by the 'queue' handler and written by a background
+# thread to the console and to a size-rotated JSON file, so request threads
+# never wait on log I/O. Set DJANGO_LOG_COMPRESS=1 to gzip rotated files.
+# configure_logging() connects the queue handler to the handlers it names.
+LOGGING_CONFIG = 'mediatheque_project.log_handlers.configure_logging'
 LOGGING = {
     'version': 1,  # The logging configuration version (required)
     'disable_existing_loggers': False,  # Retain the default Django loggers
@@ -135,6 +215,9 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'mediatheque_project.log_handlers.JsonFormatter',
+        },
     },
 
     'handlers': {  # Define where log messages should be sent
@@ -145,9 +228,20 @@ LOGGING = {
         },
         'file': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
+            'class': 'mediatheque_project.log_handlers.CompressedRotatingFileHandler',
             'filename': os.path.join(BASE_DIR, 'bibliothecaire.log'),
-            'formatter': 'verbose',
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'compress': os.environ.get('DJANGO_LOG_COMPRESS') == '1',
+            'encoding': 'utf-8',
+            'formatter': 'json',
+        },
+        'queue': {
+            # A factory rather than a class, so Python 3.12+ does not apply its
+            # own QueueHandler set-up to it
+            '()': 'mediatheque_project.log_handlers.NonBlockingQueueHandler',
+            'handlers': ['file', 'console'],
+            'maxsize': 10000,
         },
     },
 
@@ -158,8 +252,13 @@ LOGGING = {
             'propagate': True,
         },
         'bibliothecaire': {
-            'handlers': ['file', 'console'],
-            'level': 'DEBUG',
+            'handlers': ['queue'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'mediatheque_project': {
+            'handlers': ['queue'],
+            'level': 'INFO',
             'propagate': False,
         },
     },
@@ -1,9 +1,11 @@
+import json
 import pytest
 import os
 import django
 from django.contrib.auth.models import User, Group
+from django.http import HttpResponse
 from django.urls import reverse
-from django.test import Client
+from django.test import Client, RequestFactory, override_settings
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mediatheque_project.settings')
 django.setup()
@@ -79,3 +81,182 @@ class TestCustomLogoutView:
         assert response.status_code == 302
         assert response.url == reverse('main_home')
         assert '_auth_user_id' not in self.client.session  # Ensure user is logged out
+
+
+@pytest.mark.django_db
+class TestQueryInstrumentationMiddleware:
+
+    def test_server_timing_header_and_log_line(self, client, caplog):
+        with caplog.at_level('INFO', logger='mediatheque_project.sql'):
+            response = client.get(reverse('login'))
+        assert response['Server-Timing'].startswith('db;dur=')
+        assert 'app;dur=' in response['Server-Timing']
+
+        record = json.loads(caplog.records[-1].getMessage())
+        assert record['path'] == reverse('login')
+        assert record['status'] == 200
+        assert record['queries'] == len(record['slowest']) == 0
+
+    def test_repeated_query_shapes_are_reported(self, caplog):
+        from bibliothecaire.models import Livre, Membre, Emprunt
+        from mediatheque_project.middleware import QueryInstrumentationMiddleware
+
+        member = Membre.objects.create(name='Membre', email='membre@example.com')
+        for i in range(3):
+            media = Livre.objects.create(title=f'Livre {i}', author='Auteur', publication_date='2024-01-01')
+            Emprunt.objects.create(member=member, media=media)
+
+        def view(request):
+            # One query per loan to fetch its media
+            titles = [loan.media.title for loan in Emprunt.objects.order_by('pk')]
+            return HttpResponse(', '.join(titles))
+
+        middleware = QueryInstrumentationMiddleware(view)
+        middleware.threshold = 3
+        with caplog.at_level('INFO', logger='mediatheque_project.sql'):
+            response = middleware(RequestFactory().get('/'))
+
+        assert 'desc="4 queries"' in response['Server-Timing']
+        log = caplog.records[-1]
+        assert log.levelname == 'WARNING'
+        record = json.loads(log.getMessage())
+        assert record['queries'] == 4
+        assert len(record['slowest']) == 3
+        assert record['n_plus_one'][0]['count'] == 3
+        assert 'bibliothecaire_media' in record['n_plus_one'][0]['sql']
+
+    def test_unsampled_requests_are_not_instrumented(self):
+        with override_settings(SQL_INSTRUMENTATION={'SAMPLE_RATE': 0}):
+            response = Client().get(reverse('login'))
+        assert not response.has_header('Server-Timing')
+
+    def test_sql_shape_ignores_in_list_length_and_limits(self):
+        from mediatheque_project.middleware import sql_shape
+
+        assert (sql_shape('SELECT * FROM t WHERE id IN (%s, %s) LIMIT 21')
+                == sql_shape('SELECT * FROM t WHERE id IN (%s) LIMIT 1'))
+
+
+class TestLoggingPipeline:
+
+    def test_queued_records_are_written_as_json(self, tmp_path):
+        import logging
+        from mediatheque_project.log_handlers import configure_logging
+        path = tmp_path / 'app.log'
+        # The handler written to sorts after the queue handler
+        configure_logging({
+            'version': 1,
+            'disable_existing_loggers': False,
+            'formatters': {'json': {'()': 'mediatheque_project.log_handlers.JsonFormatter'}},
+            'handlers': {
+                'queue': {'()': 'mediatheque_project.log_handlers.NonBlockingQueueHandler',
+                          'handlers': ['zfile']},
+                'zfile': {'class': 'mediatheque_project.log_handlers.CompressedRotatingFileHandler',
+                          'filename': str(path), 'formatter': 'json'},
+            },
+            'loggers': {'test_pipeline': {'handlers': ['queue'], 'level': 'INFO', 'propagate': False}},
+        })
+        logger = logging.getLogger('test_pipeline')
+        queue_handler = logger.handlers[0]
+        try:
+            logger.debug("Not written %s", 'debug')
+            logger.info("User %s returned loan %s.", 'alice', 12,
+                        extra={'user': 'alice', 'action': 'return_loan', 'object_id': 12})
+            queue_handler.flush()
+            records = [json.loads(line) for line in path.read_text().splitlines()]
+        finally:
+            queue_handler.stop()
+            queue_handler.handlers[0].close()
+
+        assert len(records) == 1
+        assert records[0]['message'] == "User alice returned loan 12."
+        assert (records[0]['user'], records[0]['action'], records[0]['object_id']) == ('alice', 'return_loan', 12)
+
+    def test_unknown_handler_names_are_an_error(self):
+        from mediatheque_project.log_handlers import configure_logging
+        with pytest.raises(ValueError, match="'missing'"):
+            configure_logging({
+                'version': 1,
+                'disable_existing_loggers': False,
+                'handlers': {'queue': {'()': 'mediatheque_project.log_handlers.NonBlockingQueueHandler',
+                                       'handlers': ['missing']}},
+            })
+
+    def test_records_are_dropped_instead_of_blocking(self):
+        import logging
+        import threading
+        from mediatheque_project.log_handlers import NonBlockingQueueHandler
+
+        release = threading.Event()
+        written = []
+
+        class SlowHandler(logging.Handler):
+            def emit(self, record):
+                release.wait()
+                written.append(record.getMessage())
+
+        handler = NonBlockingQueueHandler([SlowHandler()], maxsize=2)
+        logger = logging.Logger('test_dropped')
+        logger.addHandler(handler)
+        try:
+            for i in range(10):
+                logger.warning("Record %d", i)
+            assert handler.dropped > 0
+            release.set()
+            handler.flush()
+            logger.warning("After")
+            handler.flush()
+        finally:
+            handler.stop()
+
+        assert 'After' in written
+        assert any('log records were dropped' in message for message in written)
+        assert len(written) < 12
+
+    def test_rotated_files_are_compressed(self, tmp_path):
+        import gzip
+        import logging
+        from mediatheque_project.log_handlers import CompressedRotatingFileHandler
+
+        handler = CompressedRotatingFileHandler(str(tmp_path / 'app.log'), compress=True, maxBytes=100,
+                                                backupCount=2)
+        logger = logging.Logger('test_rotation')
+        logger.addHandler(handler)
+        for i in range(10):
+            logger.warning("Message number %d with some padding", i)
+        handler.close()
+
+        with gzip.open(tmp_path / 'app.log.1.gz', 'rt') as rotated:
+            assert 'Message number' in rotated.read()
+        assert not (tmp_path / 'app.log.3.gz').exists()
+
+
+class TestProductionSettings:
+
+    def load(self, monkeypatch, **environ):
+        import importlib
+        import sys
+        for name, value in environ.items():
+            monkeypatch.setenv(name, value)
+        sys.modules.pop('mediatheque_project.production_settings', None)
+        return importlib.import_module('mediatheque_project.production_settings')
+
+    def test_production_profile(self, monkeypatch):
+        from django.conf import settings
+
+        production = self.load(monkeypatch, DJANGO_SECRET_KEY='secret', DJANGO_ALLOWED_HOSTS='a.example,b.example')
+        assert production.DEBUG is False
+        assert production.ALLOWED_HOSTS == ['a.example', 'b.example']
+        assert production.DATABASES['default']['CONN_MAX_AGE'] == 600
+        assert production.SQLITE_PRAGMAS['journal_mode'] == 'wal'
+        assert production.TEMPLATES[0]['OPTIONS']['loaders'][0][0] == 'django.template.loaders.cached.Loader'
+        # The development settings are left untouched
+        assert settings.TEMPLATES[0]['APP_DIRS'] is True
+        assert settings.SQLITE_PRAGMAS == {}
+
+    def test_secret_key_is_required(self, monkeypatch):
+        from django.core.exceptions import ImproperlyConfigured
+
+        monkeypatch.delenv('DJANGO_SECRET_KEY', raising=False)
+        with pytest.raises(ImproperlyConfigured):
+            self.load(monkeypatch)
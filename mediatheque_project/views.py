@@ -2,6 +2,7 @@ from django.contrib.auth import logout
 from django.contrib.auth.views import LoginView
 from django.shortcuts import redirect, render
 from django.urls import reverse_lazy
+from bibliothecaire.auth import is_bibliothecaire
 
 
 class CustomLoginView(LoginView):
@@ -24,7 +25,7 @@ class CustomLoginView(LoginView):
     def get_success_url(self):
         user = self.request.user
 
-        if user.groups.filter(name='bibliothecaires').exists():
+        if is_bibliothecaire(user):
             return reverse_lazy('home')
         else:
             return reverse_lazy('membre_list_media')
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mediatheque_project.settings')
 
 application = get_wsgi_application()
+
+# Periodic jobs (overdue sweep, ...) only run in server processes
+from bibliothecaire.scheduler import start_scheduled_jobs  # noqa: E402
+
+start_scheduled_jobs()
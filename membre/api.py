@@ -0,0 +1,105 @@
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from bibliothecaire.catalogue import MEDIA_TYPES, InvalidCursor, PAGE_SIZE, acatalogue_item, acatalogue_page
+from bibliothecaire.conditional import conditional_page, catalogue_validators
+from bibliothecaire.replica import replica_reads
+
+# Fields a client can select with `fields=`, in the order they are output.
+# Each item only carries the fields of its type.
+FIELDS = ['type', 'id', 'title', 'author', 'createur', 'artiste', 'duration', 'available']
+
+MAX_PAGE_SIZE = 200
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False})
+
+
+def requested_fields(request):
+    value = request.GET.get('fields')
+    if not value:
+        return FIELDS
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown:
+        raise BadRequest(f"Champs inconnus : {', '.join(unknown)}. Champs possibles : {', '.join(FIELDS)}.")
+    return fields
+
+
+def requested_page_size(request):
+    value = request.GET.get('limit')
+    if not value:
+        return PAGE_SIZE
+    try:
+        page_size = int(value)
+    except ValueError:
+        raise BadRequest("'limit' doit être un entier.")
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise BadRequest(f"'limit' doit être compris entre 1 et {MAX_PAGE_SIZE}.")
+    return page_size
+
+
+def serialize(row, fields):
+    # Items come from the catalogue, only the type needs renaming
+    row['type'] = row.pop('kind')
+    return {field: row[field] for field in fields if field in row}
+
+
+@require_GET
+@replica_reads
+@conditional_page(catalogue_validators)
+async def catalogue(request):
+    """
+    One page of the catalogue as JSON, across every media type. Accepts the
+    `type`, `available` (0 or 1), `author`, `cursor`, `limit` and `fields`
+    query parameters, and returns the items with the cursor of the next page.
+    """
+    try:
+        fields = requested_fields(request)
+        page_size = requested_page_size(request)
+
+        media_type = request.GET.get('type') or None
+        if media_type is not None and media_type not in MEDIA_TYPES:
+            raise BadRequest(f"Type inconnu : {media_type}.")
+
+        available = request.GET.get('available', '')
+        if available not in ('', '0', '1'):
+            raise BadRequest("'available' doit valoir 0 ou 1.")
+
+        try:
+            items, next_cursor = await acatalogue_page(media_type, available == '1' if available else None,
+                                                      request.GET.get('cursor') or None, page_size,
+                                                      request.GET.get('author') or None, fields)
+        except InvalidCursor:
+            raise BadRequest("Curseur invalide.")
+    except BadRequest as error:
+        return json_response({'error': str(error)}, status=400)
+
+    return json_response({
+        'items': [serialize(row, fields) for row in items],
+        'next_cursor': next_cursor,
+    })
+
+
+@require_GET
+@replica_reads
+@conditional_page(catalogue_validators)
+async def catalogue_item(request, media_type, pk):
+    """
+    One catalogue item as JSON, with the same `fields` selection as the list.
+    """
+    if media_type not in MEDIA_TYPES:
+        return json_response({'error': f"Type inconnu : {media_type}."}, status=404)
+    try:
+        fields = requested_fields(request)
+    except BadRequest as error:
+        return json_response({'error': str(error)}, status=400)
+
+    item = await acatalogue_item(media_type, pk, fields)
+    if item is None:
+        return json_response({'error': "Élément introuvable."}, status=404)
+    return json_response(serialize(item, fields))
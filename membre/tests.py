@@ -1,3 +1,194 @@
-from django.test import TestCase
+import pytest
+from django.urls import reverse
+from bibliothecaire.models import Livre, JeuDePlateau
 
-# Create your tests here.
+
+@pytest.mark.django_db
+def test_list_media_shows_only_available_items(client):
+    Livre.objects.create(title='Livre disponible', author='Auteur', publication_date='2024-01-01')
+    Livre.objects.create(title='Livre emprunté', author='Auteur', publication_date='2024-01-01', available=False)
+    JeuDePlateau.objects.create(title='Jeu disponible', createur='Createur')
+
+    response = client.get(reverse('membre_list_media'))
+    assert response.status_code == 200
+    assert [item['title'] for item in response.context['items']] == ['Jeu disponible', 'Livre disponible']
+
+    response = client.get(reverse('membre_list_media'), {'type': 'jeu', 'available': '0'})
+    assert [item['title'] for item in response.context['items']] == ['Jeu disponible']
+
+
+@pytest.mark.django_db
+def test_search_shows_only_available_items(client):
+    Livre.objects.create(title='Les Misérables', author='Hugo', publication_date='1862-01-01')
+    Livre.objects.create(title='Les Contemplations', author='Hugo', publication_date='1856-01-01', available=False)
+
+    response = client.get(reverse('membre_search'), {'q': 'hugo'})
+    assert response.status_code == 200
+    assert [item['title'] for item in response.context['items']] == ['Les Misérables']
+
+    response = client.get(reverse('membre_search'), {'q': 'miserables'})
+    assert [item['title'] for item in response.context['items']] == ['Les Misérables']
+
+
+def page_titles(response):
+    return [line.strip() for line in response.content.decode().splitlines() if line.strip().startswith('Livre:')]
+
+
+@pytest.mark.django_db
+def test_list_media_is_cached_until_the_catalogue_changes(client, django_assert_num_queries):
+    from bibliothecaire import circulation
+    from bibliothecaire.models import Membre, Emprunt
+
+    livre = Livre.objects.create(title='Germinal', author='Zola', publication_date='1885-01-01')
+    assert page_titles(client.get(reverse('membre_list_media'))) == ['Livre: Germinal par Zola']
+
+    # Only the three queries of the ETag validators are left
+    with django_assert_num_queries(3):
+        assert page_titles(client.get(reverse('membre_list_media'))) == ['Livre: Germinal par Zola']
+
+    # Saving a media invalidates the cached page
+    Livre.objects.create(title='Nana', author='Zola', publication_date='1880-01-01')
+    assert len(page_titles(client.get(reverse('membre_list_media')))) == 2
+
+    # So do loans and returns, which change availability with update()
+    member = Membre.objects.create(name='Membre', email='membre@example.com')
+    circulation.check_out(Emprunt(member=member, media=livre))
+    assert page_titles(client.get(reverse('membre_list_media'))) == ['Livre: Nana par Zola']
+
+    circulation.check_in(Emprunt.objects.get(media=livre))
+    assert len(page_titles(client.get(reverse('membre_list_media')))) == 2
+
+
+@pytest.mark.django_db
+def test_search_results_are_cached_as_a_fragment(client, django_assert_num_queries):
+    Livre.objects.create(title='Les Misérables', author='Hugo', publication_date='1862-01-01')
+    response = client.get(reverse('membre_search'), {'q': 'hugo'})
+    assert 'Les Misérables' in response.content.decode()
+
+    with django_assert_num_queries(3):
+        response = client.get(reverse('membre_search'), {'q': 'hugo'})
+    assert 'Les Misérables' in response.content.decode()
+
+    Livre.objects.create(title='Notre-Dame de Paris', author='Hugo', publication_date='1831-01-01')
+    assert 'Notre-Dame de Paris' in client.get(reverse('membre_search'), {'q': 'hugo'}).content.decode()
+
+
+@pytest.mark.django_db
+def test_list_media_answers_not_modified(client, django_assert_num_queries):
+    livre = Livre.objects.create(title='Germinal', author='Zola', publication_date='1885-01-01')
+    etag = client.get(reverse('membre_list_media'))['ETag']
+
+    # The page cache is not even read
+    with django_assert_num_queries(3):
+        assert client.get(reverse('membre_list_media'), HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    Livre.objects.filter(pk=livre.pk).update(available=False)
+    response = client.get(reverse('membre_list_media'), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+
+@pytest.mark.django_db
+def test_list_media_is_modified_by_a_deletion(client):
+    from datetime import timedelta
+    from unittest.mock import patch
+    from django.utils import timezone
+
+    livre = Livre.objects.create(title='Germinal', author='Zola', publication_date='1885-01-01')
+    last_modified = client.get(reverse('membre_list_media'))['Last-Modified']
+    assert client.get(reverse('membre_list_media'), HTTP_IF_MODIFIED_SINCE=last_modified).status_code == 304
+
+    # Deleting moves no updated_at column, the bump of the version does
+    with patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(seconds=5)):
+        livre.delete()
+    response = client.get(reverse('membre_list_media'), HTTP_IF_MODIFIED_SINCE=last_modified)
+    assert response.status_code == 200
+    assert 'Germinal' not in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_catalogue_changes_reach_every_worker(client):
+    from unittest.mock import patch
+    from django.core.cache.backends.locmem import LocMemCache
+
+    # Two worker processes, each with its own local-memory cache
+    caches = {worker: LocMemCache(f'worker-{worker}', {}) for worker in ('a', 'b')}
+    livre = Livre.objects.create(title='Germinal', author='Zola', publication_date='1885-01-01')
+    with patch('bibliothecaire.catalogue_cache.catalogue_cache', lambda: caches['b']):
+        etag = client.get(reverse('membre_list_media'))['ETag']
+    with patch('bibliothecaire.catalogue_cache.catalogue_cache', lambda: caches['a']):
+        livre.delete()
+    with patch('bibliothecaire.catalogue_cache.catalogue_cache', lambda: caches['b']):
+        response = client.get(reverse('membre_list_media'), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert 'Germinal' not in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_api_catalogue_pages_through_every_type(client, django_assert_max_num_queries):
+    from datetime import timedelta
+    from bibliothecaire.models import Cd, Dvd
+
+    Livre.objects.create(title='Germinal', author='Zola', publication_date='1885-01-01')
+    Dvd.objects.create(title='Amélie', author='Jeunet', publication_date='2001-01-01',
+                       duration=timedelta(minutes=122))
+    Cd.objects.create(title='Boléro', author='Ravel', publication_date='1928-01-01', artiste='Orchestre')
+    JeuDePlateau.objects.create(title='Carcassonne', createur='Wrede', available=False)
+
+    with django_assert_max_num_queries(6):
+        response = client.get(reverse('membre_api_catalogue'), {'limit': 2})
+    assert response['Content-Type'] == 'application/json'
+    data = response.json()
+    assert data['items'] == [
+        {'type': 'dvd', 'id': data['items'][0]['id'], 'title': 'Amélie', 'author': 'Jeunet',
+         'duration': 'P0DT02H02M00S', 'available': True},
+        {'type': 'cd', 'id': data['items'][1]['id'], 'title': 'Boléro', 'author': 'Ravel', 'artiste': 'Orchestre',
+         'available': True},
+    ]
+    data = client.get(reverse('membre_api_catalogue'), {'limit': 2, 'cursor': data['next_cursor']}).json()
+    assert [item['title'] for item in data['items']] == ['Carcassonne', 'Germinal']
+    assert data['next_cursor'] is None
+
+
+@pytest.mark.django_db
+def test_api_catalogue_filters_and_fields(client):
+    livre = Livre.objects.create(title='Germinal', author='Zola', publication_date='1885-01-01')
+    Livre.objects.create(title='Nana', author='Zola', publication_date='1880-01-01', available=False)
+    Livre.objects.create(title='Les Misérables', author='Hugo', publication_date='1862-01-01')
+    JeuDePlateau.objects.create(title='Zola, le jeu', createur='Zola')
+
+    url = reverse('membre_api_catalogue')
+    data = client.get(url, {'author': 'Zola', 'available': '1', 'fields': 'title,type'}).json()
+    assert data['items'] == [{'type': 'livre', 'title': 'Germinal'}, {'type': 'jeu', 'title': 'Zola, le jeu'}]
+    data = client.get(url, {'author': 'Zola', 'type': 'livre', 'available': '0', 'fields': 'id'}).json()
+    assert len(data['items']) == 1
+
+    for params in ({'fields': 'title,secret'}, {'type': 'vinyle'}, {'available': 'oui'}, {'limit': '0'},
+                   {'cursor': 'invalide'}):
+        response = client.get(url, params)
+        assert response.status_code == 400
+        assert 'error' in response.json()
+
+    response = client.get(reverse('membre_api_catalogue_item', args=['livre', livre.pk]), {'fields': 'title'})
+    assert response.json() == {'title': 'Germinal'}
+    assert client.get(reverse('membre_api_catalogue_item', args=['dvd', livre.pk])).status_code == 404
+    assert client.get(reverse('membre_api_catalogue_item', args=['vinyle', livre.pk])).status_code == 404
+
+
+@pytest.mark.django_db
+def test_public_views_run_under_asgi(async_client):
+    from asgiref.sync import async_to_sync
+
+    livre = Livre.objects.create(title='Germinal', author='Zola', publication_date='1885-01-01')
+    get = async_to_sync(async_client.get)
+
+    response = get(reverse('membre_list_media'))
+    assert response.status_code == 200
+    assert 'Germinal' in response.content.decode()
+    # The query instrumentation middleware follows the queries of the async ORM
+    assert 'desc="4 queries"' in response['Server-Timing']
+    assert get(reverse('membre_list_media'), headers={'If-None-Match': response['ETag']}).status_code == 304
+
+    assert 'Germinal' in get(reverse('membre_search'), {'q': 'zola'}).content.decode()
+    assert get(reverse('membre_api_catalogue'), {'fields': 'title'}).json()['items'] == [{'title': 'Germinal'}]
+    assert get(reverse('membre_api_catalogue_item', args=['livre', livre.pk])).json()['author'] == 'Zola'
@@ -1,6 +1,9 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.list_media, name='membre_list_media'),
+    path('search/', views.search, name='membre_search'),
+    path('api/catalogue/', api.catalogue, name='membre_api_catalogue'),
+    path('api/catalogue/<str:media_type>/<int:pk>/', api.catalogue_item, name='membre_api_catalogue_item'),
 ]
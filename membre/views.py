@@ -1,17 +1,35 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
-from bibliothecaire.models import Livre, Dvd, Cd, JeuDePlateau
+from bibliothecaire.catalogue import acatalogue_page_from_request
+from bibliothecaire.catalogue_cache import cache_catalogue_page, catalogue_cache_context
+from bibliothecaire.conditional import conditional_page, catalogue_validators
+from bibliothecaire.replica import replica_reads
+from bibliothecaire.search import search_page_from_request
 
+# The public views are async, so that under ASGI a slow client only holds a
+# coroutine rather than a worker thread. See mediatheque_project/asgi.py.
 
-# List all media available to the public
-def list_media(request):
-    livres = Livre.objects.filter(available=True)
-    dvds = Dvd.objects.filter(available=True)
-    cds = Cd.objects.filter(available=True)
-    jeux = JeuDePlateau.objects.filter(available=True)
-    return render(request, 'list_media.html', {
-        'livres': livres,
-        'dvds': dvds,
-        'cds': cds,
-        'jeux': jeux
-    })
 
+# List all media available to the public, one page at a time. The rendered
+# page is cached until the catalogue changes, and clients holding the current
+# page get a 304. The page is fetched with the async ORM before rendering, so
+# a fragment cache would save no query. Read from the replica when there is
+# one.
+@replica_reads
+@conditional_page(catalogue_validators)
+@cache_catalogue_page
+async def list_media(request):
+    context = await acatalogue_page_from_request(request, available=True)
+    return render(request, 'list_media.html', context)
+
+
+# Search the media available to the public. The results are cached as a
+# fragment until the catalogue changes. The full-text search is raw SQL, which
+# has no async API, so the page is rendered in a thread and the search only
+# runs there when the fragment is not cached.
+@replica_reads
+@conditional_page(catalogue_validators)
+async def search(request):
+    context = search_page_from_request(request, available=True, lazy=True)
+    context.update(catalogue_cache_context(request))
+    return await sync_to_async(render)(request, 'search.html', context)